@@ -0,0 +1,42 @@
+import time
+import pytest
+from witmo.camera.fake_adb import FakeAdbServer
+from witmo.llm.engine import CompletionEngine
+from witmo.llm.mock_server import MockOpenAIServer
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    """Poll until predicate() is true; returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def adb_server():
+    with FakeAdbServer(num_photos=10, save_delay=0.05) as server:
+        yield server
+
+
+@pytest.fixture
+def mock_server():
+    with MockOpenAIServer(first_token_delay=0.05, token_delay=0.01) as server:
+        yield server
+
+
+@pytest.fixture
+def engine(mock_server):
+    engine = CompletionEngine(base_url=mock_server.base_url)
+    yield engine
+    engine.close()
+
+
+def jpeg_bytes(array) -> bytes:
+    import cv2
+
+    ok, buf = cv2.imencode(".jpg", array)
+    assert ok
+    return buf.tobytes()
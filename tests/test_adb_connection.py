@@ -0,0 +1,111 @@
+import threading
+import time
+import pytest
+from conftest import wait_until
+from witmo.camera.adb_camera import AdbCamera
+from witmo.camera.adb_connection import AdbConnection
+from witmo.camera.camera_protocol import CameraError
+from witmo.camera.fake_adb import FakeAdbServer
+
+BRIGHTNESS = "settings get system screen_brightness"
+
+
+def test_shell_survives_disconnect(adb_server):
+    connection = AdbConnection(port=adb_server.port, base_delay=0.05)
+    generation = connection.generation
+    adb_server.disconnect(duration=0.2)
+    assert connection.shell(BRIGHTNESS).strip() == "128"
+    assert connection.num_reconnects == 1
+    assert connection.generation > generation
+    assert connection.is_healthy()
+
+
+def test_gives_up_after_retries(adb_server):
+    connection = AdbConnection(
+        port=adb_server.port, max_retries=2, base_delay=0.01, max_delay=0.02
+    )
+    adb_server.disconnect()
+    with pytest.raises(CameraError):
+        connection.shell(BRIGHTNESS)
+    adb_server.reconnect()
+    assert connection.shell(BRIGHTNESS).strip() == "128"  # Reconnects on next use
+
+
+def test_concurrent_failures_reconnect_once(adb_server):
+    connection = AdbConnection(port=adb_server.port, base_delay=0.1)
+    adb_server.disconnect(duration=0.15)
+    results = []
+
+    def use():
+        results.append(connection.shell(BRIGHTNESS).strip())
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results == ["128"] * 4
+    assert connection.num_reconnects == 1
+
+
+def test_health_check_not_blocked_by_backoff(adb_server):
+    connection = AdbConnection(port=adb_server.port, base_delay=0.5)
+    adb_server.disconnect(duration=0.3)
+    worker = threading.Thread(target=lambda: connection.shell(BRIGHTNESS))
+    worker.start()
+    time.sleep(0.1)  # Now in the backoff sleep
+    start = time.perf_counter()
+    connection.is_healthy()
+    assert time.perf_counter() - start < 0.3
+    worker.join(timeout=10)
+
+
+def test_fails_over_to_second_device():
+    with FakeAdbServer(serial="second") as server:
+        connection = AdbConnection(port=server.port, serials=["first", "second"])
+        assert connection.serial == "second"
+
+
+def test_reconnect_listeners(adb_server):
+    connection = AdbConnection(port=adb_server.port, base_delay=0.05)
+    devices = []
+    connection.on_reconnect(devices.append)
+    adb_server.disconnect(duration=0.1)
+    connection.shell(BRIGHTNESS)
+    assert [d.serial for d in devices] == [adb_server.serial]
+
+
+def test_camera_restarts_watcher_after_reconnect(adb_server, tmp_path):
+    camera = AdbCamera(output_dir=str(tmp_path), adb_port=adb_server.port)
+    camera.connection.base_delay = 0.05
+    try:
+        assert wait_until(lambda: adb_server._watchers)
+        adb_server.disconnect(duration=0.1)
+        assert wait_until(lambda: not camera._watcher.alive)
+        camera.capture()  # Reconnects and restarts the watcher
+        assert camera.connection.num_reconnects == 1
+        assert wait_until(lambda: camera._watcher is not None and camera._watcher.alive)
+        assert camera._last_remote_image == adb_server._newest()
+    finally:
+        camera.close()
+
+
+def test_listener_command_fails_and_reconnects_again(adb_server):
+    connection = AdbConnection(port=adb_server.port, base_delay=0.05)
+    calls = []
+
+    def restore_state(device):
+        calls.append(device)
+        if len(calls) == 1:  # The device drops again right after the reconnect
+            adb_server.disconnect(duration=0.1)
+        connection.shell("settings put system screen_brightness 0")
+
+    connection.on_reconnect(restore_state)
+    adb_server.disconnect(duration=0.1)
+    worker = threading.Thread(target=lambda: connection.shell(BRIGHTNESS), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "deadlocked"
+    assert connection.num_reconnects == 2
+    assert len(calls) == 2
+    assert adb_server.brightness == 0
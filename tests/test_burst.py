@@ -0,0 +1,74 @@
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+from conftest import jpeg_bytes, wait_until
+from witmo.argparsing import parse
+from witmo.camera.burst import BurstCamera, pick_sharpest, sharpness_scores
+from witmo.image import BasicImage
+
+
+def noise(seed: int, size=(240, 320)) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 255, (*size, 3), np.uint8)
+
+
+def blurred(img: np.ndarray) -> np.ndarray:
+    return cv2.GaussianBlur(img, (15, 15), 5)
+
+
+def test_sharp_frame_scores_higher():
+    sharp = noise(0)
+    scores = sharpness_scores([blurred(sharp), sharp, blurred(noise(1))])
+    assert np.argmax(scores) == 1
+    assert pick_sharpest([blurred(sharp), sharp]) == 1
+
+
+def test_scores_comparable_across_sizes_and_grayscale():
+    big = noise(0, (960, 1280))
+    small_sharp = cv2.cvtColor(noise(1, (240, 320)), cv2.COLOR_BGR2GRAY)
+    assert pick_sharpest([blurred(big), small_sharp]) == 1
+
+
+class FakeCamera:
+    """Captures the given frames in turn, archived in the background like AdbCamera."""
+
+    def __init__(self, output_dir: str, frames: list[np.ndarray]):
+        self.output_dir = output_dir
+        self.frames = frames
+        self.num_captures = 0
+
+    def capture(self) -> BasicImage:
+        frame = self.frames[self.num_captures % len(self.frames)]
+        self.num_captures += 1
+        image = BasicImage.create_with_timestamp(self.output_dir, data=jpeg_bytes(frame))
+        image.save_in_background()
+        return image
+
+
+def test_burst_keeps_only_the_sharpest(tmp_path):
+    sharp = noise(0)
+    frames = [blurred(noise(1)), sharp, blurred(noise(2))]
+    camera = BurstCamera(FakeCamera(str(tmp_path), frames), burst_size=3)
+    image = camera.capture()
+    assert camera.camera.num_captures == 3
+    assert image.read_bytes() == jpeg_bytes(sharp)
+    assert wait_until(lambda: os.listdir(tmp_path) == [os.path.basename(image.path)])
+
+
+def test_burst_of_one_is_a_single_capture(tmp_path):
+    camera = BurstCamera(FakeCamera(str(tmp_path), [noise(0)]), burst_size=1)
+    camera.capture()
+    assert camera.camera.num_captures == 1
+
+
+def test_burst_size_validated(tmp_path, monkeypatch, capsys):
+    with pytest.raises(ValueError):
+        BurstCamera(FakeCamera(str(tmp_path), [noise(0)]), burst_size=0)
+    for value in ("0", "-2", "x"):
+        monkeypatch.setattr(sys, "argv", ["witmo.py", "-g", "Game", "--burst", value])
+        with pytest.raises(SystemExit):
+            parse()
+        assert "--burst" in capsys.readouterr().err
+    monkeypatch.setattr(sys, "argv", ["witmo.py", "-g", "Game", "--burst", "3"])
+    assert parse().burst_size == 3
@@ -0,0 +1,83 @@
+from conftest import wait_until
+from witmo.camera.adb_camera import AdbCamera
+from witmo.camera.adb_connection import AdbConnection
+from witmo.camera.capture_watcher import CaptureWatcher
+from witmo.camera.fake_adb import FakeAdbServer
+
+
+def start_watcher(server: FakeAdbServer) -> CaptureWatcher:
+    connection = AdbConnection(port=server.port)
+    watcher = CaptureWatcher(connection.device, server.CAMERA_DIR)
+    watcher.start()
+    assert wait_until(lambda: server._watchers), "inotifyd session not opened"
+    return watcher
+
+
+def test_reports_new_capture(adb_server):
+    watcher = start_watcher(adb_server)
+    try:
+        path = adb_server._add_photo()
+        assert watcher.wait_for_new(timeout=2) == path
+        assert watcher.wait_for_new(timeout=0.1) is None
+    finally:
+        watcher.stop()
+
+
+def test_ignores_pending_and_non_image_files(adb_server):
+    watcher = CaptureWatcher(None, adb_server.CAMERA_DIR)
+    watcher._handle_line(f"w\t{adb_server.CAMERA_DIR}\t.pending-1-PXL_1.jpg")
+    watcher._handle_line(f"w\t{adb_server.CAMERA_DIR}\tPXL_1.mp4")
+    watcher._handle_line(f"y\t{adb_server.CAMERA_DIR}/\tPXL_1.JPG")
+    assert watcher.wait_for_new(timeout=0.1) == f"{adb_server.CAMERA_DIR}/PXL_1.JPG"
+    assert watcher.wait_for_new(timeout=0.1) is None
+
+
+def test_clear_drops_pending_events(adb_server):
+    watcher = start_watcher(adb_server)
+    try:
+        adb_server._add_photo()
+        assert wait_until(lambda: not watcher._events.empty())
+        watcher.clear()
+        assert watcher.wait_for_new(timeout=0.1) is None
+    finally:
+        watcher.stop()
+
+
+def test_not_alive_without_inotifyd():
+    with FakeAdbServer(supports_inotify=False) as server:
+        connection = AdbConnection(port=server.port)
+        watcher = CaptureWatcher(connection.device, server.CAMERA_DIR)
+        watcher.start()
+        assert wait_until(lambda: not watcher.alive)
+
+
+def test_camera_captures_via_watcher(adb_server, tmp_path):
+    camera = AdbCamera(output_dir=str(tmp_path), adb_port=adb_server.port)
+    try:
+        assert wait_until(lambda: adb_server._watchers)
+        before = len(adb_server.files)
+        image = camera.capture()
+        newest = adb_server._newest()
+        assert len(adb_server.files) == before + 1
+        assert camera._last_remote_image == newest
+        assert camera._watcher is not None and camera._watcher.alive  # No fallback
+        assert image.path.startswith(str(tmp_path))
+    finally:
+        camera.close()
+
+
+def test_camera_falls_back_to_polling(tmp_path):
+    with FakeAdbServer(supports_inotify=False, save_delay=0.05) as server:
+        camera = AdbCamera(output_dir=str(tmp_path), adb_port=server.port)
+        try:
+            assert wait_until(lambda: not camera._watcher.alive)
+            camera.capture()
+            assert camera._last_remote_image == server._newest()
+        finally:
+            camera.close()
+
+
+def test_not_alive_after_disconnect(adb_server):
+    watcher = start_watcher(adb_server)
+    adb_server.disconnect()
+    assert wait_until(lambda: not watcher.alive)
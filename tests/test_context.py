@@ -0,0 +1,190 @@
+import os
+import numpy as np
+from conftest import jpeg_bytes
+from witmo.llm.context import (
+    DIGEST_HEADER,
+    ContextDigest,
+    ContextWindow,
+    build_context,
+    digest_file_name,
+    split_turns,
+)
+from witmo.llm.history import History
+from witmo.llm.image_store import BLOB_SCHEME, OMITTED_IMAGE_NOTE, BlobStore
+from witmo.llm.models import ContextBudget, ImageContextPolicy
+
+# 400 characters are 100 tokens, plus 4 per message, so 208 tokens per turn:
+TURN_TOKENS = 208
+
+
+def turn(i: int) -> list[dict]:
+    return [
+        {"role": "user", "content": f"question {i} ".ljust(400, "q")},
+        {"role": "assistant", "content": f"answer {i} ".ljust(400, "a")},
+    ]
+
+
+def turns(n: int) -> list[dict]:
+    return [m for i in range(n) for m in turn(i)]
+
+
+def questions(context: list[dict]) -> list[int]:
+    numbers = []
+    for message in context:
+        if message["role"] == "user":
+            content = message["content"]
+            text = content if isinstance(content, str) else content[0]["text"]
+            numbers.append(int(text.split()[1]))
+    return numbers
+
+
+def build(messages, budget, tmp_path, digest=None, **kwargs):
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    return build_context(
+        messages, budget, ImageContextPolicy(), blobs, digest, **kwargs
+    )
+
+
+def test_split_turns():
+    messages = [{"role": "assistant", "content": "Hi"}] + turns(2)
+    messages.append({"role": "assistant", "content": "And another thing"})
+    assert [len(t) for t in split_turns(messages)] == [1, 2, 3]
+
+
+def test_packs_whole_recent_turns_into_budget(tmp_path):
+    budget = ContextBudget(max_tokens=3 * TURN_TOKENS + 50, max_turns=10)
+    context = build(turns(10), budget, tmp_path)
+    assert questions(context) == [7, 8, 9]
+    assert context[0]["role"] == "user"  # No half turns
+
+
+def test_max_turns(tmp_path):
+    budget = ContextBudget(max_tokens=100_000, max_turns=4)
+    assert questions(build(turns(10), budget, tmp_path)) == [6, 7, 8, 9]
+
+
+def test_dropped_turns_go_into_the_digest(tmp_path):
+    budget = ContextBudget(max_tokens=3 * TURN_TOKENS + 200, digest_tokens=200)
+    digest = ContextDigest(str(tmp_path))
+    context = build(turns(10), budget, tmp_path, digest)
+    assert context[0]["role"] == "system"
+    assert context[0]["content"].startswith(DIGEST_HEADER)
+    assert "question 6" in context[0]["content"]  # The newest dropped turn
+    assert "question 0" not in context[0]["content"]  # Dropped to fit the digest
+    assert questions(context) == [7, 8, 9]
+    reloaded = ContextDigest(str(tmp_path))
+    assert reloaded.entries == digest.entries
+    assert reloaded.tokens() <= budget.digest_tokens
+
+
+def test_digest_does_not_repeat_turns_in_context(tmp_path):
+    digest = ContextDigest(str(tmp_path))
+    small = ContextBudget(max_tokens=2 * TURN_TOKENS + 400, digest_tokens=400)
+    build(turns(6), small, tmp_path, digest)
+    large = ContextBudget(max_tokens=100_000, digest_tokens=400)
+    context = build(turns(6), large, tmp_path, digest)
+    assert context[0]["role"] == "user"  # Everything fits, so no digest
+    assert questions(context) == [0, 1, 2, 3, 4, 5]
+
+
+def test_one_digest_file_per_budget(tmp_path):
+    assert digest_file_name(ContextBudget()) == "context_digest.json"
+    other = ContextBudget(max_tokens=1000)
+    assert digest_file_name(other) != digest_file_name(ContextBudget())
+    history = History(str(tmp_path))
+    history.extend(turns(20))
+    history.context(ContextBudget(max_tokens=1500, digest_tokens=300))
+    history.context(ContextBudget(max_tokens=2500, digest_tokens=300))
+    assert len(history.digests) == 2
+    assert len([f for f in os.listdir(tmp_path) if f.startswith("context_digest")]) == 2
+
+
+def image_turn(i: int, blobs: BlobStore) -> list[dict]:
+    url = BLOB_SCHEME + blobs.put(jpeg_bytes(np.full((64, 64, 3), i, np.uint8)))
+    question, answer = turn(i)
+    question = {
+        **question,
+        "content": [
+            {"type": "text", "text": question["content"]},
+            {"type": "image_url", "image_url": {"url": url}},
+        ],
+    }
+    return [question, answer]
+
+
+def image_kinds(context: list[dict]) -> list[str]:
+    """How each image was sent: full, thumbnail, or replaced by a note."""
+    kinds = []
+    for message in context:
+        if not isinstance(message["content"], list):
+            continue
+        for part in message["content"]:
+            if part["type"] == "image_url":
+                kinds.append("thumbnail" if part["image_url"].get("detail") else "full")
+            elif part["text"] == OMITTED_IMAGE_NOTE:
+                kinds.append("note")
+    return kinds
+
+
+def test_older_images_are_downgraded(tmp_path):
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    policy = ImageContextPolicy(full=1, thumbnails=1, thumbnail_side=32)
+    budget = ContextBudget(max_tokens=100_000)
+    messages = []
+    kinds = []
+    for i in range(3):
+        messages += image_turn(i, blobs)
+        context = build_context(messages, budget, policy, blobs)
+        kinds.append(image_kinds(context))
+    assert kinds == [["full"], ["thumbnail", "full"], ["note", "thumbnail", "full"]]
+
+
+def test_images_count_against_the_budget(tmp_path):
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    messages = [m for i in range(4) for m in image_turn(i, blobs)]
+    policy = ImageContextPolicy(full=4, thumbnails=0)
+    text_only = build_context(turns(4), ContextBudget(max_tokens=1000), policy, blobs)
+    with_images = build_context(messages, ContextBudget(max_tokens=1000), policy, blobs)
+    assert len(questions(with_images)) < len(questions(text_only))
+
+
+def test_window_keeps_the_prefix_until_repack(tmp_path):
+    budget = ContextBudget(max_tokens=5 * TURN_TOKENS, max_turns=10, refill=0.6)
+    window = ContextWindow()
+    contexts = [
+        build(turns(n), budget, tmp_path, window=window) for n in range(1, 10)
+    ]
+    assert [questions(c) for c in contexts] == [
+        [0], [0, 1], [0, 1, 2], [0, 1, 2, 3], [0, 1, 2, 3, 4],
+        [3, 4, 5], [3, 4, 5, 6], [3, 4, 5, 6, 7],
+        [6, 7, 8],
+    ]
+    for previous, context in zip(contexts, contexts[1:]):
+        if questions(context)[0] == questions(previous)[0]:
+            assert context[: len(previous)] == previous
+
+
+def test_window_keeps_the_digest_until_repack(tmp_path):
+    budget = ContextBudget(max_tokens=5 * TURN_TOKENS + 400, digest_tokens=400)
+    history = History(str(tmp_path))
+    history.extend(turns(6))  # The first build repacks
+    first = history.context(budget)
+    assert first[0]["role"] == "system"
+    history.extend(turn(6))
+    second = history.context(budget)
+    assert second[: len(first)] == first
+
+
+def test_window_keeps_how_images_were_sent(tmp_path):
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    policy = ImageContextPolicy(full=1, thumbnails=1, thumbnail_side=32)
+    budget = ContextBudget(max_tokens=100_000)
+    window = ContextWindow()
+    messages = []
+    kinds = []
+    for i in range(3):
+        messages += image_turn(i, blobs)
+        context = build_context(messages, budget, policy, blobs, window=window)
+        kinds.append(image_kinds(context))
+    # Without the window, older images would be downgraded (and the prefix changed):
+    assert kinds == [["full"], ["full", "full"], ["full", "full", "full"]]
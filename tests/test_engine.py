@@ -0,0 +1,146 @@
+import asyncio
+import time
+import pytest
+from conftest import wait_until
+from witmo.llm.engine import CompletionEngine
+from witmo.llm.history import History
+from witmo.llm.mock_server import MockOpenAIServer
+
+
+def questions(history: History) -> list[str]:
+    return [m["content"] for m in history.messages if m["role"] == "user"]
+
+
+def test_submit_returns_right_away(engine, mock_server):
+    start = time.perf_counter()
+    handle = engine.submit("Where now?", model="mock")
+    assert time.perf_counter() - start < mock_server.first_token_delay
+    assert handle.result(timeout=5) == "Mock answer from mock to: Where now?"
+    assert handle.state == "done"
+    assert handle.ttft is not None and handle.latency >= handle.ttft
+
+
+def test_chunks_stream_the_response(engine):
+    handle = engine.submit("one two three", model="mock")
+    chunks = [c for c in handle.chunks(heartbeat=None)]
+    assert len(chunks) > 1
+    assert "".join(chunks) == handle.text
+
+
+def test_requests_run_concurrently(engine, mock_server):
+    mock_server.first_token_delay = 0.3
+    start = time.perf_counter()
+    handles = [engine.submit(f"q{i}", model="mock") for i in range(4)]
+    for handle in handles:
+        assert handle.wait(timeout=5)
+    assert time.perf_counter() - start < 4 * 0.3
+    assert [h.state for h in handles] == ["done"] * 4
+
+
+def test_cancel_aborts_http_request(engine, mock_server):
+    mock_server.token_delay = 0.1
+    handle = engine.submit("a long question with many words", model="mock")
+    assert wait_until(lambda: handle.state == "streaming")
+    handle.cancel()
+    assert handle.wait(timeout=2)
+    assert handle.state == "cancelled"
+    assert wait_until(lambda: mock_server.num_aborted == 1)
+    with pytest.raises(asyncio.CancelledError):
+        handle.result()
+
+
+def test_cancel_before_first_token(engine, mock_server):
+    mock_server.first_token_delay = 0.5
+    handle = engine.submit("q", model="mock")
+    handle.cancel()
+    assert handle.wait(timeout=2)
+    assert handle.state == "cancelled"
+    assert handle.text == ""
+
+
+def test_history_recorded_in_submission_order(tmp_path):
+    delays = {"slow": 0.5, "fast": 0.05}
+    with MockOpenAIServer(token_delay=0.01, model_delays=delays) as server:
+        engine = CompletionEngine(base_url=server.base_url)
+        history = History(str(tmp_path))
+        try:
+            slow = engine.submit("first", history=history, model="slow")
+            fast = engine.submit("second", history=history, model="fast")
+            answer = "Mock answer from fast to: second"
+            assert wait_until(lambda: fast.text == answer)
+            time.sleep(0.1)
+            assert not slow.finished
+            assert not fast.finished  # Done once recorded, after the earlier request
+            assert len(history) == 0
+            assert fast.wait(timeout=5)
+            assert slow.state == "done"
+            assert len(history) == 4
+            assert questions(history) == ["first", "second"]
+        finally:
+            engine.close()
+
+
+def test_cancelled_request_not_recorded(engine, tmp_path):
+    history = History(str(tmp_path))
+    handles = [
+        engine.submit(f"q{i}", history=history, model="mock") for i in range(3)
+    ]
+    handles[1].cancel()
+    for handle in handles:
+        assert handle.wait(timeout=5)
+    assert [h.state for h in handles] == ["done", "cancelled", "done"]
+    assert wait_until(lambda: len(history) == 4)
+    assert questions(history) == ["q0", "q2"]
+
+
+def test_record_later_with_adopt(engine, tmp_path):
+    history = History(str(tmp_path))
+    handle = engine.submit("speculative", history=history, record=False, model="mock")
+    assert handle.wait(timeout=5)
+    assert len(history) == 0
+    engine.adopt(handle, history)
+    assert wait_until(lambda: len(history) == 2)
+    assert history.messages[-1]["content"] == handle.text
+
+
+def test_close_cancels_in_flight(mock_server):
+    mock_server.first_token_delay = 5
+    engine = CompletionEngine(base_url=mock_server.base_url)
+    handle = engine.submit("q", model="mock")
+    time.sleep(0.1)
+    engine.close()
+    assert handle.state == "cancelled"
+
+
+def test_cancel_while_waiting_to_record(tmp_path):
+    with MockOpenAIServer(token_delay=0.01, model_delays={"slow": 2.0}) as server:
+        engine = CompletionEngine(base_url=server.base_url)
+        history = History(str(tmp_path))
+        try:
+            slow = engine.submit("first", history=history, model="slow")
+            fast = engine.submit("second", history=history, model="mock")
+            # Complete, but waiting for the slow request before it's recorded:
+            assert wait_until(lambda: fast.latency is not None, timeout=1.8)
+            assert not slow.finished
+            fast.cancel()
+            assert fast.wait(timeout=0.5)
+            assert fast.state == "cancelled"
+            assert not slow.finished
+            assert slow.wait(timeout=5)
+            assert slow.state == "done"
+            assert questions(history) == ["first"]
+        finally:
+            engine.close()
+
+
+def test_prompt_cache_reports_shared_prefix(engine):
+    rules = "Answer in one sentence. " * 400  # ~2400 tokens
+    first = engine.submit("Where now?", model="mock", system_prompt=rules)
+    assert first.wait(timeout=5)
+    second = engine.submit("And then?", model="mock", system_prompt=rules)
+    other = engine.submit("And then?", model="mock", system_prompt="Be brief.")
+    assert second.wait(timeout=5) and other.wait(timeout=5)
+    assert first.usage.cached_tokens == 0
+    assert 1024 <= second.usage.cached_tokens <= second.usage.prompt_tokens
+    assert second.usage.cached_tokens % 128 == 0
+    assert other.usage.cached_tokens == 0
@@ -0,0 +1,72 @@
+import pytest
+from conftest import wait_until
+from witmo.llm.engine import CompletionEngine
+from witmo.llm.fanout import FanOut
+from witmo.llm.history import History
+from witmo.llm.mock_server import MockOpenAIServer
+from witmo.llm.models import Model
+
+DELAYS = {"a": 0.6, "b": 0.05, "c": 0.4}
+
+
+@pytest.fixture
+def server():
+    with MockOpenAIServer(token_delay=0.01, model_delays=DELAYS) as server:
+        yield server
+
+
+@pytest.fixture
+def engine(server):
+    engine = CompletionEngine(base_url=server.base_url)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def models():
+    return [Model(shortname=name, name=name, api_name=name) for name in DELAYS]
+
+
+def test_race_fastest_wins_and_losers_cancelled(engine, server, models, tmp_path):
+    history = History(str(tmp_path))
+    fanout = FanOut(engine, models, "race", "Who wins?", history=history)
+    text = "".join(fanout.chunks(heartbeat=None))
+    assert text == "Mock answer from b to: Who wins?"
+    assert fanout.winner is fanout.handles[1]
+    assert fanout.state == "done"
+    for handle in fanout.handles:
+        assert handle.wait(timeout=2)
+    assert [h.state for h in fanout.handles] == ["cancelled", "done", "cancelled"]
+    # The losers' requests had been sent, so cancelling aborts them on the server:
+    assert wait_until(lambda: server.num_aborted == 2)
+
+
+def test_race_records_only_the_winner(engine, models, tmp_path):
+    history = History(str(tmp_path))
+    fanout = FanOut(engine, models, "race", "Who wins?", history=history)
+    "".join(fanout.chunks(heartbeat=None))
+    assert len(history) == 0  # Fanned-out requests aren't recorded by the engine
+    fanout.choose(fanout.winner)
+    fanout.choose(fanout.handles[0])  # Only once
+    assert [m["content"] for m in history.messages] == ["Who wins?", fanout.text]
+
+
+def test_compare_all_answer(engine, models, tmp_path):
+    history = History(str(tmp_path))
+    fanout = FanOut(engine, models, "compare", "Compare", history=history)
+    for handle in fanout.handles:
+        assert handle.wait(timeout=5)
+    assert fanout.state == "done"
+    answers = {model.shortname: handle.text for model, handle in fanout.answers()}
+    assert answers == {name: f"Mock answer from {name} to: Compare" for name in DELAYS}
+    fanout.choose(fanout.handles[2])
+    assert history.messages[-1]["content"] == answers["c"]
+
+
+def test_cancel_cancels_all(engine, models):
+    fanout = FanOut(engine, models, "compare", "Never mind")
+    fanout.cancel()
+    for handle in fanout.handles:
+        assert handle.wait(timeout=2)
+    assert fanout.state == "failed"
+    assert [h.state for h in fanout.handles] == ["cancelled"] * 3
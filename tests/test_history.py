@@ -0,0 +1,131 @@
+import glob
+import json
+import os
+import shutil
+from witmo.llm.history import History, _read_tail_lines
+
+
+def turn(i: int) -> list[dict]:
+    return [
+        {"role": "user", "content": f"question {i}"},
+        {"role": "assistant", "content": f"answer {i}"},
+    ]
+
+
+def fill(history: History, turns: range) -> None:
+    for i in turns:
+        history.extend(turn(i))
+
+
+def all_messages(directory: str) -> list[str]:
+    """Contents of the segments and the log, in order, without the headers."""
+    contents = []
+    paths = sorted(glob.glob(os.path.join(directory, "chat_history.0*.jsonl")))
+    for path in paths + [os.path.join(directory, "chat_history.jsonl")]:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                msg = json.loads(line)
+                if "content" in msg:
+                    contents.append(msg["content"])
+    return contents
+
+
+def test_messages_survive_restart(tmp_path):
+    history = History(str(tmp_path))
+    fill(history, range(3))
+    history.save()
+    reloaded = History(str(tmp_path))
+    reloaded.load()
+    assert reloaded.messages == history.messages
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    history = History(str(tmp_path))
+    fill(history, range(2))
+    history.save()
+    with open(history.file_path, "ab") as f:
+        f.write(b'{"role": "user", "content": "quest')  # Crash while appending
+    reloaded = History(str(tmp_path))
+    reloaded.load()
+    assert len(reloaded) == 4
+    reloaded.extend(turn(2))
+    reloaded.save()
+    again = History(str(tmp_path))
+    again.load()
+    assert [m["content"] for m in again.messages][-2:] == ["question 2", "answer 2"]
+
+
+def test_loads_only_the_tail(tmp_path):
+    history = History(str(tmp_path))
+    fill(history, range(50))
+    history.save()
+    reloaded = History(str(tmp_path), tail=5)
+    reloaded.load()
+    assert [m["content"] for m in reloaded.messages] == [
+        "answer 47", "question 48", "answer 48", "question 49", "answer 49"
+    ]
+
+
+def test_read_tail_lines_across_blocks(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_bytes(b"".join(f"line {i}\n".encode() for i in range(100)))
+    assert _read_tail_lines(str(path), 3, block_size=7) == [
+        b"line 97", b"line 98", b"line 99"
+    ]
+    assert len(_read_tail_lines(str(path), 1000, block_size=16)) == 100
+
+
+def test_compaction_moves_old_messages_to_a_segment(tmp_path):
+    history = History(str(tmp_path), keep=4, max_log_bytes=200)
+    fill(history, range(10))
+    history.save()
+    reloaded = History(str(tmp_path), keep=4, max_log_bytes=200)
+    reloaded.load()  # Compacts
+    segment = tmp_path / "chat_history.000000.jsonl"
+    assert len(segment.read_text().splitlines()) == 16
+    with open(reloaded.file_path, encoding="utf-8") as f:
+        assert json.loads(f.readline()) == {"offset": 16}
+    assert len(reloaded) == 4
+    assert all_messages(str(tmp_path)) == [
+        m["content"] for i in range(10) for m in turn(i)
+    ]
+    # The next compaction starts a new segment:
+    fill(reloaded, range(10, 15))
+    reloaded.compact()
+    assert os.path.exists(tmp_path / "chat_history.000016.jsonl")
+    assert all_messages(str(tmp_path)) == [
+        m["content"] for i in range(15) for m in turn(i)
+    ]
+
+
+def test_interrupted_compaction_does_not_overlap(tmp_path):
+    history = History(str(tmp_path), keep=4)
+    fill(history, range(10))
+    history.save()
+    log_before = tmp_path / "log_before"
+    shutil.copy(history.file_path, log_before)
+    history.compact()
+    # Crash after writing the segment, before rewriting the log:
+    shutil.copy(log_before, history.file_path)
+    reloaded = History(str(tmp_path), keep=4)
+    reloaded.load()
+    fill(reloaded, range(10, 12))
+    reloaded.compact()
+    assert len(glob.glob(str(tmp_path / "chat_history.0*.jsonl"))) == 1
+    assert all_messages(str(tmp_path)) == [
+        m["content"] for i in range(12) for m in turn(i)
+    ]
+
+
+def test_imports_legacy_history(tmp_path):
+    legacy = tmp_path / "chat_history.json"
+    messages = turn(0) + [{"role": "user"}] + turn(1)  # One invalid message
+    legacy.write_text(json.dumps(messages), encoding="utf-8")
+    history = History(str(tmp_path))
+    history.load()
+    assert [m["content"] for m in history.messages] == [
+        "question 0", "answer 0", "question 1", "answer 1"
+    ]
+    assert not legacy.exists()
+    assert (tmp_path / "chat_history.json.imported").exists()
+
@@ -0,0 +1,169 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from conftest import jpeg_bytes, wait_until
+from witmo.image import ArtifactCache, BasicImage, CroppedImage, artifact_cache
+from witmo.screen_detection import ScreenRegion
+from witmo.startup_benchmark import LAZY_MODULES, measure_imports
+
+
+def photo(seed: int = 0, size=(480, 640)) -> bytes:
+    rng = np.random.default_rng(seed)
+    return jpeg_bytes(rng.integers(0, 255, (*size, 3), np.uint8))
+
+
+def test_in_memory_image_is_saved_in_background(tmp_path):
+    data = photo()
+    image = BasicImage(str(tmp_path / "cap.jpg"), data=data)
+    assert image.read_bytes() == data  # Before the archive copy exists
+    image.save_in_background()
+    image.wait_saved()
+    assert (tmp_path / "cap.jpg").read_bytes() == data
+
+
+def test_file_backed_image_is_not_rewritten(tmp_path):
+    path = tmp_path / "cap.jpg"
+    path.write_bytes(photo())
+    image = BasicImage(str(path))
+    image.save_in_background()  # Nothing in memory, nothing to write
+    image.wait_saved()
+    assert image.read_bytes() == path.read_bytes()
+
+
+def test_timestamps_unique_and_monotonic(tmp_path):
+    images = [BasicImage.create_with_timestamp(str(tmp_path)) for _ in range(200)]
+    names = [os.path.basename(image.path) for image in images]
+    assert len(set(names)) == len(names)
+    assert names == sorted(names)
+
+
+def test_discard_saved_deletes_archive_copy(tmp_path):
+    image = BasicImage(str(tmp_path / "cap.jpg"), data=photo())
+    image.save_in_background()
+    image.discard_saved()  # May run before the write has finished
+    image.wait_saved()
+    assert wait_until(lambda: not (tmp_path / "cap.jpg").exists())
+
+    existing = tmp_path / "existing.jpg"
+    existing.write_bytes(photo())
+    BasicImage(str(existing)).discard_saved()
+    assert existing.exists()  # Not saved by us, left alone
+
+
+def test_artifact_cache_evicts_least_recently_used():
+    cache = ArtifactCache(max_bytes=3000)
+    for i in range(3):
+        cache.get_or_create((i, "data"), lambda: b"x" * 1000)
+    cache.get_or_create((0, "data"), lambda: b"new")  # Hit, now most recently used
+    cache.get_or_create((3, "data"), lambda: b"x" * 1000)
+    assert cache.get_or_create((0, "data"), lambda: b"new") == b"x" * 1000
+    assert cache.get_or_create((1, "data"), lambda: b"new") == b"new"  # Evicted
+    assert cache.size <= cache.max_bytes
+    assert cache.stats()["hits"] == 2
+
+
+def test_artifact_cache_keeps_one_oversized_artifact():
+    cache = ArtifactCache(max_bytes=100)
+    cache.get_or_create((0, "array"), lambda: np.zeros(1000, np.uint8))
+    assert len(cache) == 1 and cache.size == 1000
+    cache.get_or_create((1, "array"), lambda: np.zeros(1000, np.uint8))
+    assert len(cache) == 1
+    cache.discard(1)
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_image_decoded_once_and_never_upscaled(tmp_path):
+    data = photo()
+    image = BasicImage(str(tmp_path / "cap.jpg"), data=data)
+    misses = artifact_cache.misses
+    assert image.array is image.array
+    assert artifact_cache.misses == misses + 1
+    assert image.resized(320).shape == (240, 320, 3)
+    assert image.resized(1280) is image.array
+    assert image.encode() is data  # The capture isn't re-encoded
+
+
+def test_rectified_crop_size(tmp_path, monkeypatch):
+    corners = ((100.0, 50.0), (500.0, 70.0), (510.0, 330.0), (90.0, 300.0))
+
+    class Detector:
+        def detect(self, img):
+            return ScreenRegion((90, 50, 420, 280), corners)
+
+    monkeypatch.setattr(CroppedImage, "detector", Detector())
+    cropped = CroppedImage(BasicImage(str(tmp_path / "cap.jpg"), data=photo()))
+    tl, tr, br, bl = np.array(corners)
+    width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+    height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+    assert cropped.array.shape == (round(height), round(width), 3)
+    assert cropped.crop_rect == (90, 50, 420, 280)
+
+
+def test_crop_without_corners_is_a_view(tmp_path, monkeypatch):
+    class Detector:
+        def detect(self, img):
+            return None  # No screen: the full image
+
+    monkeypatch.setattr(CroppedImage, "detector", Detector())
+    source = BasicImage(str(tmp_path / "cap.jpg"), data=photo())
+    cropped = CroppedImage(source)
+    assert cropped.crop_rect == (0, 0, 640, 480)
+    assert np.shares_memory(cropped.array, source.array)
+
+
+def test_heavy_dependencies_imported_on_first_use():
+    times = measure_imports()
+    assert "witmo.image" in times
+    assert [m for m in LAZY_MODULES if m in times] == []
+    code = "import sys, witmo.image as i; i.np.zeros(1); print('numpy' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    assert result.stdout.strip() == "True"
+
+
+def test_concurrent_get_or_create_calls_factory_once():
+    cache = ArtifactCache()
+    calls = []
+    started = threading.Event()
+
+    def factory():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)  # A slow decode
+        return b"decoded"
+
+    with ThreadPoolExecutor(8) as pool:
+        first = pool.submit(cache.get_or_create, (0, "array"), factory)
+        started.wait()
+        others = [
+            pool.submit(cache.get_or_create, (0, "array"), factory) for _ in range(7)
+        ]
+        results = [f.result() for f in [first, *others]]
+    assert results == [b"decoded"] * 8
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_concurrent_waiters_see_factory_error():
+    cache = ArtifactCache()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("corrupt JPEG")
+
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(cache.get_or_create, (0, "array"), failing)
+        started.wait()
+        waiter = pool.submit(cache.get_or_create, (0, "array"), failing)
+        for future in (first, waiter):
+            with pytest.raises(ValueError):
+                future.result()
+    assert cache.get_or_create((0, "array"), lambda: b"ok") == b"ok"  # Not cached
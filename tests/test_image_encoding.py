@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+import pytest
+from conftest import jpeg_bytes
+from witmo.image import BasicImage
+from witmo.llm.image_encoding import (
+    encode_for_model,
+    encode_image,
+    estimate_image_tokens,
+    target_size,
+)
+from witmo.llm.models import ImageBudget
+
+
+def capture(size=(3000, 4000), seed: int = 0) -> np.ndarray:
+    """A detailed (hard to compress) phone capture."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (*size, 3), np.uint8)
+
+
+def test_target_size_fits_budget_and_never_upscales():
+    budget = ImageBudget(max_long_side=2048, max_short_side=768)
+    assert target_size(4000, 3000, budget) == (1024, 768)
+    assert target_size(3000, 4000, budget) == (768, 1024)
+    assert target_size(4000, 1000, budget) == (2048, 512)
+    assert target_size(640, 480, budget) == (640, 480)
+
+
+@pytest.mark.parametrize("fmt", ["jpeg", "webp"])
+def test_encoded_within_byte_budget(fmt):
+    budget = ImageBudget(max_bytes=150_000, format=fmt)
+    encoded = encode_image(capture(), budget)
+    assert len(encoded.data) <= budget.max_bytes
+    assert (encoded.width, encoded.height) <= (1024, 768)
+    decoded = cv2.imdecode(np.frombuffer(encoded.data, np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape == (encoded.height, encoded.width, 3)
+    assert encoded.to_data_url().startswith(f"data:image/{fmt};base64,")
+
+
+def test_shrinks_further_when_lowest_quality_is_too_big():
+    budget = ImageBudget(max_bytes=30_000)
+    encoded = encode_image(capture(), budget)
+    assert len(encoded.data) <= budget.max_bytes
+    assert encoded.width < 1024
+    assert encoded.width / encoded.height == pytest.approx(4 / 3, abs=0.01)
+
+
+def test_small_image_not_upscaled():
+    encoded = encode_image(capture((300, 400)), ImageBudget())
+    assert (encoded.width, encoded.height) == (400, 300)
+
+
+def test_token_estimate():
+    assert estimate_image_tokens(4000, 3000) == 85 + 170 * 4  # Tiled as 1024x768
+    assert estimate_image_tokens(512, 512) == 85 + 170
+    assert estimate_image_tokens(200, 100) == 85 + 170
+
+
+def test_within_token_budget(tmp_path):
+    image = BasicImage(str(tmp_path / "cap.jpg"), data=jpeg_bytes(capture()))
+    budget = ImageBudget(max_long_side=1024, max_short_side=512)
+    encoded = encode_for_model(image, budget)
+    assert encode_for_model(image, budget) is encoded  # Memoized
+    assert (encoded.width, encoded.height) == (683, 512)
+    assert estimate_image_tokens(encoded.width, encoded.height) == 85 + 170 * 2
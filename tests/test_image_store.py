@@ -0,0 +1,111 @@
+import base64
+import glob
+import hashlib
+import json
+import cv2
+import numpy as np
+import pytest
+from conftest import jpeg_bytes
+from witmo.llm.history import History, import_legacy_history
+from witmo.llm.image_store import BLOB_SCHEME, OMITTED_IMAGE_NOTE, BlobStore
+from witmo.llm.models import ImageContextPolicy
+
+
+def photo(seed: int, size=(600, 800)) -> bytes:
+    rng = np.random.default_rng(seed)
+    return jpeg_bytes(rng.integers(0, 255, (*size, 3), np.uint8))
+
+
+def data_url(data: bytes) -> str:
+    return f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
+
+
+def image_message(url: str, text: str = "What now?") -> dict:
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": text},
+            {"type": "image_url", "image_url": {"url": url}},
+        ],
+    }
+
+
+def decode_url(url: str) -> np.ndarray:
+    data = base64.b64decode(url.split(",", 1)[1])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def test_put_is_content_addressed(blobs):
+    data = photo(0)
+    name = blobs.put(data)
+    assert name == hashlib.sha256(data).hexdigest() + ".jpg"
+    assert blobs.put(data) == name
+    assert blobs.get(name) == data
+    assert len(glob.glob(f"{blobs.directory}/*/*")) == 1
+
+
+def test_store_images_replaces_inline_images(blobs):
+    data = photo(0)
+    message = image_message(data_url(data))
+    stored = blobs.store_images(message)
+    url = stored["content"][1]["image_url"]["url"]
+    assert url == BLOB_SCHEME + blobs.put(data)
+    assert message["content"][1]["image_url"]["url"].startswith("data:")  # Unchanged
+    text_only = {"role": "assistant", "content": "Go left."}
+    assert blobs.store_images(text_only) is text_only
+
+
+def test_resolve_by_rank(blobs):
+    policy = ImageContextPolicy(full=1, thumbnails=1, thumbnail_side=128)
+    data = [photo(i) for i in range(3)]
+    messages = [image_message(BLOB_SCHEME + blobs.put(d)) for d in data]
+    resolved = blobs.resolve_images(messages, policy)
+    oldest, thumbnail, newest = (m["content"][1] for m in resolved)
+    assert oldest == {"type": "text", "text": OMITTED_IMAGE_NOTE}
+    assert thumbnail["image_url"]["detail"] == "low"
+    assert max(decode_url(thumbnail["image_url"]["url"]).shape[:2]) == 128
+    assert newest["image_url"]["url"] == data_url(data[2])  # As stored
+    assert messages[0]["content"][1]["image_url"]["url"].startswith(BLOB_SCHEME)
+
+
+def test_resolve_keeps_given_sides(blobs):
+    policy = ImageContextPolicy(full=1, thumbnails=0)
+    first = image_message(BLOB_SCHEME + blobs.put(photo(0)))
+    sides = {}
+    blobs.resolve_images([first], policy, sides)
+    second = image_message(BLOB_SCHEME + blobs.put(photo(1)))
+    resolved = blobs.resolve_images([first, second], policy, sides)
+    # The first image stays as it was sent (full), although it's not the newest anymore:
+    assert resolved[0]["content"][1]["type"] == "image_url"
+    assert resolved[1]["content"][1]["type"] == "image_url"
+    assert blobs.resolve_images([first, second], policy)[0]["content"][1]["type"] == "text"
+
+
+def test_missing_blob_becomes_a_note(blobs):
+    resolved = blobs.resolve_images([image_message(BLOB_SCHEME + "0" * 64 + ".jpg")])
+    assert resolved[0]["content"][1] == {"type": "text", "text": OMITTED_IMAGE_NOTE}
+
+
+def test_history_stores_images_as_blobs(tmp_path):
+    history = History(str(tmp_path))
+    history.append(image_message(data_url(photo(0))))
+    history.save()
+    log = open(history.file_path, encoding="utf-8").read()
+    assert "base64" not in log and BLOB_SCHEME in log
+    reloaded = History(str(tmp_path))
+    reloaded.load()
+    assert reloaded.messages == history.messages
+
+
+def test_legacy_import_moves_images_to_blobs(tmp_path):
+    history = History(str(tmp_path))
+    legacy = tmp_path / "chat_history.json"
+    legacy.write_text(json.dumps([image_message(data_url(photo(0)))]), encoding="utf-8")
+    assert import_legacy_history(str(legacy), history.file_path, history.blobs) == 1
+    assert "base64" not in open(history.file_path, encoding="utf-8").read()
+    assert len(glob.glob(str(tmp_path / "blobs" / "*" / "*"))) == 1
@@ -0,0 +1,45 @@
+from conftest import wait_until
+from witmo.camera.adb_connection import AdbConnection
+from witmo.camera.liveness import CameraLiveness
+
+
+def test_unknown_until_checked(adb_server):
+    liveness = CameraLiveness(AdbConnection(port=adb_server.port))
+    assert liveness.is_running() is None
+    assert liveness.check() is True
+    assert liveness.is_running() is True
+
+
+def test_detects_camera_app_closed(adb_server):
+    liveness = CameraLiveness(AdbConnection(port=adb_server.port))
+    adb_server.camera_running = False
+    assert liveness.check() is False
+    assert liveness.is_running() is False
+
+
+def test_background_refresh(adb_server):
+    liveness = CameraLiveness(AdbConnection(port=adb_server.port), ttl=0.1)
+    liveness.start()
+    try:
+        assert wait_until(lambda: liveness.is_running() is True)
+        adb_server.camera_running = False
+        assert wait_until(lambda: liveness.is_running() is False)
+        assert liveness.stats()["checks"] >= 2
+    finally:
+        liveness.stop()
+
+
+def test_cached_result_does_not_query_device(adb_server):
+    liveness = CameraLiveness(AdbConnection(port=adb_server.port))
+    liveness.check()
+    adb_server.camera_running = False
+    for _ in range(10):
+        assert liveness.is_running() is True
+    assert liveness.stats()["checks"] == 1
+
+
+def test_invalidate(adb_server):
+    liveness = CameraLiveness(AdbConnection(port=adb_server.port))
+    liveness.check()
+    liveness.invalidate()
+    assert liveness.is_running() is None
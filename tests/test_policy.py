@@ -0,0 +1,108 @@
+import time
+import openai
+import pytest
+from witmo.llm.models import RequestPolicy
+from witmo.llm.policy import LatencyStats, backoff_delay, is_retryable
+
+FAST = RequestPolicy(
+    first_token_timeout=0.5, stall_timeout=0.5, deadline=5.0, backoff_base=0.01
+)
+
+
+def run(engine, policy: RequestPolicy, model: str = "mock"):
+    handle = engine.submit("Policy?", model=model, policy=policy)
+    assert handle.wait(timeout=10)
+    return handle
+
+
+def test_retries_server_errors(engine, mock_server):
+    mock_server.inject(status=503, times=2)
+    handle = run(engine, FAST)
+    assert handle.state == "done"
+    assert len(mock_server.requests) == 3
+    assert engine.stats.retries == 2
+
+
+def test_gives_up_after_max_retries(engine, mock_server):
+    mock_server.inject(status=503, times=3)
+    handle = run(engine, FAST)
+    assert handle.state == "failed"
+    assert isinstance(handle.error, openai.InternalServerError)
+    assert engine.stats.retries == FAST.max_retries
+    assert engine.stats.failures == 1
+
+
+def test_client_errors_not_retried(engine, mock_server):
+    mock_server.inject(status=400)
+    handle = run(engine, FAST)
+    assert handle.state == "failed"
+    assert isinstance(handle.error, openai.BadRequestError)
+    assert len(mock_server.requests) == 1
+    assert engine.stats.retries == 0
+
+
+def test_late_first_token_retried(engine, mock_server):
+    mock_server.inject(delay=2.0)
+    handle = run(engine, FAST)
+    assert handle.state == "done"
+    assert engine.stats.timeouts == 1
+    assert engine.stats.retries == 1
+
+
+def test_stall_after_first_token_fails(engine, mock_server):
+    mock_server.inject(stall=2.0)
+    handle = run(engine, FAST)
+    assert handle.state == "failed"
+    assert isinstance(handle.error, TimeoutError)
+    assert "stalled" in str(handle.error)
+    assert handle.text  # The part before the stall
+
+
+def test_deadline(engine, mock_server):
+    policy = RequestPolicy(first_token_timeout=5.0, deadline=0.3)
+    mock_server.inject(delay=2.0)
+    start = time.perf_counter()
+    handle = run(engine, policy)
+    assert time.perf_counter() - start < 1.5
+    assert handle.state == "failed"
+    assert "No complete response" in str(handle.error)
+
+
+def test_hedged_request_wins(engine, mock_server):
+    policy = RequestPolicy(hedge=True, hedge_min_samples=3, hedge_min_delay=0.1)
+    for _ in range(3):  # Times to first token of the model
+        assert run(engine, policy, "hedged").state == "done"
+    assert engine.stats.hedges == 0
+    mock_server.inject(delay=3.0)
+    start = time.perf_counter()
+    handle = run(engine, policy, "hedged")
+    assert time.perf_counter() - start < 2.0
+    assert handle.state == "done"
+    assert handle.hedged
+    assert engine.stats.hedges == 1
+    assert engine.stats.hedge_wins == 1
+
+
+def test_no_hedging_without_samples():
+    stats = LatencyStats()
+    policy = RequestPolicy(hedge=True, hedge_min_samples=2, hedge_min_delay=0.1)
+    assert stats.hedge_delay("m", policy) is None
+    stats.add("m", 0.05)
+    stats.add("m", 0.5)
+    assert stats.hedge_delay("m", policy) == 0.5
+    assert stats.hedge_delay("m", RequestPolicy()) is None
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RequestPolicy(backoff_base=1.0, backoff_max=4.0)
+    delays = [backoff_delay(10, policy) for _ in range(100)]
+    assert all(0 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 1
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [(TimeoutError(), True), (ValueError(), False), (RuntimeError(), False)],
+)
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
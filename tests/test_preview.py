@@ -0,0 +1,98 @@
+import threading
+import numpy as np
+import pytest
+from conftest import wait_until
+from witmo.preview import HeadlessDisplay, PreviewWorker
+
+
+@pytest.fixture
+def display():
+    return HeadlessDisplay()
+
+
+@pytest.fixture
+def worker(display):
+    worker = PreviewWorker(display=display, poll_ms=10).start()
+    yield worker
+    worker.stop()
+
+
+def test_drops_stale_frames(worker, display):
+    started, release = threading.Event(), threading.Event()
+    frames = [np.full((30, 40, 3), i, np.uint8) for i in range(5)]
+    shown = []
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return frames[0]
+
+    def source(i):
+        def get():
+            shown.append(i)
+            return frames[i]
+
+        return get
+
+    worker.submit(blocking)
+    assert started.wait(5)
+    for i in range(1, 5):
+        worker.submit(source(i))
+    release.set()
+    assert worker.wait_idle(timeout=5)
+    assert shown == [4]  # Stale frames aren't even decoded
+    assert worker.num_shown == 2
+    assert worker.num_dropped == 3
+
+
+def test_keeps_newest_per_window(worker, display):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return np.zeros((10, 10, 3), np.uint8)
+
+    worker.submit(blocking)
+    assert started.wait(5)
+    worker.submit(np.zeros((10, 10, 3), np.uint8), window_name="a")
+    worker.submit(np.zeros((10, 10, 3), np.uint8), window_name="b")
+    worker.submit(np.zeros((20, 20, 3), np.uint8), window_name="a")
+    release.set()
+    assert worker.wait_idle(timeout=5)
+    assert display.shown[1:] == [("a", (20, 20, 3)), ("b", (10, 10, 3))]
+    assert worker.num_dropped == 1
+
+
+def test_downscales_and_closes_expired(worker, display):
+    worker.submit(np.zeros((300, 1000, 3), np.uint8), seconds=0.05, preview_width=100)
+    assert worker.wait_idle(timeout=5)
+    assert display.shown == [("Witmo Capture", (30, 100, 3))]
+    assert wait_until(lambda: display.closed == ["Witmo Capture"])
+
+
+def test_source_runs_on_worker_thread(worker):
+    threads = []
+
+    def source():
+        threads.append(threading.current_thread())
+        return np.zeros((10, 10, 3), np.uint8)
+
+    worker.submit(source)
+    assert worker.wait_idle(timeout=5)
+    assert threads == [worker._thread]
+
+
+def test_survives_failing_source(worker, display):
+    worker.submit(lambda: 1 / 0)
+    worker.submit(np.zeros((10, 10, 3), np.uint8), window_name="next")
+    assert worker.wait_idle(timeout=5)
+    assert [name for name, _ in display.shown] == ["next"]
+
+
+def test_stop_closes_windows(display):
+    worker = PreviewWorker(display=display).start()
+    worker.submit(np.zeros((10, 10, 3), np.uint8), seconds=60)
+    assert worker.wait_idle(timeout=5)
+    worker.stop()
+    assert display.closed == ["Witmo Capture"]
@@ -0,0 +1,108 @@
+import json
+import time
+import cv2
+import numpy as np
+from conftest import jpeg_bytes
+from witmo.image import BasicImage
+from witmo.llm.response_cache import ResponseCache, hash_text
+
+ARGS = ("What now?", "gpt", "You are a coach.")
+
+
+def screen(seed: int) -> np.ndarray:
+    """A synthetic game screen: some boxes on a gradient."""
+    rng = np.random.default_rng(seed)
+    img = np.tile(np.linspace(0, 200, 640, dtype=np.uint8)[None, :, None], (480, 1, 3))
+    for _ in range(12):
+        x, y = int(rng.integers(0, 560)), int(rng.integers(0, 420))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(img, (x, y), (x + 80, y + 60), color, -1)
+    return img
+
+
+def dhash(img: np.ndarray, tmp_path) -> int:
+    return BasicImage(str(tmp_path / "x.jpg"), data=jpeg_bytes(img)).dhash()
+
+
+def test_near_duplicate_hits_and_different_image_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    original = screen(0)
+    cache.store(dhash(original, tmp_path), *ARGS, "Open the map.")
+    # Same screen, captured again: a bit of sensor noise and brightness change:
+    noise = np.random.default_rng(1).normal(0, 4, original.shape)
+    again = np.clip(original * 1.03 + noise, 0, 255).astype(np.uint8)
+    assert cache.lookup(dhash(again, tmp_path), *ARGS) == "Open the map."
+    assert cache.lookup(dhash(screen(2), tmp_path), *ARGS) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_prompt_model_and_system_prompt_must_match(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(0b1011, *ARGS, "answer")
+    assert cache.lookup(0b1010, *ARGS) == "answer"  # Distance 1
+    assert cache.lookup(0b1011, "Other?", "gpt", ARGS[2]) is None
+    assert cache.lookup(0b1011, ARGS[0], "other", ARGS[2]) is None
+    assert cache.lookup(0b1011, ARGS[0], "gpt", "Other system prompt") is None
+
+
+def test_closest_match_wins(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_distance=6)
+    cache.store(0, *ARGS, "far")
+    cache.store(0b111, *ARGS, "close")
+    assert cache.lookup(0b1111, *ARGS) == "close"
+    assert cache.lookup(0b1111111 << 20, *ARGS) is None  # Distance 7
+
+
+def test_eviction_by_entries_bytes_and_age(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=3)
+    for i in range(5):
+        cache.store(i << 32, *ARGS, f"answer {i}")
+    assert [e.response for e in cache.entries] == ["answer 2", "answer 3", "answer 4"]
+
+    cache = ResponseCache(str(tmp_path / "bytes"), max_bytes=250)
+    for i in range(5):
+        cache.store(i << 32, *ARGS, "x" * 100)
+    assert len(cache.entries) == 2
+
+    cache = ResponseCache(str(tmp_path / "age"), max_age=60)
+    cache.store(1, *ARGS, "old")
+    cache.entries[0].created = time.time() - 61
+    assert cache.lookup(1, *ARGS) is None
+    assert cache.entries == []
+
+
+def test_persisted_and_compacted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=4)
+    for i in range(40):
+        cache.store(i << 32, *ARGS, f"answer {i}")
+    with open(cache.file_path, encoding="utf-8") as f:
+        assert len(f.readlines()) <= 2 * 16  # Rewritten without evicted entries
+    reloaded = ResponseCache(str(tmp_path), max_entries=4)
+    responses = [e.response for e in reloaded.entries]
+    assert responses == [f"answer {i}" for i in range(36, 40)]
+
+
+def test_torn_line_skipped(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(1, *ARGS, "kept")
+    with open(cache.file_path, "a", encoding="utf-8") as f:
+        f.write('{"image_hash": 2, "prompt": "Wh')
+    reloaded = ResponseCache(str(tmp_path))
+    assert [e.response for e in reloaded.entries] == ["kept"]
+
+
+def test_imports_legacy_json(tmp_path):
+    entry = {
+        "image_hash": 1,
+        "prompt": ARGS[0],
+        "model": ARGS[1],
+        "system_hash": hash_text(ARGS[2]),
+        "response": "legacy",
+        "created": time.time(),
+    }
+    legacy = tmp_path / "response_cache.json"
+    legacy.write_text(json.dumps([entry]), encoding="utf-8")
+    cache = ResponseCache(str(tmp_path))
+    assert cache.lookup(1, *ARGS) == "legacy"
+    assert not legacy.exists()
+    assert (tmp_path / "response_cache.jsonl").exists()
@@ -0,0 +1,174 @@
+import threading
+import time
+import cv2
+import numpy as np
+from witmo.screen_detection import (
+    TV_CLASS_ID,
+    ContourScreenDetector,
+    CropTracker,
+    FallbackScreenDetector,
+    ScreenRegion,
+    YoloScreenDetector,
+)
+
+CORNERS = [(400, 250), (1500, 280), (1480, 900), (420, 880)]  # A TV shot at an angle
+
+
+def lit_area(corners) -> np.ndarray:
+    """The screen's lit area inside the bezel."""
+    quad = np.array(corners, np.float64)
+    center = quad.mean(axis=0)
+    return (center + (quad - center) * 0.95).astype(np.int32)
+
+
+def room(corners=CORNERS, seed: int = 0) -> np.ndarray:
+    """A dim room with a lit screen (with some game content) and a dark bezel."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(20, 50, (1080, 1920, 3), dtype=np.uint8)
+    cv2.rectangle(img, (100, 950), (1800, 1000), (70, 60, 50), -1)  # A TV stand
+    quad = np.array(corners, np.int32)
+    cv2.fillPoly(img, [quad], (10, 10, 10))  # Bezel
+    screen = lit_area(corners)
+    cv2.fillPoly(img, [screen], (200, 210, 220))
+    x, y = screen.min(axis=0)
+    for _ in range(6):  # Content that changes from capture to capture
+        px, py = x + rng.integers(100, 900), y + rng.integers(100, 450)
+        color = tuple(int(c) for c in rng.integers(120, 255, 3))
+        cv2.circle(img, (int(px), int(py)), int(rng.integers(10, 40)), color, -1)
+    return img
+
+
+class FakeOnnxSession:
+    """Returns one TV box (cx, cy, w, h in inference coordinates) for any input."""
+
+    def __init__(self, box: tuple[float, ...], score: float):
+        self.box, self.score = box, score
+        self.input_shapes = []
+
+    def get_inputs(self):
+        return [type("Input", (), {"name": "images"})()]
+
+    def run(self, outputs, feeds):
+        self.input_shapes.append(feeds["images"].shape)
+        preds = np.zeros((3, 4 + 80), np.float32)  # Three candidate boxes
+        preds[1, :4], preds[1, 4 + TV_CLASS_ID] = self.box, self.score
+        preds[2, :4], preds[2, 4 + 0] = (10, 10, 5, 5), 0.9  # A person
+        return [preds.T[None]]
+
+
+def onnx_detector(box, score=0.8) -> YoloScreenDetector:
+    detector = YoloScreenDetector(backend="onnx", input_size=640)
+    detector.backend = "onnx"
+    detector._model = FakeOnnxSession(box, score)
+    return detector
+
+
+def test_downscale_keeps_aspect_ratio():
+    detector = YoloScreenDetector(backend="pytorch", input_size=640)
+    small, scale = detector._downscale(np.zeros((1080, 1920, 3), np.uint8))
+    assert small.shape == (360, 640, 3) and scale == 1 / 3
+    small, scale = detector._downscale(np.zeros((300, 400, 3), np.uint8))
+    assert small.shape == (300, 400, 3) and scale == 1.0  # Never upscaled
+
+
+def test_detect_scales_box_to_full_resolution():
+    detector = onnx_detector((320, 180, 300, 150))
+    rect = detector._detect(np.zeros((1080, 1920, 3), np.uint8))
+    assert rect == (510, 315, 900, 450)
+    # Padded to multiples of the stride, not to a square:
+    assert detector._model.input_shapes == [(1, 3, 384, 640)]
+
+
+def test_detect_clips_box_and_skips_low_confidence():
+    img = np.zeros((1080, 1920, 3), np.uint8)
+    assert onnx_detector((600, 180, 200, 400))._detect(img) == (1500, 0, 420, 1080)
+    assert onnx_detector((320, 180, 300, 150), score=0.1)._detect(img) is None
+
+
+def test_pytorch_backend_is_kept():
+    assert YoloScreenDetector(backend="pytorch").backend == "pytorch"
+
+
+class CountingDetector:
+    def __init__(self, region: ScreenRegion | None):
+        self.region = region
+        self.calls = 0
+
+    def load_in_background(self) -> None:
+        pass
+
+    def detect(self, img: np.ndarray) -> ScreenRegion | None:
+        self.calls += 1
+        time.sleep(0.01)
+        return self.region
+
+
+def test_contour_detector_finds_corners():
+    region = ContourScreenDetector().detect(room())
+    assert region is not None and region.corners is not None
+    expected = lit_area(CORNERS)
+    assert np.abs(np.array(region.corners) - expected).max() < 10
+    x, y, w, h = region.rect
+    (x1, y1), (x2, y2) = expected.min(axis=0), expected.max(axis=0)
+    assert abs(x - x1) < 10 and abs(y - y1) < 10
+    assert abs(x + w - x2) < 10 and abs(y + h - y2) < 10
+
+
+def test_contour_detector_rejects_implausible_shapes():
+    img = room()
+    cv2.rectangle(img, (0, 0), (1919, 1079), (30, 30, 30), -1)
+    cv2.rectangle(img, (900, 100), (1100, 1000), (220, 220, 220), -1)  # Portrait
+    assert ContourScreenDetector().detect(img) is None
+
+
+def test_fallback_uses_next_detector():
+    region = ScreenRegion((1, 2, 3, 4))
+    first, second = CountingDetector(None), CountingDetector(region)
+    assert FallbackScreenDetector(first, second).detect(room()) == region
+    assert (first.calls, second.calls) == (1, 1)
+    first.region = ScreenRegion((5, 6, 7, 8))
+    assert FallbackScreenDetector(first, second).detect(room()) == first.region
+    assert second.calls == 1
+
+
+def test_tracker_reuses_region_until_screen_moves():
+    tracker = CropTracker(ContourScreenDetector())
+    region = tracker.detect(room(seed=0))
+    assert region is not None
+    assert tracker.detect(room(seed=1)) is region  # New screen content, same TV
+    moved = [(x + 200, y + 60) for x, y in CORNERS]
+    assert tracker.detect(room(moved, seed=2)) is not region
+    assert tracker.stats()["hits"] == 1 and tracker.stats()["misses"] == 2
+    tracker.reset()
+    tracker.detect(room(moved, seed=2))
+    assert tracker.misses == 3
+
+
+def test_tracker_detects_again_after_miss_or_resize():
+    detector = CountingDetector(None)
+    tracker = CropTracker(detector)
+    tracker.detect(room())
+    tracker.detect(room())
+    assert detector.calls == 2  # Nothing to reuse
+    detector.region = ScreenRegion((400, 250, 1100, 650))
+    tracker.detect(room())
+    tracker.detect(cv2.resize(room(), (960, 540)))
+    assert detector.calls == 4
+
+
+def test_tracker_is_thread_safe():
+    detector = CountingDetector(ScreenRegion((400, 250, 1100, 650)))
+    tracker = CropTracker(detector)
+    img = room()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(tracker.detect(img)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert detector.calls == 1  # The others reuse the first detection
+    assert tracker.hits == 7 and tracker.misses == 1
+    assert len(set(results)) == 1
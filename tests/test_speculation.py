@@ -0,0 +1,73 @@
+import threading
+import time
+import numpy as np
+import pytest
+from conftest import jpeg_bytes
+from witmo.image import BasicImage, CroppedImage
+from witmo.llm.models import Model
+from witmo.screen_detection import ScreenRegion
+from witmo.speculation import PromptStats, Speculation
+
+MODEL = Model(shortname="mock", name="mock", api_name="mock")
+
+
+class SlowDetector:
+    def __init__(self, delay: float = 0.3, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.threads = []
+
+    def detect(self, img):
+        self.threads.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("detector broke")
+        return ScreenRegion((10, 20, 100, 50))
+
+
+@pytest.fixture
+def capture(tmp_path):
+    array = np.random.default_rng(0).integers(0, 255, (120, 160, 3), np.uint8)
+    return BasicImage(str(tmp_path / "cap.jpg"), data=jpeg_bytes(array))
+
+
+def test_crops_in_the_background(engine, capture, monkeypatch):
+    detector = SlowDetector()
+    monkeypatch.setattr(CroppedImage, "detector", detector)
+    start = time.perf_counter()
+    speculation = Speculation(engine, capture, MODEL, crop=True)
+    assert time.perf_counter() - start < detector.delay
+    image = speculation.image
+    assert isinstance(image, CroppedImage)
+    assert image.array.shape == (50, 100, 3)
+    assert detector.threads[0].startswith("witmo-speculation")
+    speculation.prepared.result(timeout=5)
+
+
+def test_failed_crop_uses_full_capture(engine, capture, monkeypatch):
+    monkeypatch.setattr(CroppedImage, "detector", SlowDetector(0, fail=True))
+    speculation = Speculation(engine, capture, MODEL, crop=True)
+    assert speculation.image is capture
+
+
+def test_without_crop(engine, capture):
+    speculation = Speculation(engine, capture, MODEL)
+    assert speculation.image is capture
+
+
+def test_speculative_request_taken(engine, capture, tmp_path):
+    stats = PromptStats(str(tmp_path))
+    speculation = Speculation(engine, capture, MODEL, prompt="Help!")
+    handle = speculation.take("Help!", stats)
+    assert handle is not None
+    assert handle.result(timeout=5).endswith("Help!")
+    assert stats.hits == 1
+
+
+def test_speculative_request_discarded(engine, capture, tmp_path):
+    stats = PromptStats(str(tmp_path))
+    speculation = Speculation(engine, capture, MODEL, prompt="Help!")
+    assert speculation.take("Something else", stats) is None
+    assert stats.misses == 1
+    assert speculation.handle.wait(timeout=5)
+    assert speculation.handle.state in ("cancelled", "done")
@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+import pytest
+from conftest import wait_until
+from witmo.camera.burst import sharpness_scores
+from witmo.camera.stream_camera import StreamCamera, VideoFileSource
+
+SIZE = (160, 120)
+
+
+def write_clip(path: str, num_frames: int = 12, sharp_every: int = 0) -> list:
+    """A clip of noise frames, blurred except every `sharp_every`th one."""
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, SIZE)
+    assert writer.isOpened()
+    frames = []
+    for i in range(num_frames):
+        frame = rng.integers(0, 255, (SIZE[1], SIZE[0], 3), np.uint8)
+        if not sharp_every or i % sharp_every:
+            frame = cv2.GaussianBlur(frame, (9, 9), 3)
+        writer.write(frame)
+        frames.append(frame)
+    writer.release()
+    return frames
+
+
+def stop_stream(camera: StreamCamera) -> None:
+    """Freeze the ring buffer once it's full."""
+    assert wait_until(lambda: len(camera._frames) == camera._frames.maxlen, 5)
+    camera.source.close()
+    camera._thread.join(timeout=2)
+
+
+def test_missing_video_file(tmp_path):
+    with pytest.raises(ValueError):
+        VideoFileSource(str(tmp_path / "missing.avi"))
+
+
+def test_capture_returns_latest_frame(tmp_path):
+    clip = str(tmp_path / "clip.avi")
+    write_clip(clip)
+    camera = StreamCamera(VideoFileSource(clip), output_dir=str(tmp_path / "captures"))
+    with camera:
+        stop_stream(camera)
+        image = camera.capture()
+        assert image.array is camera._frames[-1][1]
+        assert image.array.shape == (SIZE[1], SIZE[0], 3)
+        assert image.path.startswith(str(tmp_path / "captures"))
+        assert image.read_bytes()[:2] == b"\xff\xd8"  # JPEG
+
+
+def test_capture_picks_sharpest_of_burst(tmp_path):
+    clip = str(tmp_path / "clip.avi")
+    write_clip(clip, sharp_every=4)
+    camera = StreamCamera(
+        VideoFileSource(clip), output_dir=str(tmp_path), buffer_size=8, burst_size=4
+    )
+    with camera:
+        stop_stream(camera)
+        recent = [frame for _, frame in camera._frames][-4:]
+        scores = sharpness_scores(recent)
+        assert sorted(scores)[-1] > 2 * sorted(scores)[-2]  # One sharp frame in 4
+        image = camera.capture()
+        assert image.array is recent[int(np.argmax(scores))]
+
+
+def test_burst_size_must_fit_buffer(tmp_path):
+    clip = str(tmp_path / "clip.avi")
+    write_clip(clip, num_frames=2)
+    with pytest.raises(ValueError):
+        StreamCamera(VideoFileSource(clip), str(tmp_path), buffer_size=4, burst_size=5)
+    with pytest.raises(ValueError):
+        StreamCamera(VideoFileSource(clip), str(tmp_path), burst_size=0)
@@ -1,6 +1,18 @@
 import argparse
 import sys
 
+
+def positive_int(value: str) -> int:
+    """argparse type for integers of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+
 def parse():
     help_epilog = """\
 example usage:
@@ -42,6 +54,18 @@ prerequisites:
         default=False,
         help="delete the image on the camera device after capturing",
     )
+    parser.add_argument(
+        "-D",
+        "--device",
+        dest="serials",
+        nargs="+",
+        metavar="SERIAL",
+        default=None,
+        help=(
+            "serial(s) of the ADB device(s) to use, in order of preference; later ones "
+            "take over if earlier ones drop (default: any connected device)"
+        ),
+    )
     parser.add_argument(
         "-s",
         "--spoilers",
@@ -58,6 +82,106 @@ prerequisites:
         default=False,
         help="crop images to detected TV/screen before sending to LLM",
     )
+    parser.add_argument(
+        "-cd",
+        "--crop-detector",
+        dest="crop_detector",
+        choices=["yolo", "contour"],
+        default="yolo",
+        help="screen detector for cropping; 'contour' finds the screen's corners and "
+        "straightens it, falling back to yolo if it finds none (default: yolo)",
+    )
+    parser.add_argument(
+        "-cb",
+        "--crop-backend",
+        dest="crop_backend",
+        choices=["auto", "pytorch", "onnx", "onnx-int8"],
+        default="auto",
+        help="inference backend for the screen detector (default: auto, i.e., onnx "
+        "if onnxruntime is installed)",
+    )
+    parser.add_argument(
+        "-tr",
+        "--track-crop",
+        dest="track_crop",
+        action="store_true",
+        default=False,
+        help="reuse the last crop area while the camera doesn't move (e.g., on a "
+        "tripod) instead of detecting the screen on every capture",
+    )
+    parser.add_argument(
+        "-st",
+        "--stream",
+        dest="stream",
+        nargs="?",
+        const="device",
+        default=None,
+        metavar="VIDEOFILE",
+        help=(
+            "capture frames from a live low-res stream of the device screen instead "
+            "of taking photos (needs ffmpeg); pass a video file to stream that instead"
+        ),
+    )
+    parser.add_argument(
+        "-sp",
+        "--stream-photos",
+        dest="stream_photos",
+        action="store_true",
+        default=False,
+        help="with --stream, also take a full-res photo in the background per capture",
+    )
+    parser.add_argument(
+        "-b",
+        "--burst",
+        dest="burst_size",
+        type=positive_int,
+        default=1,
+        metavar="N",
+        help="take N captures per capture and keep the sharpest one; a capture takes "
+        "about N times as long (default: 1)",
+    )
+    parser.add_argument(
+        "-nx",
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        default=False,
+        help="don't answer repeated captures of the same screen from the response cache",
+    )
+    parser.add_argument(
+        "-sx",
+        "--speculate",
+        action="store_true",
+        default=False,
+        help="after a capture, already send the prompt you pick most often for this "
+        "game while you pick (costs an extra request when you pick another one)",
+    )
+    parser.add_argument(
+        "-fo",
+        "--fan-out",
+        dest="fanout_mode",
+        choices=["off", "race", "compare"],
+        default="off",
+        help="send each request to several LLMs at once: show the first answer "
+        "(race) or all answers side by side (compare) (default: off)",
+    )
+    parser.add_argument(
+        "-fm",
+        "--fan-out-models",
+        dest="fanout_keys",
+        nargs="+",
+        metavar="KEY",
+        default=None,
+        help="keys of the LLMs to fan out to, as in the LLM menu (default: all)",
+    )
+    parser.add_argument(
+        "-m",
+        "--models",
+        dest="models_file",
+        metavar="FILE",
+        default="models.json",
+        help="model registry with the LLMs and their providers (default: models.json)",
+    )
     parser.add_argument(
         "-a",
         "--audio",
@@ -91,6 +215,14 @@ prerequisites:
         default=False,
         help="run without camera; only use initial image (-i) or text prompts",
     )
+    debug_group.add_argument(
+        "-ml",
+        "--mock-llm",
+        dest="mock_llm",
+        action="store_true",
+        default=False,
+        help="answer with the bundled mock LLM server; no network or API key needed",
+    )
     debug_group.add_argument(
         "-l",
         "--log-level",
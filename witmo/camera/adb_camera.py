@@ -12,29 +12,43 @@ To set up adb:
 2. Connect your Android device via USB (default mode)
 """
 
+import io
 import os
+import struct
 import time
 from loguru import logger
-from ppadb.client import Client as AdbClient
 from witmo.image import BasicImage
-from .camera_protocol import CameraProtocol
-
-
-class CameraError(Exception):
-    pass
+from .adb_connection import AdbConnection
+from .camera_protocol import CameraError, CameraProtocol
+from .capture_watcher import CaptureWatcher
+from .liveness import CameraLiveness
 
 
 class AdbCamera(CameraProtocol):
     """A simple class for capturing images via ADB USB connection"""
 
     CAMERA_DIR = "/sdcard/DCIM/Camera"
-
-    def __init__(self, do_delete_remote: bool = False, output_dir="captures"):
+    CAPTURE_TIMEOUT = 20  # Seconds to wait for the camera to save an image
+    WATCHER_GRACE = 3  # Seconds to wait for a watcher event before polling instead
+
+    def __init__(
+        self,
+        do_delete_remote: bool = False,
+        output_dir="captures",
+        adb_host: str = "127.0.0.1",
+        adb_port: int = 5037,
+        use_watcher: bool = True,
+        serials: list[str] | None = None,
+    ):
         """
         Initialize the AdbCamera
 
         Args:
             output_dir (str): Directory where captured images will be stored
+            adb_host (str): Host of the ADB server
+            adb_port (int): Port of the ADB server
+            use_watcher (bool): Detect new captures via events instead of polling
+            serials (list[str]): Device serials in order of preference (default: any)
         """
         self.do_delete_remote = do_delete_remote
 
@@ -45,35 +59,45 @@ class AdbCamera(CameraProtocol):
             os.makedirs(self.output_dir)
             logger.info(f"Created directory: {self.output_dir}")
 
-        self.client = AdbClient(host="127.0.0.1", port=5037)
-        self.device = self._get_device()
-        logger.info(f"Connected to device: {self.device.serial}")
+        self.connection = AdbConnection(adb_host, adb_port, serials=serials)
+        self.connection.on_reconnect(self._on_reconnect)
 
         self._original_brightness = None
 
-    def _get_device(self):
-        """Get the connected ADB device
-
-        Returns:
-            Device: The connected ADB device or None if no device is found
-        """
-        try:
-            devices = self.client.devices()
-        except Exception as e:
-            raise CameraError(f"Failed to connect to ADB: {str(e)}")
-
-        if not devices:
-            raise CameraError(
-                "No ADB devices found. Make sure your device is connected and USB debugging is enabled."
-            )
-
-        device = devices[0]
-        return device
+        self.use_watcher = use_watcher
+        self._watcher = None
+        self._start_watcher()
+        self._last_remote_image: str | None = None
+
+        self.liveness = CameraLiveness(self.connection)
+        self.liveness.start()
+
+    @property
+    def device(self):
+        """The currently connected ADB device."""
+        return self.connection.device
+
+    def _start_watcher(self) -> None:
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+        if self.use_watcher:
+            self._watcher = CaptureWatcher(self.device, self.CAMERA_DIR)
+            self._watcher.start()
+
+    def _on_reconnect(self, device) -> None:
+        """Restore device state after the connection manager reconnected."""
+        self._start_watcher()
+        self._last_remote_image = None  # Might be a different device now
+        self.liveness.invalidate()
+        if self._original_brightness is not None:
+            self.keep_screen_on(True)
+            self.set_brightness(0)
 
     def get_brightness(self) -> int:
         """Get the current screen brightness from the device."""
         try:
-            output = self.device.shell("settings get system screen_brightness").strip()
+            output = self.connection.shell("settings get system screen_brightness").strip()
             return int(output)
         except Exception as e:
             logger.error(f"Error getting brightness: {str(e)}")
@@ -90,7 +114,7 @@ class AdbCamera(CameraProtocol):
 
         try:
             logger.info(f"Setting screen brightness to {level}...")
-            self.device.shell(f"settings put system screen_brightness {level}")
+            self.connection.shell(f"settings put system screen_brightness {level}")
         except Exception as e:
             logger.error(f"Error setting brightness: {str(e)}")
 
@@ -103,10 +127,10 @@ class AdbCamera(CameraProtocol):
         try:
             if enable:
                 logger.info("🔓 Keeping device screen on...")
-                self.device.shell("svc power stayon usb")
+                self.connection.shell("svc power stayon usb")
             else:
                 logger.info("🔒 Restoring normal screen timeout...")
-                self.device.shell("svc power stayon false")
+                self.connection.shell("svc power stayon false")
         except Exception as e:
             logger.error(f"Error changing screen timeout: {str(e)}")
 
@@ -116,65 +140,148 @@ class AdbCamera(CameraProtocol):
         Returns:
             str: Path to the latest image file on device
         """
-        output = self.device.shell(
+        output = self.connection.shell(
             f"ls -t {self.CAMERA_DIR} | head -n1"
         ).strip()
         return f"{self.CAMERA_DIR}/{output}"
 
     def assert_running(self) -> None:
-        """Ensure the camera app is running on the device."""
-        output = self.device.shell("top -n 1")
-        if not any("camera" in line.lower() for line in output.splitlines()):
+        """Ensure the camera app is in the foreground on the device.
+
+        Uses the cached result of the liveness check, so this doesn't block. If nothing
+        is known yet, the capture goes ahead and would time out if the app is missing.
+        """
+        if self.liveness.is_running() is False:
             raise CameraError(
                 "Camera app is not running. Please open the camera app on your device."
             )
 
+    def _poll_for_new_image(self, latest_image_before: str, timeout: float) -> str:
+        """Poll the camera directory until a new image shows up."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            latest_image = self.get_latest_image_path()
+            if latest_image != latest_image_before:
+                return latest_image
+        raise CameraError(
+            "Timed out waiting for camera to save image. Please ensure the camera app is functioning."
+        )
+
+    def _wait_for_new_image(self, start: float) -> str:
+        """Wait for the watcher to report the new image; poll if it stays silent."""
+        assert self._watcher is not None
+        latest_image = self._watcher.wait_for_new(self.WATCHER_GRACE)
+        if latest_image:
+            return latest_image
+
+        logger.warning("No capture event received, falling back to polling.")
+        self._watcher.stop()
+        self._watcher = None
+        # The image has most likely been saved by now, so anything newer than the
+        # last image we transferred is it:
+        remaining = self.CAPTURE_TIMEOUT - (time.monotonic() - start)
+        return self._poll_for_new_image(self._last_remote_image, remaining)
+
     def capture(self) -> BasicImage:
         """Capture an image using the device's camera and return a BasicImage object."""
         logger.info("📸 Taking photo...")
 
         self.assert_running()
 
-        latest_image_before = self.get_latest_image_path()
-        self.device.shell("input keyevent KEYCODE_CAMERA")
-
-        # Wait for the camera to save the image:
-        i = 0
-        while True:
-            time.sleep(0.05)
-            latest_image = self.get_latest_image_path()
-            if latest_image != latest_image_before:
-                break
-            i += 1
-            if i > 20 / 0.05:
-                raise CameraError(
-                    "Timed out waiting for camera to save image. Please ensure the camera app is functioning."
-                )
+        start = time.monotonic()
+        if self._watcher and self._watcher.alive:
+            self._watcher.clear()
+            if self._last_remote_image is None:
+                self._last_remote_image = self.get_latest_image_path()
+            self.connection.shell("input keyevent KEYCODE_CAMERA")
+            latest_image = self._wait_for_new_image(start)
+        else:
+            latest_image_before = self.get_latest_image_path()
+            self.connection.shell("input keyevent KEYCODE_CAMERA")
+            latest_image = self._poll_for_new_image(
+                latest_image_before, self.CAPTURE_TIMEOUT
+            )
+        self._last_remote_image = latest_image
+        logger.debug(f"Capture detected after {time.monotonic() - start:.3f}s")
 
         logger.info(f"Found recent image at {latest_image}")
         logger.info(f"Transferring image to local machine...")
-        local_image = BasicImage.create_with_timestamp(self.output_dir)
-        self.device.pull(latest_image, local_image.path)
+        start = time.monotonic()
+        data = self.pull_bytes(latest_image)
+        logger.debug(
+            f"Transferred {len(data)} bytes in {time.monotonic() - start:.3f}s"
+        )
+        local_image = BasicImage.create_with_timestamp(self.output_dir, data=data)
+        local_image.save_in_background()
 
         if self.do_delete_remote:
             logger.info("Removing image from device...")
-            self.device.shell(f"rm '{latest_image}'")
+            self.connection.shell(f"rm '{latest_image}'")
 
-        logger.info(f"Image saved to {local_image.path}")
+        logger.info(f"Image will be saved to {local_image.path}")
         return local_image
 
+    def pull_bytes(self, remote_path: str) -> bytes:
+        """Transfer a file from the device straight into memory via the sync channel.
+
+        Raises:
+            CameraError: If the device reports an error for the file
+        """
+        return self.connection.run(lambda d: self._pull_bytes(d, remote_path))
+
+    def _pull_bytes(self, device, remote_path: str) -> bytes:
+        buffer = io.BytesIO()
+        conn = device.sync()
+        with conn:
+            path = remote_path.encode("utf-8")
+            conn.write(b"RECV" + struct.pack("<I", len(path)) + path)
+            while True:
+                flag = self._read_exactly(conn, 4)
+                length = struct.unpack("<I", self._read_exactly(conn, 4))[0]
+                if flag == b"DATA":
+                    buffer.write(self._read_exactly(conn, length))
+                elif flag == b"DONE":
+                    break
+                else:
+                    msg = self._read_exactly(conn, length).decode("utf-8", "replace")
+                    raise CameraError(f"Failed to transfer {remote_path}: {msg}")
+        return buffer.getvalue()
+
+    @staticmethod
+    def _read_exactly(conn, length: int) -> bytes:
+        data = bytearray()
+        while len(data) < length:
+            chunk = conn.read(length - len(data))
+            if not chunk:
+                raise ConnectionError("ADB connection closed during transfer")
+            data += chunk
+        return bytes(data)
+
     def __enter__(self):
         self.keep_screen_on(True)
         self._original_brightness = self.get_brightness()
         self.set_brightness(0)
         return self
 
+    def close(self) -> None:
+        """Release the long-lived ADB session of the capture watcher and stop the
+        liveness checks.
+        """
+        self.liveness.stop()
+        logger.debug(f"ADB reconnects: {self.connection.num_reconnects}")
+        logger.debug(f"Camera liveness check stats: {self.liveness.stats()}")
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.keep_screen_on(False)
         if self._original_brightness is not None:
             self.set_brightness(self._original_brightness)
         else:
             self.set_brightness(255)
+        self.close()
         return False
 
 
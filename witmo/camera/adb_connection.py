@@ -0,0 +1,201 @@
+"""
+Resilient ADB connection for Witmo
+
+Wraps the ADB client and the selected device. Commands that fail because the device
+dropped (e.g., a USB hiccup) trigger a reconnect with exponential backoff and are then
+retried, so the app keeps running and keeps its warm state.
+
+Devices can be selected by serial. With several serials given, they are tried in order,
+so a second phone can take over if the first one drops. Without serials, any attached
+device is used.
+
+Several threads use the connection (captures, the capture watcher, liveness checks).
+When they fail at the same time, only the first one reconnects; the others wait for it
+and then use the new device (see `generation`). The backoff sleeps don't hold the lock
+that guards the device.
+"""
+
+import random
+import threading
+import time
+from typing import Callable
+from loguru import logger
+from ppadb.client import Client as AdbClient
+from .camera_protocol import CameraError
+
+# What ppadb raises when the server or device can't be reached:
+CONNECTION_ERRORS = (RuntimeError, OSError)
+
+
+class AdbConnection:
+    """ADB device connection with health checks and transparent reconnects.
+
+    Args:
+        host: Host of the ADB server.
+        port: Port of the ADB server.
+        serials: Device serials in order of preference; None or empty for any device.
+        max_retries: Reconnect attempts before giving up.
+        base_delay: Delay before the first reconnect attempt, doubled on every retry.
+        max_delay: Upper bound for the delay between attempts.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 5037,
+        serials: list[str] | None = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+    ):
+        self.client = AdbClient(host=host, port=port)
+        self.serials = serials or []
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._device = None
+        self._lock = threading.Lock()  # Guards _device and generation, held briefly
+        self._reconnect_lock = threading.Lock()  # One reconnect at a time
+        self.generation = 0  # Incremented on every (re)connect
+        self._listeners: list[Callable] = []
+        self.num_reconnects = 0
+        self.connect()
+
+    @property
+    def device(self):
+        """The currently connected device."""
+        with self._lock:
+            device, generation = self._device, self.generation
+        if device is None:
+            self.reconnect(generation)
+            with self._lock:
+                device = self._device
+        return device
+
+    @property
+    def serial(self) -> str:
+        return self.device.serial
+
+    def on_reconnect(self, callback: Callable) -> None:
+        """Register a callback that gets the new device after every reconnect."""
+        self._listeners.append(callback)
+
+    def _select_device(self):
+        try:
+            devices = self.client.devices(state="device")
+        except CONNECTION_ERRORS as e:
+            raise CameraError(f"Failed to connect to ADB: {str(e)}")
+
+        if not devices:
+            raise CameraError(
+                "No ADB devices found. Make sure your device is connected and USB debugging is enabled."
+            )
+        if not self.serials:
+            return devices[0]
+        by_serial = {d.serial: d for d in devices}
+        for serial in self.serials:
+            if serial in by_serial:
+                return by_serial[serial]
+        raise CameraError(
+            f"None of the requested devices {self.serials} is connected "
+            f"(found: {list(by_serial)})."
+        )
+
+    def connect(self) -> None:
+        """Select a device (raises CameraError if there is none)."""
+        device = self._select_device()
+        with self._lock:
+            self._device = device
+            self.generation += 1
+        logger.info(f"Connected to device: {device.serial}")
+
+    def is_healthy(self) -> bool:
+        """Check whether the current device responds to a trivial command."""
+        try:
+            return self.device.shell("echo ok", timeout=5).strip() == "ok"
+        except Exception:
+            return False
+
+    def reconnect(self, generation: int | None = None) -> None:
+        """Reconnect with exponential backoff and jitter. With the `generation` the
+        caller saw before its command failed, nothing is done if another thread has
+        reconnected since.
+
+        Raises:
+            CameraError: If no device could be connected after all retries
+        """
+        with self._reconnect_lock:
+            device = self._reconnect(generation)
+        if device is None:
+            return
+        # Outside the lock: listeners run commands, which may need to reconnect again.
+        for callback in self._listeners:
+            callback(device)
+
+    def _reconnect(self, generation: int | None):
+        """The reconnect itself; returns the new device, or None if another thread has
+        already reconnected.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                if self._device is not None:
+                    return None  # Another thread already reconnected
+            previous = self._device.serial if self._device is not None else None
+        for attempt in range(self.max_retries):
+            delay = min(self.max_delay, self.base_delay * 2**attempt)
+            delay *= random.uniform(0.8, 1.2)
+            logger.warning(
+                f"Reconnecting to ADB device in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{self.max_retries})..."
+            )
+            time.sleep(delay)
+            try:
+                self.connect()
+            except CameraError as e:
+                logger.debug(f"Reconnect failed: {e}")
+                continue
+            if not self.is_healthy():
+                continue
+            with self._lock:
+                device = self._device
+            self.num_reconnects += 1
+            if previous and device.serial != previous:
+                logger.warning(f"Device {previous} is gone, switched to {device.serial}")
+            return device
+        with self._lock:
+            self._device = None
+        raise CameraError(
+            f"Lost connection to the ADB device and could not reconnect after "
+            f"{self.max_retries} attempts."
+        )
+
+    def run(self, fn: Callable):
+        """Call fn(device); on connection errors reconnect once and call it again."""
+        with self._lock:
+            generation = self.generation
+        try:
+            return fn(self.device)
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"ADB command failed ({e}), reconnecting...")
+        self.reconnect(generation)
+        return fn(self.device)
+
+    def shell(self, cmd: str, **kwargs) -> str:
+        """Run a shell command on the device, reconnecting if needed."""
+        return self.run(lambda device: device.shell(cmd, **kwargs))
+
+
+if __name__ == "__main__":
+    from witmo.camera.fake_adb import FakeAdbServer
+
+    with FakeAdbServer() as server:
+        connection = AdbConnection(port=server.port, base_delay=0.2)
+        print(f"Healthy: {connection.is_healthy()}")
+
+        server.disconnect(duration=1.0)
+        print("Device disconnected for 1s...")
+        start = time.perf_counter()
+        output = connection.shell("settings get system screen_brightness").strip()
+        elapsed = time.perf_counter() - start
+        print(f"Shell command survived the disconnect in {elapsed:.2f}s: {output}")
+        print(f"Reconnects: {connection.num_reconnects}")
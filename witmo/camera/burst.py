@@ -0,0 +1,99 @@
+"""
+Burst capture for Witmo
+
+Phone captures of a TV are often motion-blurred, and a blurry image wastes a whole LLM
+round trip. BurstCamera takes several captures one after another and only returns
+(and archives) the sharpest one. They're full captures, not a burst mode of the phone's
+camera, so a burst of N takes about N times as long as a single capture.
+
+Sharpness is the variance of the Laplacian, computed for the whole burst at once on
+small grayscale thumbnails, so scoring a burst takes a few milliseconds.
+"""
+
+import time
+import cv2
+import numpy as np
+from loguru import logger
+from witmo.image import BasicImage
+from .camera_protocol import CameraProtocol
+
+THUMBNAIL_WIDTH = 640
+
+
+def _gray_thumbnail(img: np.ndarray, width: int = THUMBNAIL_WIDTH) -> np.ndarray:
+    h, w = img.shape[:2]
+    if w > 2 * width:
+        # Cheap pre-shrink so the area-averaging resize below has little to do:
+        size = (2 * width, round(h * 2 * width / w))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+        h, w = img.shape[:2]
+    size = (width, max(1, round(h * width / w)))
+    img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def sharpness_scores(frames: list[np.ndarray]) -> np.ndarray:
+    """Return the Laplacian variance of each frame (higher means sharper).
+
+    Frames can be BGR or grayscale and of different sizes; all are scored on grayscale
+    thumbnails of the same size so their scores are comparable.
+    """
+    thumbnails = [_gray_thumbnail(f) for f in frames]
+    height = min(t.shape[0] for t in thumbnails)
+    batch = np.stack([t[:height] for t in thumbnails]).astype(np.float32)
+    # 4-neighbour Laplacian for the whole batch in one go:
+    laplacian = (
+        batch[:, :-2, 1:-1]
+        + batch[:, 2:, 1:-1]
+        + batch[:, 1:-1, :-2]
+        + batch[:, 1:-1, 2:]
+        - 4 * batch[:, 1:-1, 1:-1]
+    )
+    return laplacian.var(axis=(1, 2))
+
+
+def pick_sharpest(frames: list[np.ndarray]) -> int:
+    """Return the index of the sharpest frame."""
+    start = time.perf_counter()
+    scores = sharpness_scores(frames)
+    best = int(np.argmax(scores))
+    logger.debug(
+        f"Scored {len(frames)} frames in {(time.perf_counter() - start) * 1000:.1f} ms: "
+        f"{', '.join(f'{s:.0f}' for s in scores)}; picked #{best}"
+    )
+    return best
+
+
+class BurstCamera(CameraProtocol):
+    """Wraps a camera, takes `burst_size` captures per capture and keeps the sharpest."""
+
+    def __init__(self, camera: CameraProtocol, burst_size: int = 3):
+        if burst_size < 1:
+            raise ValueError("Burst size must be at least 1")
+        self.camera = camera
+        self.burst_size = burst_size
+
+    def capture(self) -> BasicImage:
+        images = [self.camera.capture() for _ in range(self.burst_size)]
+        if len(images) == 1:
+            return images[0]
+        # Decoding at reduced size is much faster than a full decode:
+        frames = [
+            cv2.imdecode(
+                np.frombuffer(image.read_bytes(), np.uint8),
+                cv2.IMREAD_REDUCED_GRAYSCALE_4,
+            )
+            for image in images
+        ]
+        best = images[pick_sharpest(frames)]
+        for image in images:
+            if image is not best:
+                image.discard_saved()
+        return best
+
+    def __enter__(self):
+        self.camera.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.camera.__exit__(exc_type, exc_val, exc_tb)
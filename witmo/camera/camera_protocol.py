@@ -1,6 +1,11 @@
 from typing import Protocol, runtime_checkable, Any
 from witmo.image import BasicImage
 
+
+class CameraError(Exception):
+    pass
+
+
 @runtime_checkable
 class CameraProtocol(Protocol):
     def __enter__(self) -> 'CameraProtocol': ...
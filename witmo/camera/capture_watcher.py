@@ -0,0 +1,106 @@
+"""
+Event-driven capture detection for AdbCamera
+
+Keeps one long-lived ADB shell session open running `inotifyd` on the device's camera
+folder. Every file the camera app finishes writing (or moves into place) arrives as an
+event, so AdbCamera doesn't have to poll the folder with `ls -t` after each shot.
+
+If `inotifyd` isn't available on the device or the session drops, the watcher marks
+itself as not alive and AdbCamera falls back to polling.
+"""
+
+import queue
+import threading
+from loguru import logger
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic", ".dng")
+
+
+class CaptureWatcher:
+    """Watches a directory on the device for new image files via `inotifyd`."""
+
+    def __init__(self, device, directory: str):
+        self.device = device
+        self.directory = directory
+        self._events: queue.Queue[str] = queue.Queue()
+        self._conn = None
+        self._alive = False
+        self._thread: threading.Thread | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self._alive
+
+    def start(self) -> None:
+        """Open the shell session in a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Close the shell session, which also ends `inotifyd` on the device."""
+        self._alive = False
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def clear(self) -> None:
+        """Drop all pending events, e.g., right before triggering a new capture."""
+        while True:
+            try:
+                self._events.get_nowait()
+            except queue.Empty:
+                return
+
+    def wait_for_new(self, timeout: float) -> str | None:
+        """Return the path of the next new image file, or None on timeout."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _run(self) -> None:
+        # Events: w = file closed after writing, y = file moved into the directory.
+        cmd = f"inotifyd - {self.directory}:wy"
+        try:
+            self.device.shell(cmd, handler=self._read_events)
+        except Exception as e:
+            logger.warning(f"Capture watcher failed: {e}")
+        finally:
+            if self._alive:
+                logger.info("Capture watcher stopped, falling back to polling.")
+            self._alive = False
+
+    def _read_events(self, conn) -> None:
+        self._conn = conn
+        buffer = b""
+        while self._alive:
+            try:
+                chunk = conn.read(4096)
+            except OSError:
+                break
+            if not chunk:
+                break
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                self._handle_line(line.decode("utf-8", errors="replace").strip())
+
+    def _handle_line(self, line: str) -> None:
+        if not line:
+            return
+        parts = line.split("\t")
+        if len(parts) != 3:
+            # Most likely "inotifyd: not found" or a similar shell error:
+            logger.info(f"Capture watcher unavailable: {line}")
+            self._alive = False
+            return
+        _, directory, name = parts
+        # Camera apps write to hidden ".pending..." files first, then rename:
+        if name.startswith(".") or not name.lower().endswith(IMAGE_EXTENSIONS):
+            return
+        path = f"{directory.rstrip('/')}/{name}"
+        logger.debug(f"Capture watcher saw new file: {path}")
+        self._events.put(path)
@@ -0,0 +1,292 @@
+"""
+Fake ADB server for Witmo
+
+A minimal, in-process stand-in for the ADB server plus one attached Android device. It
+speaks just enough of the ADB smart-socket and sync protocols for AdbCamera to work
+against it, so the camera code can be exercised and benchmarked without a phone.
+
+The simulated device has a camera folder with a configurable number of photos. Listing
+that folder gets slower the more photos it holds, like on a real device with a big DCIM
+folder.
+
+Run this module directly to benchmark AdbCamera's capture detection.
+"""
+
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+from loguru import logger
+
+
+class _FakeAdbHandler(socketserver.BaseRequestHandler):
+    """Handles one ADB client connection."""
+
+    server: "_FakeAdbTCPServer"
+
+    def handle(self):
+        device: FakeAdbServer = self.server.device
+        try:
+            while True:
+                request = self._read_request()
+                if request is None:
+                    return
+                if request == "host:devices":
+                    payload = f"{device.serial}\tdevice\n" if device.connected else ""
+                    self._okay(payload)
+                    return
+                elif request == "host:version":
+                    self._okay("0029")
+                    return
+                elif request.startswith("host:transport:"):
+                    serial = request[len("host:transport:") :]
+                    if serial != device.serial or not device.connected:
+                        self._fail(f"device '{serial}' not found")
+                        return
+                    self.request.sendall(b"OKAY")
+                    continue  # Next request on the same connection
+                elif request.startswith("shell:"):
+                    self.request.sendall(b"OKAY")
+                    device._shell(request[len("shell:") :], self.request)
+                    return
+                elif request == "sync:":
+                    self.request.sendall(b"OKAY")
+                    self._sync(device)
+                    return
+                else:
+                    self._fail(f"unknown request: {request}")
+                    return
+        except OSError:
+            pass  # Client went away
+
+    def _read_exactly(self, n: int) -> bytes | None:
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _read_request(self) -> str | None:
+        length = self._read_exactly(4)
+        if length is None:
+            return None
+        data = self._read_exactly(int(length.decode(), 16))
+        return data.decode("utf-8") if data is not None else None
+
+    def _okay(self, payload: str) -> None:
+        data = payload.encode("utf-8")
+        self.request.sendall(b"OKAY" + f"{len(data):04X}".encode() + data)
+
+    def _fail(self, msg: str) -> None:
+        data = msg.encode("utf-8")
+        self.request.sendall(b"FAIL" + f"{len(data):04X}".encode() + data)
+
+    def _sync(self, device: "FakeAdbServer") -> None:
+        while True:
+            header = self._read_exactly(8)
+            if header is None:
+                return
+            cmd, length = header[:4].decode(), struct.unpack("<I", header[4:])[0]
+            arg = self._read_exactly(length) if length else b""
+            if cmd == "RECV":
+                data = device.files.get(arg.decode("utf-8"))
+                if data is None:
+                    msg = b"No such file or directory"
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(msg)) + msg)
+                    continue
+                for i in range(0, len(data), 65536):
+                    chunk = data[i : i + 65536]
+                    self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            else:  # QUIT and anything we don't support
+                return
+
+
+class _FakeAdbTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    device: "FakeAdbServer"
+
+
+class FakeAdbServer:
+    """A fake ADB server with one simulated device.
+
+    Args:
+        serial: Serial number of the simulated device.
+        num_photos: Number of photos already in the camera folder.
+        ls_cost_per_file: Simulated seconds per file for listing the camera folder.
+        save_delay: Seconds between the shutter key event and the photo being saved.
+        supports_inotify: Whether the device has a working `inotifyd`.
+        photo_bytes: Contents for every simulated photo.
+    """
+
+    CAMERA_DIR = "/sdcard/DCIM/Camera"
+
+    def __init__(
+        self,
+        serial: str = "fake-device",
+        num_photos: int = 100,
+        ls_cost_per_file: float = 0.00005,
+        save_delay: float = 0.3,
+        supports_inotify: bool = True,
+        photo_bytes: bytes = b"\xff\xd8\xff\xe0" + bytes(64 * 1024) + b"\xff\xd9",
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.serial = serial
+        self.ls_cost_per_file = ls_cost_per_file
+        self.save_delay = save_delay
+        self.supports_inotify = supports_inotify
+        self.photo_bytes = photo_bytes
+        self.connected = True
+        self.camera_running = True
+        self.brightness = 128
+        self.files: dict[str, bytes] = {}  # Insertion order is mtime order
+        self._counter = 0
+        self._watchers: list = []
+        self._lock = threading.Lock()
+        for _ in range(num_photos):
+            self._add_photo(notify=False)
+
+        self._server = _FakeAdbTCPServer((host, port), _FakeAdbHandler)
+        self._server.device = self
+        self.host, self.port = self._server.server_address[:2]
+
+    def start(self) -> "FakeAdbServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.debug(f"Fake ADB server listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._close_sessions()
+
+    def _close_sessions(self) -> None:
+        with self._lock:
+            for sock in self._watchers:
+                try:
+                    # close() alone doesn't wake the handler blocked in recv():
+                    sock.shutdown(socket.SHUT_RDWR)
+                    sock.close()
+                except OSError:
+                    pass
+            self._watchers.clear()
+
+    def disconnect(self, duration: float | None = None) -> None:
+        """Simulate the device dropping off USB, optionally coming back after
+        `duration` seconds.
+        """
+        self.connected = False
+        self._close_sessions()
+        if duration is not None:
+            threading.Timer(duration, self.reconnect).start()
+
+    def reconnect(self) -> None:
+        self.connected = True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+    def _add_photo(self, notify: bool = True) -> str:
+        with self._lock:
+            self._counter += 1
+            name = f"PXL_{self._counter:06d}.jpg"
+            path = f"{self.CAMERA_DIR}/{name}"
+            self.files[path] = self.photo_bytes
+            watchers = list(self._watchers) if notify else []
+        for sock in watchers:
+            try:
+                sock.sendall(f"y\t{self.CAMERA_DIR}\t{name}\n".encode())
+            except OSError:
+                with self._lock:
+                    if sock in self._watchers:
+                        self._watchers.remove(sock)
+        return path
+
+    def _newest(self) -> str:
+        with self._lock:
+            return next(reversed(self.files), "") if self.files else ""
+
+    def _shell(self, cmd: str, sock) -> None:
+        """Run a (simulated) shell command and write its output to the socket."""
+        output = ""
+        if re.fullmatch(r"ls -t \S+ \| head -n1", cmd):
+            time.sleep(len(self.files) * self.ls_cost_per_file)
+            output = self._newest().rsplit("/", 1)[-1] + "\n"
+        elif cmd == "input keyevent KEYCODE_CAMERA":
+            if self.camera_running:
+                threading.Timer(self.save_delay, self._add_photo).start()
+        elif cmd == "echo ok":
+            output = "ok\n"
+        elif cmd.startswith("inotifyd "):
+            if not self.supports_inotify:
+                output = "/system/bin/sh: inotifyd: not found\n"
+            else:
+                with self._lock:
+                    self._watchers.append(sock)
+                while sock.recv(1):  # Keep the session open until the client leaves
+                    pass
+                return
+        elif cmd.startswith("dumpsys window"):
+            app = "com.google.android.GoogleCamera/.CameraLauncher"
+            if not self.camera_running:
+                app = "com.google.android.apps.nexuslauncher/.NexusLauncherActivity"
+            output = f"  mCurrentFocus=Window{{1a2b u0 {app}}}\n"
+        elif cmd == "settings get system screen_brightness":
+            output = f"{self.brightness}\n"
+        elif m := re.fullmatch(r"settings put system screen_brightness (\d+)", cmd):
+            self.brightness = int(m.group(1))
+        elif m := re.fullmatch(r"rm '(.+)'", cmd):
+            with self._lock:
+                self.files.pop(m.group(1), None)
+        sock.sendall(output.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    import argparse
+    import shutil
+    import statistics
+    import tempfile
+    from witmo.camera.adb_camera import AdbCamera
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark AdbCamera capture detection against a fake ADB server"
+    )
+    parser.add_argument("--photos", "-p", type=int, nargs="*", default=[100, 5000])
+    parser.add_argument("--captures", "-n", type=int, default=5)
+    args = parser.parse_args()
+
+    logger.remove()
+    output_dir = tempfile.mkdtemp(prefix="witmo_bench_")
+    try:
+        for num_photos in args.photos:
+            for use_watcher in (False, True):
+                with FakeAdbServer(num_photos=num_photos) as server:
+                    camera = AdbCamera(
+                        output_dir=output_dir,
+                        adb_port=server.port,
+                        use_watcher=use_watcher,
+                    )
+                    timings = []
+                    for _ in range(args.captures):
+                        start = time.perf_counter()
+                        camera.capture()
+                        timings.append(time.perf_counter() - start)
+                    camera.close()
+                label = "inotify watcher" if use_watcher else "ls -t polling  "
+                print(
+                    f"{num_photos:>6} photos, {label}: "
+                    f"median {statistics.median(timings) * 1000:7.1f} ms per capture "
+                    f"(incl. {server.save_delay * 1000:.0f} ms simulated save delay)"
+                )
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
@@ -0,0 +1,103 @@
+"""
+Camera app liveness check for AdbCamera
+
+Asks the device which window has the focus (`dumpsys window`), which is much cheaper than
+scanning the whole process list with `top`. The result is cached and refreshed by a
+background thread, so a capture never has to wait for the check.
+"""
+
+import threading
+import time
+from loguru import logger
+
+FOCUS_CMD = "dumpsys window | grep -E 'mCurrentFocus|mFocusedApp'"
+
+
+class CameraLiveness:
+    """Cached, proactively refreshed check whether a camera app is in the foreground.
+
+    Args:
+        device: The ADB device to query.
+        ttl: Seconds a check result is considered fresh; the background thread refreshes
+            it about twice per TTL.
+    """
+
+    def __init__(self, device, ttl: float = 2.0):
+        self.device = device
+        self.ttl = ttl
+        self._running: bool | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Timing metrics:
+        self.num_checks = 0
+        self.num_failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def check(self) -> bool:
+        """Query the device now and update the cache."""
+        start = time.perf_counter()
+        try:
+            output = self.device.shell(FOCUS_CMD)
+            running = "camera" in output.lower()
+        except Exception as e:
+            logger.warning(f"Camera liveness check failed: {e}")
+            with self._lock:
+                self.num_failures += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._running = running
+            self._checked_at = time.monotonic()
+            self.num_checks += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+        logger.trace(f"Camera liveness check took {elapsed * 1000:.1f} ms: {running}")
+        return running
+
+    def is_running(self) -> bool | None:
+        """Return the cached result without blocking; None if nothing is known yet."""
+        with self._lock:
+            if self._running is None:
+                return None
+            age = time.monotonic() - self._checked_at
+        if age > self.ttl:
+            logger.debug(f"Camera liveness result is stale ({age:.1f}s old)")
+        return self._running
+
+    def invalidate(self) -> None:
+        """Forget the cached result, e.g., after the connection changed."""
+        with self._lock:
+            self._running = None
+
+    def _refresh(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                pass  # Already logged; keep the last known result
+            self._stop.wait(self.ttl / 2)
+
+    def start(self) -> None:
+        """Start refreshing the result in a background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Return timing metrics of the checks done so far."""
+        with self._lock:
+            return {
+                "checks": self.num_checks,
+                "failures": self.num_failures,
+                "avg_ms": (self.total_time / self.num_checks * 1000)
+                if self.num_checks
+                else 0.0,
+                "max_ms": self.max_time * 1000,
+            }
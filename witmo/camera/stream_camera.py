@@ -0,0 +1,288 @@
+"""
+Stream camera module for Witmo
+
+Instead of taking a photo per capture (shutter, save to DCIM, detect, pull), this camera
+keeps a low-resolution live stream running and decodes it into a small ring buffer of
+recent frames. A capture just grabs the latest frame, so it returns almost instantly.
+
+Frame sources:
+- AdbScreenrecordSource: streams the device's screen (i.e., the camera app's viewfinder)
+  via `screenrecord` H.264 over an ADB exec channel, decoded by an `ffmpeg` process.
+- VideoFileSource: plays a local video file in a loop, standing in for the device.
+
+A photo camera such as AdbCamera can be attached; it then takes care of the device
+(screen on, brightness) and can optionally take a full-resolution photo in the background
+on every capture, which ends up in the history directory like any other capture.
+"""
+
+import collections
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Iterator, Protocol
+import cv2
+import numpy as np
+from loguru import logger
+from witmo.image import BasicImage
+from .adb_connection import CONNECTION_ERRORS, AdbConnection
+from .burst import pick_sharpest
+from .camera_protocol import CameraError, CameraProtocol
+
+
+class FrameSource(Protocol):
+    def frames(self) -> Iterator[np.ndarray]: ...
+    def close(self) -> None: ...
+
+
+class VideoFileSource(FrameSource):
+    """Plays a local video file in a loop at its native frame rate."""
+
+    def __init__(self, path: str):
+        if not os.path.isfile(path):
+            raise ValueError(f"Video file does not exist: {path}")
+        self.path = path
+        self._closed = False
+
+    def frames(self) -> Iterator[np.ndarray]:
+        while not self._closed:
+            cap = cv2.VideoCapture(self.path)
+            if not cap.isOpened():
+                raise CameraError(f"Could not open video file: {self.path}")
+            interval = 1 / (cap.get(cv2.CAP_PROP_FPS) or 30)
+            try:
+                while not self._closed:
+                    ok, frame = cap.read()
+                    if not ok:
+                        break  # End of file, start over
+                    yield frame
+                    time.sleep(interval)
+            finally:
+                cap.release()
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class AdbScreenrecordSource(FrameSource):
+    """Streams the device screen via `screenrecord` and decodes it with `ffmpeg`.
+
+    Follows the connection: when it reconnects (or fails over to another device), the
+    stream is restarted on the new device.
+    """
+
+    def __init__(
+        self, connection: AdbConnection, max_size: int = 1280, bit_rate: int = 4_000_000
+    ):
+        if not shutil.which("ffmpeg"):
+            raise CameraError("Streaming from the device requires ffmpeg on the PATH.")
+        self.connection = connection
+        self.bit_rate = bit_rate
+        self.width, self.height = self._stream_size(max_size)
+        self._ffmpeg: subprocess.Popen | None = None
+        self._conn = None
+        self._closed = False
+        connection.on_reconnect(self._on_reconnect)
+
+    def _stream_size(self, max_size: int) -> tuple[int, int]:
+        """Scale the screen size so the long side is max_size, in multiples of 16."""
+        output = self.connection.shell("wm size").strip()  # "Physical size: 1080x2400"
+        w, h = (int(v) for v in output.rsplit(" ", 1)[-1].split("x"))
+        scale = min(1.0, max_size / max(w, h))
+        return int(w * scale) // 16 * 16, int(h * scale) // 16 * 16
+
+    def _pump(self) -> None:
+        """Feed the H.264 stream into ffmpeg; restart screenrecord at its time limit."""
+        assert self._ffmpeg is not None and self._ffmpeg.stdin is not None
+        cmd = (
+            f"exec:screenrecord --output-format=h264 --size {self.width}x{self.height} "
+            f"--bit-rate {self.bit_rate} -"
+        )
+        try:
+            while not self._closed:
+                generation = self.connection.generation
+                try:
+                    self._conn = self.connection.device.create_connection()
+                    self._conn.send(cmd)
+                    while not self._closed:
+                        chunk = self._conn.read(65536)
+                        if not chunk:
+                            break
+                        self._ffmpeg.stdin.write(chunk)
+                    self._conn.close()
+                except BrokenPipeError:
+                    break  # ffmpeg is gone
+                except CONNECTION_ERRORS as e:
+                    if self._closed:
+                        break
+                    logger.warning(f"Screen stream interrupted ({e}), reconnecting...")
+                    self.connection.reconnect(generation)
+        except Exception as e:
+            if not self._closed:
+                logger.error(f"Screen stream failed: {e}")
+        finally:
+            self._ffmpeg.stdin.close()
+
+    def _on_reconnect(self, device) -> None:
+        """End the stream from the old device; the pump restarts it on the new one."""
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def frames(self) -> Iterator[np.ndarray]:
+        self._ffmpeg = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-flags", "low_delay", "-f", "h264"]
+            + ["-i", "pipe:0", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        threading.Thread(target=self._pump, daemon=True).start()
+        assert self._ffmpeg.stdout is not None
+        frame_size = self.width * self.height * 3
+        while not self._closed:
+            data = self._ffmpeg.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            yield np.frombuffer(data, np.uint8).reshape(self.height, self.width, 3)
+
+    def close(self) -> None:
+        self._closed = True
+        if self._conn is not None:
+            self._conn.close()
+        if self._ffmpeg is not None:
+            self._ffmpeg.kill()
+
+
+class StreamCamera(CameraProtocol):
+    """Captures the latest frame from a continuously decoded stream.
+
+    Args:
+        source: Where the frames come from.
+        output_dir: Directory where captured frames are archived.
+        buffer_size: Number of recent frames kept in the ring buffer.
+        photo_camera: Optional camera that manages the device and can take photos.
+        fetch_full_res: Whether to also take a full-resolution photo in the background
+            on every capture (requires photo_camera).
+        burst_size: Number of most recent frames to pick the sharpest one from.
+    """
+
+    FIRST_FRAME_TIMEOUT = 10  # Seconds
+
+    def __init__(
+        self,
+        source: FrameSource,
+        output_dir: str = "captures",
+        buffer_size: int = 8,
+        photo_camera: CameraProtocol | None = None,
+        fetch_full_res: bool = False,
+        burst_size: int = 1,
+    ):
+        self.source = source
+        self.output_dir = output_dir
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+            logger.info(f"Created directory: {self.output_dir}")
+        self.photo_camera = photo_camera
+        if fetch_full_res and photo_camera is None:
+            raise ValueError("Fetching full-resolution photos requires a photo camera")
+        self.fetch_full_res = fetch_full_res
+        if not 1 <= burst_size <= buffer_size:
+            raise ValueError("Burst size must be between 1 and the buffer size")
+        self.burst_size = burst_size
+        self._frames: collections.deque[tuple[float, np.ndarray]] = collections.deque(
+            maxlen=buffer_size
+        )
+        self._first_frame = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _run(self) -> None:
+        try:
+            for frame in self.source.frames():
+                self._frames.append((time.monotonic(), frame))
+                self._first_frame.set()
+        except Exception as e:
+            logger.error(f"Frame stream stopped: {e}")
+
+    def start(self) -> None:
+        """Start decoding the stream into the ring buffer."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def latest_frame(self) -> np.ndarray:
+        """Return the most recent frame (or the sharpest of the most recent
+        `burst_size` frames), waiting for the stream to start if needed."""
+        self.start()
+        if not self._first_frame.wait(self.FIRST_FRAME_TIMEOUT):
+            raise CameraError("Timed out waiting for the first frame of the stream.")
+        recent = list(self._frames)[-self.burst_size :]
+        best = pick_sharpest([f for _, f in recent]) if len(recent) > 1 else -1
+        timestamp, frame = recent[best]
+        logger.debug(f"Picked frame is {time.monotonic() - timestamp:.3f}s old")
+        return frame
+
+    def _capture_full_res(self) -> None:
+        assert self.photo_camera is not None
+        try:
+            image = self.photo_camera.capture()
+            logger.info(f"Full-resolution photo captured: {image}")
+        except Exception as e:
+            logger.warning(f"Full-resolution photo failed: {e}")
+
+    def capture(self) -> BasicImage:
+        """Return the latest stream frame as a BasicImage."""
+        frame = self.latest_frame()
+        if self.fetch_full_res:
+            threading.Thread(target=self._capture_full_res, daemon=True).start()
+        ok, buf = cv2.imencode(".jpg", frame)
+        if not ok:
+            raise CameraError("Could not encode stream frame.")
+        image = BasicImage.create_with_timestamp(
+            self.output_dir, prefix="stream", data=buf.tobytes()
+        )
+        image.memoize("array", lambda: frame)  # No need to decode it again later
+        image.save_in_background()
+        return image
+
+    def __enter__(self):
+        if self.photo_camera is not None:
+            self.photo_camera.__enter__()
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.source.close()
+        if self.photo_camera is not None:
+            self.photo_camera.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Capture frames from a video file using StreamCamera"
+    )
+    parser.add_argument("video", type=str, help="video file standing in for the device")
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        default="captures",
+        help="output directory for captured frames",
+    )
+    parser.add_argument("--captures", "-n", type=int, default=5)
+
+    args = parser.parse_args()
+
+    with StreamCamera(VideoFileSource(args.video), args.output) as camera:
+        for _ in range(args.captures):
+            start = time.perf_counter()
+            image = camera.capture()
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"Frame captured in {elapsed:.1f} ms: {image.path}")
+            time.sleep(0.5)
@@ -1,58 +1,50 @@
 """
 Image abstractions for Witmo.
 
-Defines the LLM-compatible Image protocol, BasicImage (file-backed), and CroppedImage
-(auto-crops to TV/screen using YOLOv8).
+Defines the LLM-compatible Image protocol, BasicImage (file-backed, optionally holding
+its bytes in memory), and CroppedImage (auto-crops to TV/screen, see
+screen_detection.py).
+
+Both are CachedImages: each image is decoded at most once, and derived artifacts (decoded
+array, crop rectangle, resized and encoded variants) are memoized in a bounded LRU cache
+shared across recent images, so 12 MP captures don't get decoded again and again.
 
 Provides preview and base64 encoding utilities for image handling and LLM input.
 """
 
-from typing import Protocol
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Protocol
 from loguru import logger
+import itertools
 import os
 import datetime
-import numpy as np
 import base64
 import threading
-import cv2
+from witmo.lazy import lazy_import
 
-# FIXME The way BasicImage and CroppedImage is architected is a bit of a mess?
+# Loaded on first use, so text-only sessions don't pay for them:
+np = lazy_import("numpy")
+cv2 = lazy_import("cv2")
 
 def preview_image_array(
-    img: np.ndarray, seconds=5, preview_width=400, window_name="Witmo Capture"
+    img: np.ndarray | Callable[[], np.ndarray],
+    seconds=5,
+    preview_width=400,
+    window_name="Witmo Capture",
 ):
-    """Show a NumPy image array in a resizable OpenCV window (non-blocking)."""
-
-    def _show():
-        try:
-            h, w = img.shape[:2]
-            if w > preview_width:
-                scale = preview_width / w
-                win_w = int(w * scale)
-                win_h = int(h * scale)
-            else:
-                win_w, win_h = w, h
-
-            logger.debug(
-                f"Image loaded. Displaying window at {win_w}x{win_h}, image is {w}x{h}."
-            )
+    """Show a NumPy image array in a resizable OpenCV window (non-blocking).
 
-            cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-            cv2.resizeWindow(window_name, win_w, win_h)
-            cv2.imshow(window_name, img)
-            try:
-                cv2.setWindowProperty(window_name, cv2.WND_PROP_TOPMOST, 1)
-            except Exception as e:
-                logger.debug(f"Could not set window as topmost: {e}")
-            cv2.waitKey(1)
-            logger.debug(f"Image window should now be visible for {seconds} seconds.")
-            cv2.waitKey(seconds * 1000)
-            cv2.destroyAllWindows()
-            logger.debug(f"Image window closed.")
-        except Exception as e:
-            logger.warning(f"Could not display image: {e}")
+    `img` may also be a function returning the array, to resize (or otherwise derive)
+    the array on the preview worker instead of the calling thread.
+    """
+    from witmo.preview import get_preview_worker
 
-    threading.Thread(target=_show, daemon=True).start()
+    get_preview_worker().submit(
+        img, seconds=seconds, preview_width=preview_width, window_name=window_name
+    )
 
 
 class Image(Protocol):
@@ -65,73 +57,328 @@ class Image(Protocol):
         ...
 
 
-class BasicImage(Image):
-    """Value object representing a captured image file."""
+def _artifact_size(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 64  # Small values like tuples
 
-    def __init__(self, path: str):
-        self.path = path
 
-    def __str__(self):
-        return self.path
+class ArtifactCache:
+    """Bounded LRU cache for per-image artifacts, keyed by (image key, artifact name).
+
+    Evicts the least recently used artifacts once their total size exceeds max_bytes.
+    The default holds the decoded arrays and derived artifacts of the last few 12 MP
+    captures (about 36 MB decoded each).
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[int, str], tuple[object, int]] = OrderedDict()
+        self._size = 0
+        self._pending: dict[tuple[int, str], Future] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key: tuple[int, str], factory: Callable):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            # Several threads (preview, speculation, request) may want the same artifact
+            # at once; only the first one creates it, the others wait for it:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.hits += 1
+            else:
+                self._pending[key] = Future()
+        if pending is not None:
+            return pending.result()
+
+        # Create outside the lock, some factories are slow (decoding, detection):
+        try:
+            value = factory()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key).set_exception(e)
+            raise
+        size = _artifact_size(value)
+        with self._lock:
+            self.misses += 1
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+            self._pending.pop(key).set_result(value)
+        return value
+
+    def discard(self, image_key: int) -> None:
+        """Drop all artifacts of one image."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == image_key]:
+                self._size -= self._entries.pop(key)[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        """Return hit/miss counts and the current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "artifacts": len(self._entries),
+                "mb": self._size / (1024 * 1024),
+            }
+
+
+artifact_cache = ArtifactCache()
+_image_keys = itertools.count()
+
+
+class CachedImage(Image, ABC):
+    """Base class for images that decode once and memoize derived artifacts."""
+
+    preview_window_name = "Witmo Capture"
+
+    def __init__(self):
+        self._key = next(_image_keys)
+
+    def memoize(self, name: str, factory: Callable):
+        """Return the artifact `name` of this image, creating it if needed."""
+        return artifact_cache.get_or_create((self._key, name), factory)
+
+    @property
+    @abstractmethod
+    def array(self) -> np.ndarray:
+        """The decoded image (BGR). Treat as read-only, it's shared."""
+
+    def resized(self, max_width: int) -> np.ndarray:
+        """Return the image downscaled to at most max_width pixels wide."""
+
+        def _resize():
+            img = self.array
+            h, w = img.shape[:2]
+            if w <= max_width:
+                return img
+            size = (max_width, round(h * max_width / w))
+            return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+        return self.memoize(f"resized_{max_width}", _resize)
+
+    def encode(self, ext: str = ".jpg") -> bytes:
+        """Return the image encoded in the given format."""
+
+        def _encode():
+            ok, buf = cv2.imencode(ext, self.array)
+            if not ok:
+                raise ValueError(f"Could not encode image as {ext}")
+            return buf.tobytes()
+
+        return self.memoize(f"encoded{ext}", _encode)
+
+    def dhash(self) -> int:
+        """Return a 64-bit perceptual difference hash; near-identical images have
+        hashes with a small Hamming distance.
+        """
+
+        def _dhash():
+            small = cv2.resize(self.resized(320), (9, 8), interpolation=cv2.INTER_AREA)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+            return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+        return self.memoize("dhash", _dhash)
 
     def to_base64(self) -> str:
         """Return base64-encoded contents of this image."""
-        with open(self.path, "rb") as f:
-            return base64.b64encode(f.read()).decode("utf-8")
+        return self.memoize(
+            "base64", lambda: base64.b64encode(self.encode()).decode("utf-8")
+        )
 
     def preview(self, seconds=5, preview_width=400):
-        """Preview the image file using OpenCV."""
-        img = cv2.imread(self.path)
-        preview_image_array(img, seconds=seconds, preview_width=preview_width, window_name="Witmo Capture")
+        """Preview the image using OpenCV. Only downscaling (and for cropped images,
+        rectifying the screen if that wasn't done yet) runs on the preview worker; a
+        CroppedImage's screen detection already ran when it was created.
+        """
+        preview_image_array(
+            lambda: self.resized(preview_width),
+            seconds=seconds,
+            preview_width=preview_width,
+            window_name=self.preview_window_name,
+        )
+
+
+class BasicImage(CachedImage):
+    """Value object representing a captured image file.
+
+    If `data` is given, the image's bytes are held in memory and the file at `path` is
+    only the archive copy, which doesn't need to exist (yet). Otherwise, the file is
+    read (once) when the bytes are first needed.
+    """
+
+    def __init__(self, path: str, data: bytes | None = None):
+        super().__init__()
+        self.path = path
+        self._data = data
+        self._save_thread: threading.Thread | None = None
+
+    def __str__(self):
+        return self.path
+
+    def read_bytes(self) -> bytes:
+        """Return the raw (encoded) bytes of this image."""
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+        return self._data
+
+    @property
+    def array(self) -> np.ndarray:
+        def _decode():
+            buf = np.frombuffer(self.read_bytes(), np.uint8)
+            return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+        return self.memoize("array", _decode)
+
+    def encode(self, ext: str = ".jpg") -> bytes:
+        """Return the image encoded in the given format; the original bytes if the
+        format matches, so the capture isn't re-encoded.
+        """
+        if ext.lower() in (".jpg", ".jpeg") and self.read_bytes()[:2] == b"\xff\xd8":
+            return self.read_bytes()
+        return super().encode(ext)
+
+    def save_in_background(self) -> None:
+        """Write the in-memory bytes to `path` without blocking the caller.
+
+        The writer thread is not a daemon, so pending writes finish before exit.
+        """
+        if self._data is None:
+            return
+
+        def _save(data: bytes):
+            try:
+                with open(self.path, "wb") as f:
+                    f.write(data)
+                logger.debug(f"Image saved to {self.path}")
+            except Exception as e:
+                logger.error(f"Could not save image to {self.path}: {e}")
+
+        self._save_thread = threading.Thread(target=_save, args=(self._data,))
+        self._save_thread.start()
+
+    def discard_saved(self) -> None:
+        """Delete the copy written by save_in_background (once it's written), e.g.,
+        for a capture that isn't used. Images that weren't saved that way (such as
+        existing files) are left alone.
+        """
+        save_thread = self._save_thread
+        if save_thread is None:
+            return
+
+        def _discard():
+            save_thread.join()
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.debug(f"Could not delete {self.path}: {e}")
+
+        threading.Thread(target=_discard, daemon=True).start()
+
+    def wait_saved(self) -> None:
+        """Block until a pending background save has finished."""
+        if self._save_thread is not None:
+            self._save_thread.join()
+
+    _last_timestamp = datetime.datetime.min
+    _timestamp_lock = threading.Lock()
 
     @classmethod
-    def create_with_timestamp(cls, output_dir: str, prefix: str = "cap") -> "BasicImage":
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    def create_with_timestamp(
+        cls, output_dir: str, prefix: str = "cap", data: bytes | None = None
+    ) -> "BasicImage":
+        """Create an image with a unique, timestamped filename (microsecond resolution;
+        if the clock hasn't advanced, bumped past the last one handed out).
+        """
+        with BasicImage._timestamp_lock:
+            now = datetime.datetime.now()
+            if now <= BasicImage._last_timestamp:
+                now = BasicImage._last_timestamp + datetime.timedelta(microseconds=1)
+            BasicImage._last_timestamp = now
+        timestamp = now.strftime("%Y%m%d_%H%M%S_%f")
         filename = os.path.join(output_dir, f"{prefix}_{timestamp}.jpg")
-        return cls(filename)
+        return cls(filename, data=data)
 
 
-class CroppedImage(Image):
+class CroppedImage(CachedImage):
     """Represents a cropped version of a BasicImage, held in memory. Initiator will crop
     to tv /screen region automatically.
+
+    The screen region is memoized on the source image. If the detector found the
+    screen's corners, the screen is warped to a rectified rectangle; otherwise the
+    cropped array is a view into the source's decoded array.
     """
-    _yolo_model = None  # Lazy-load YOLO model
-    _tv_class_id = 62  # COCO class ID for 'tvmonitor'
+    detector = None  # Lazy-created YoloScreenDetector unless set by the session
+
+    preview_window_name = "Witmo Cropped Capture"
 
     def __init__(self, source_image: BasicImage):
+        super().__init__()
         self.source_image = source_image
-        img = cv2.imread(source_image.path)
-        self.crop_rect = self._find_tv_screen(img)
+        self.region = source_image.memoize(
+            "screen_region", lambda: self._find_tv_screen(source_image.array)
+        )
+        self.crop_rect = self.region.rect
+
+    @property
+    def array(self) -> np.ndarray:
+        if self.region.corners is not None:
+            return self.memoize("rectified", self._rectify)
         x, y, w, h = self.crop_rect
-        self._cropped_array = img[y:y+h, x:x+w]
+        return self.source_image.array[y : y + h, x : x + w]
 
-    def _find_tv_screen(self, img):
-        """Use YOLOv8 to detect the TV/screen region. Returns (x, y, w, h) of the first
-        detected TV, or full image if not found.
-        """
-        logger.debug("Finding screen...")
+    def _rectify(self) -> np.ndarray:
+        corners = np.array(self.region.corners, np.float32)
+        tl, tr, br, bl = corners
+        w = round(max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl)))
+        h = round(max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr)))
+        target = np.array([(0, 0), (w - 1, 0), (w - 1, h - 1), (0, h - 1)], np.float32)
+        matrix = cv2.getPerspectiveTransform(corners, target)
+        return cv2.warpPerspective(self.source_image.array, matrix, (w, h))
+
+    @classmethod
+    def get_detector(cls):
+        if cls.detector is None:
+            from witmo.screen_detection import YoloScreenDetector
 
-        if CroppedImage._yolo_model is None:    # Lazy-load YOLO and model
-            from ultralytics import YOLO
+            cls.detector = YoloScreenDetector()
+        return cls.detector
 
-            logger.debug("Loading YOLOv8 model for the first time...")
-            CroppedImage._yolo_model = YOLO("yolov8n.pt")
+    def _find_tv_screen(self, img):
+        """Detect the TV/screen region. Returns the detected ScreenRegion, or one
+        covering the full image if not found.
+        """
+        from witmo.screen_detection import ScreenRegion
 
-        results = CroppedImage._yolo_model(img, verbose=False)
-        for r in results:
-            for b in r.boxes:
-                if int(b.cls[0]) == self._tv_class_id:
-                    x1, y1, x2, y2 = b.xyxy[0].cpu().numpy().astype(int)
-                    logger.debug(f"Found TV at {x1}, {y1}, {x2}, {y2}")
-                    return (x1, y1, x2 - x1, y2 - y1)
+        logger.debug("Finding screen...")
+        region = self.get_detector().detect(img)
+        if region is not None:
+            logger.debug(f"Found TV at {region.rect}")
+            return region
         # Fallback: full image:
         h, w = img.shape[:2]
         logger.debug("No TV found, using full image.")
-        return (0, 0, w, h)
-
-    def preview(self, seconds=5, preview_width=400):
-        preview_image_array(self._cropped_array, seconds=seconds, preview_width=preview_width, window_name="Witmo Cropped Capture")
-
-    def to_base64(self) -> str:
-        _, buf = cv2.imencode('.jpg', self._cropped_array)
-        return base64.b64encode(buf.tobytes()).decode("utf-8")
+        return ScreenRegion((0, 0, w, h))
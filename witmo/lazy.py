@@ -0,0 +1,45 @@
+"""
+Lazy imports for Witmo's heavy dependencies.
+
+`cv2 = lazy_import("cv2")` binds a stand-in module that imports the real one on first
+attribute access, so e.g. a text-only session never loads OpenCV. Modules using this
+should have `from __future__ import annotations`, so annotations like `np.ndarray` don't
+trigger the import at definition time.
+"""
+
+import importlib
+import sys
+import time
+import types
+from loguru import logger
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            already_loaded = self.__name__ in sys.modules
+            start = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            if not already_loaded:
+                elapsed = (time.perf_counter() - start) * 1000
+                logger.debug(f"Imported {self.__name__} on first use in {elapsed:.0f} ms")
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Return a proxy for the module `name` that imports it on first use."""
+    return LazyModule(name)
@@ -1,38 +1,131 @@
-import sys
+import threading
+from dataclasses import dataclass
 from loguru import logger
-from witmo.image import Image
+from witmo.image import CachedImage, Image
 from .history import History
+from .models import ContextBudget, ImageBudget, Provider
+from .response_cache import ResponseCache, hash_text
 
 
-def generate_completion(
+@dataclass
+class PreparedRequest:
+    """Everything needed to send one request and record its response."""
+
+    question: str
+    model: str
+    system_prompt: str
+    messages: list[dict]
+    user_message: dict
+    image_hash: int | None = None
+    cached: str | None = None
+    cache_key: str | None = None  # Routes requests with the same prefix to one cache
+    provider: Provider = Provider()
+
+    def api_options(self) -> dict:
+        """Arguments for chat.completions.create: stream, and report the usage (incl.
+        the tokens read from the provider's prompt cache) at the end, as far as the
+        provider supports it.
+        """
+        options = {"model": self.model, "messages": self.messages, "stream": True}
+        if self.provider.stream_usage:
+            options["stream_options"] = {"include_usage": True}
+        if self.provider.prompt_cache_key:
+            options["prompt_cache_key"] = self.cache_key
+        return options
+
+
+@dataclass
+class Usage:
+    """Token usage of one response, as reported by the API."""
+
+    prompt_tokens: int = 0
+    cached_tokens: int = 0  # Of the prompt tokens, read from the prompt cache
+    completion_tokens: int = 0
+
+    @classmethod
+    def from_api(cls, usage) -> "Usage":
+        details = getattr(usage, "prompt_tokens_details", None)
+        return cls(
+            usage.prompt_tokens or 0,
+            getattr(details, "cached_tokens", 0) or 0,
+            usage.completion_tokens or 0,
+        )
+
+    def __str__(self):
+        share = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0
+        return (
+            f"{self.prompt_tokens} prompt tokens ({self.cached_tokens} cached, "
+            f"{share:.0%}), {self.completion_tokens} completion tokens"
+        )
+
+
+class UsageStats:
+    """Token usage summed over the responses of a session. Thread-safe."""
+
+    def __init__(self):
+        self.total = Usage()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage: Usage) -> None:
+        with self._lock:
+            self.requests += 1
+            self.total = Usage(
+                self.total.prompt_tokens + usage.prompt_tokens,
+                self.total.cached_tokens + usage.cached_tokens,
+                self.total.completion_tokens + usage.completion_tokens,
+            )
+
+    @property
+    def cached_share(self) -> float:
+        """Share of the prompt tokens that were read from the prompt cache."""
+        total = self.total
+        return total.cached_tokens / total.prompt_tokens if total.prompt_tokens else 0.0
+
+
+def prepare_request(
     question: str,
     *,
     image: Image | None = None,
     history: History | None = None,
     model: str = "o3",
+    provider: Provider | None = None,
     system_prompt: str | None = None,
-) -> str:
+    image_budget: ImageBudget | None = None,
+    context_budget: ContextBudget | None = None,
+    cache: ResponseCache | None = None,
+    refresh: bool = False,
+) -> PreparedRequest:
     """
-    Handles message marshalling for both text and image+text completions, calls LLM, updates history.
+    Handles message marshalling for both text and image+text completions.
+    Images are resized and re-encoded to fit `image_budget` (defaults to ImageBudget()).
+    The history is packed into `context_budget` (defaults to ContextBudget()).
+    The request goes to `provider` (defaults to OpenAI).
+    Image requests are answered from `cache` if a near-duplicate image was asked the same
+    before, unless `refresh` is set (see `cached`).
     """
     logger.info(f"Sending message to LLM... (image={'yes' if image else 'no'})")
     logger.info(f"Request: {question}")
 
+    messages = []
     if system_prompt:
-        messages = [{"role": "system", "content": system_prompt}]
+        messages.append({"role": "system", "content": system_prompt})
 
     if history:
-        messages.extend(history.last(10))
+        messages.extend(history.context(context_budget, image_budget))
 
     # Prepare user message:
     if image:
+        from .image_encoding import encode_for_model  # Needs OpenCV
+
+        encoded = encode_for_model(image, image_budget or ImageBudget())
         user_message = {
             "role": "user",
             "content": [
                 {"type": "text", "text": question},
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image.to_base64()}"},
+                    "image_url": {"url": encoded.to_data_url()},
                 },
             ],
         }
@@ -41,23 +134,41 @@ def generate_completion(
 
     messages.append(user_message)
 
-    # Call OpenAI model:
-    if "openai_client" not in sys.modules:
-        from .openai_client import openai_client
-    response = openai_client.chat.completions.create(
-        model=model,
-        messages=messages,  # type: ignore
+    request = PreparedRequest(
+        question, model, system_prompt or "", messages, user_message
     )
-    content = response.choices[0].message.content
-    if not content:
-        logger.error("Received empty response from LLM.")
-        content = "<<no response>>"
+    request.provider = provider or Provider()
+    # The system prompt (and the history after it) is the prefix requests share:
+    request.cache_key = hash_text(f"{model}\n{request.system_prompt}")
+    if cache is not None and isinstance(image, CachedImage):
+        request.image_hash = image.dhash()
+        if not refresh:
+            request.cached = cache.lookup(
+                request.image_hash, question, model, request.system_prompt
+            )
+    return request
+
+
+def record_response(
+    request: PreparedRequest,
+    content: str,
+    history: History | None = None,
+    cache: ResponseCache | None = None,
+) -> None:
+    """Add a complete response to the history and the response cache."""
+    if cache is not None and request.image_hash is not None and request.cached is None:
+        cache.store(
+            request.image_hash,
+            request.question,
+            request.model,
+            request.system_prompt,
+            content,
+        )
 
     if history is not None:
         logger.debug(f"Adding interaction to history")
-        history.append(user_message)
-        history.append({"role": "assistant", "content": content})
+        history.extend(
+            [request.user_message, {"role": "assistant", "content": content}]
+        )
     else:
         logger.debug("No history provided, skipping history update.")
-
-    return content
@@ -0,0 +1,306 @@
+"""
+Token-budget-aware context for LLM requests.
+
+Instead of a fixed number of history messages, the context is packed by size: whole
+turns (a question with its answers), most recent first, as long as their estimated
+tokens fit the model's ContextBudget. Turns that don't fit anymore are summarized into
+a rolling digest (a question/answer line each), which is sent as a system message in
+front of them. The digest lives in `history/<game>/context_digest.json`; it keeps the
+most recent summaries that fit `ContextBudget.digest_tokens`. Each budget drops
+different turns, so models with another budget (e.g., when fanning out) get their own
+digest file (see digest_file_name).
+
+The layout is kept friendly to the provider's prompt caching, which reuses the longest
+previously seen prefix of a request: a ContextWindow remembers where the context starts
+and how each image in it was resolved. New turns are appended to the same start until
+the budget is exceeded; only then is the context repacked (to ContextBudget.refill of
+the budget) and the digest changes. So between repacks, the system prompt, the digest
+and the older turns are byte-identical from request to request.
+
+Tokens are estimated locally: about 4 characters per token for text, and for images
+what their resolution (see ImageContextPolicy) costs with OpenAI's tiling.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from loguru import logger
+from .image_store import OMITTED_IMAGE_NOTE, BlobStore
+from .models import ContextBudget, ImageBudget, ImageContextPolicy
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators of each message
+LOW_DETAIL_IMAGE_TOKENS = 85
+DIGEST_HEADER = "Summary of the earlier conversation (oldest first):"
+
+
+def estimate_text_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def _full_image_tokens(budget: ImageBudget) -> int:
+    from .image_encoding import estimate_image_tokens  # Needs OpenCV
+
+    return estimate_image_tokens(budget.max_long_side, budget.max_short_side)
+
+
+def split_turns(messages: list[dict]) -> list[list[dict]]:
+    """Group messages into turns: a user message and the messages up to the next one."""
+    turns: list[list[dict]] = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _text_parts(message: dict) -> list[str]:
+    content = message.get("content")
+    if isinstance(content, str):
+        return [content]
+    return [part.get("text", "") for part in content if part.get("type") == "text"]
+
+
+def _image_urls(message: dict) -> list[str]:
+    content = message.get("content")
+    if isinstance(content, str):
+        return []
+    return [p["image_url"]["url"] for p in content if p.get("type") == "image_url"]
+
+
+class ContextWindow:
+    """Where the context started in the last request, and how its images were
+    resolved (see ImageContextPolicy.max_side), to send the same prefix again.
+    """
+
+    def __init__(self):
+        self.first_turn: str | None = None  # turn_hash of the first turn
+        self.image_sides: dict[str, int | None] = {}
+
+    def reset(self) -> None:
+        self.first_turn = None
+        self.image_sides = {}
+
+
+class TurnCosts:
+    """Estimates the tokens of turns, with images counted by their rank from the most
+    recent one, as the image policy resolves them (or as given in `sides`).
+    """
+
+    def __init__(
+        self,
+        policy: ImageContextPolicy,
+        image_budget: ImageBudget,
+        sides: dict[str, int | None] | None = None,
+    ):
+        self.policy = policy
+        self.image_budget = image_budget
+        self.sides = sides
+        self._full_tokens: int | None = None
+        self.images_seen = 0
+
+    def _image_tokens(self, url: str) -> int:
+        self.images_seen += 1
+        max_side = self.policy.max_side(self.images_seen)
+        if self.sides is not None:
+            max_side = self.sides.setdefault(url, max_side)
+        if max_side == 0:
+            if self._full_tokens is None:
+                self._full_tokens = _full_image_tokens(self.image_budget)
+            return self._full_tokens
+        if max_side is not None:
+            return LOW_DETAIL_IMAGE_TOKENS
+        return estimate_text_tokens(OMITTED_IMAGE_NOTE)
+
+    def of(self, turn: list[dict]) -> int:
+        """Tokens of a turn; call for turns from the most recent to the oldest."""
+        tokens = 0
+        for message in reversed(turn):
+            tokens += MESSAGE_OVERHEAD_TOKENS
+            tokens += sum(estimate_text_tokens(text) for text in _text_parts(message))
+            tokens += sum(self._image_tokens(url) for url in _image_urls(message))
+        return tokens
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    return text if len(text) <= max_chars else text[: max_chars - 1].rstrip() + "…"
+
+
+def summarize_turn(turn: list[dict]) -> str:
+    """A one-line summary of a turn for the digest."""
+    question = " ".join(_text_parts(turn[0])) if turn[0].get("role") == "user" else ""
+    answers = [m for m in turn if m.get("role") == "assistant"]
+    answer = " ".join(text for message in answers for text in _text_parts(message))
+    screenshot = " (with screenshot)" if any(_image_urls(m) for m in turn) else ""
+    return f"- Q{screenshot}: {_shorten(question, 160)} A: {_shorten(answer, 320)}"
+
+
+def turn_hash(turn: list[dict]) -> str:
+    data = json.dumps(turn, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def digest_file_name(budget: ContextBudget) -> str:
+    """The digest file of a budget; the default budget's is `context_digest.json`."""
+    if budget == ContextBudget():
+        return "context_digest.json"
+    return (
+        f"context_digest.{budget.max_tokens}-{budget.digest_tokens}-"
+        f"{budget.max_turns}-{budget.refill:g}.json"
+    )
+
+
+class ContextDigest:
+    """Rolling digest of the turns that dropped out of the context, persisted next to
+    the history.
+    """
+
+    def __init__(self, file_location: str, file_name: str = "context_digest.json"):
+        self.file_path = os.path.join(file_location, file_name)
+        self.entries: list[dict] = []  # {"hash": ..., "summary": ...}, oldest first
+        self._lock = threading.Lock()  # Requests are prepared concurrently
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                self.entries = [
+                    {"hash": entry["hash"], "summary": entry["summary"]}
+                    for entry in json.load(f)
+                ]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.warning(f"Context digest file was corrupted, starting empty: {e}")
+            self.entries = []
+
+    def save(self) -> None:
+        tmp_path = self.file_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.file_path)
+        except Exception as e:
+            logger.error(f"Error saving context digest: {str(e)}")
+
+    def update(self, turns: list[list[dict]], max_tokens: int) -> None:
+        """Add the turns (oldest first) newer than the newest one in the digest, then
+        drop the oldest summaries until the digest fits.
+        """
+        with self._lock:
+            known = {entry["hash"] for entry in self.entries}
+            hashes = [turn_hash(turn) for turn in turns]
+            # Older turns were either added before or dropped to make room:
+            known_indices = [i for i, digest in enumerate(hashes) if digest in known]
+            first_new = known_indices[-1] + 1 if known_indices else 0
+            added = False
+            for turn, digest in zip(turns[first_new:], hashes[first_new:]):
+                if digest not in known:
+                    summary = summarize_turn(turn)
+                    self.entries.append({"hash": digest, "summary": summary})
+                    known.add(digest)
+                    added = True
+            dropped = False
+            while self.entries and self.tokens() > max_tokens:
+                self.entries.pop(0)
+                dropped = True
+            if added or dropped:
+                self.save()
+
+    def tokens(self, exclude: set[str] = frozenset()) -> int:
+        summaries = [e["summary"] for e in self.entries if e["hash"] not in exclude]
+        if not summaries:
+            return 0
+        return MESSAGE_OVERHEAD_TOKENS + estimate_text_tokens(
+            DIGEST_HEADER + "\n" + "\n".join(summaries)
+        )
+
+    def message(self, exclude: set[str] = frozenset()) -> dict | None:
+        """The digest as a system message, without the turns in `exclude` (which are
+        sent in full).
+        """
+        summaries = [e["summary"] for e in self.entries if e["hash"] not in exclude]
+        if not summaries:
+            return None
+        return {"role": "system", "content": DIGEST_HEADER + "\n" + "\n".join(summaries)}
+
+
+def _pack(
+    turns: list[list[dict]], costs: TurnCosts, max_tokens: float, max_turns: int
+) -> tuple[int, int]:
+    """Number and tokens of the most recent turns that fit."""
+    used = 0
+    num_kept = 0
+    for turn in reversed(turns):
+        if num_kept >= max_turns:
+            break
+        cost = costs.of(turn)
+        if used + cost > max_tokens:
+            break
+        used += cost
+        num_kept += 1
+    return num_kept, used
+
+
+def build_context(
+    messages: list[dict],
+    budget: ContextBudget,
+    policy: ImageContextPolicy,
+    blobs: BlobStore,
+    digest: ContextDigest | None = None,
+    image_budget: ImageBudget | None = None,
+    window: ContextWindow | None = None,
+) -> list[dict]:
+    """Pack the most recent whole turns of `messages` that fit the budget, preceded by
+    the digest of older turns, with images resolved by the policy. With a window, the
+    context starts where it started last time, as long as that fits the budget.
+    """
+    turns = split_turns(messages)
+    hashes = [turn_hash(turn) for turn in turns]
+    image_budget = image_budget or ImageBudget()
+    available = budget.max_tokens - (budget.digest_tokens if digest is not None else 0)
+
+    num_kept = None
+    if window is not None and window.first_turn in hashes:
+        start = len(hashes) - 1 - hashes[::-1].index(window.first_turn)
+        costs = TurnCosts(policy, image_budget, window.image_sides)
+        num_kept, used = _pack(turns[start:], costs, available, budget.max_turns)
+        if num_kept < len(turns) - start:
+            num_kept = None  # Outgrown, repack
+    if num_kept is None:
+        if window is None:
+            costs = TurnCosts(policy, image_budget)
+            num_kept, used = _pack(turns, costs, available, budget.max_turns)
+        else:
+            window.reset()
+            costs = TurnCosts(policy, image_budget, window.image_sides)
+            max_turns = max(1, int(budget.max_turns * budget.refill))
+            num_kept, used = _pack(turns, costs, available * budget.refill, max_turns)
+            if num_kept:
+                window.first_turn = hashes[len(turns) - num_kept]
+            logger.debug(f"Repacked the context window to {num_kept} turns")
+    kept = turns[len(turns) - num_kept :]
+    dropped = turns[: len(turns) - num_kept]
+
+    context = []
+    if digest is not None:
+        digest.update(dropped, budget.digest_tokens)
+        in_context = set(hashes[len(turns) - num_kept :])
+        message = digest.message(exclude=in_context)
+        if message is not None:
+            context.append(message)
+            used += digest.tokens(exclude=in_context)
+    sides = window.image_sides if window is not None else None
+    context.extend(
+        blobs.resolve_images([m for turn in kept for m in turn], policy, sides)
+    )
+    logger.debug(
+        f"Context: {num_kept} of {len(turns)} turns and "
+        f"{len(context) - sum(len(t) for t in kept)} digest message(s), "
+        f"~{used} of {budget.max_tokens} tokens"
+    )
+    return context
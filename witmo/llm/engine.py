@@ -0,0 +1,549 @@
+"""
+Asynchronous completion engine for Witmo
+
+Runs completions on an asyncio event loop in a background thread, so the main loop never
+blocks on the LLM. Every submitted request gets a RequestHandle to follow its streamed
+response, wait for it, or cancel it (which also aborts the HTTP request). Several
+requests can be in flight at once; their responses are recorded in the history in
+submission order.
+
+Each request follows its model's RequestPolicy: deadlines for the first token, between
+chunks and in total, jittered retries of retryable errors before the first token, and
+optionally a hedged second request when the first token is late (see policy.py).
+
+Run this module directly for a demo against the mock OpenAI server.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from typing import Any, Iterator, Literal
+from loguru import logger
+from .completion import (
+    PreparedRequest,
+    Usage,
+    UsageStats,
+    prepare_request,
+    record_response,
+)
+from .history import History
+from .models import Provider, RequestPolicy
+from .policy import LatencyStats, RequestStats, backoff_delay, is_retryable
+from .response_cache import ResponseCache
+
+RequestState = Literal["pending", "streaming", "done", "cancelled", "failed"]
+
+
+class RequestHandle:
+    """Handle of one submitted request. Thread-safe."""
+
+    def __init__(self, request_id: int, question: str, image: Any = None):
+        self.id = request_id
+        self.question = question
+        self.image = image
+        self.state: RequestState = "pending"
+        self.error: BaseException | None = None
+        self.from_cache = False
+        self.request: PreparedRequest | None = None
+        self.usage: Usage | None = None
+        self.hedged = False
+        self.submitted = time.perf_counter()
+        self.prepare_time: float | None = None  # Encoding the image, packing the context
+        self.ttft: float | None = None
+        self.latency: float | None = None  # Until the response was complete
+        self._parts: list[str] = []
+        self._changed = threading.Condition()
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def __repr__(self):
+        return f"RequestHandle({self.id}, {self.state})"
+
+    @property
+    def text(self) -> str:
+        """The response text received so far."""
+        with self._changed:
+            return "".join(self._parts)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "cancelled", "failed")
+
+    def _append(self, chunk: str) -> None:
+        with self._changed:
+            self._parts.append(chunk)
+            self.state = "streaming"
+            self._changed.notify_all()
+
+    def _finish(self, state: RequestState, error: BaseException | None = None) -> None:
+        with self._changed:
+            if self.latency is None:
+                self.latency = time.perf_counter() - self.submitted
+            self.state = state
+            self.error = error
+            self._changed.notify_all()
+
+    def chunks(self, heartbeat: float | None = 0.1) -> Iterator[str]:
+        """Yield the response in chunks from the beginning, as they arrive, until the
+        request is finished. With a heartbeat, an empty string is yielded whenever nothing
+        arrived for that long, so the caller can do other things in between.
+        """
+        i = 0
+        while True:
+            with self._changed:
+                if i == len(self._parts) and not self.finished:
+                    self._changed.wait(heartbeat)
+                new = self._parts[i:]
+                i += len(new)
+                finished = self.finished
+            if new:
+                yield "".join(new)
+            elif finished:
+                return
+            elif heartbeat is not None:
+                yield ""
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait until the request is finished. Returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+
+    def result(self, timeout: float | None = None) -> str:
+        """Wait for and return the full response.
+
+        Raises:
+            TimeoutError: If the request didn't finish in time
+            asyncio.CancelledError: If the request was cancelled
+            Exception: Whatever made the request fail
+        """
+        if not self.wait(timeout):
+            raise TimeoutError(f"Request {self.id} did not finish in time")
+        if self.state == "cancelled":
+            raise asyncio.CancelledError(f"Request {self.id} was cancelled")
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def _start(self, coro) -> None:
+        self._task = asyncio.get_running_loop().create_task(coro)
+
+    def _cancel(self) -> None:
+        if self._task is not None:
+            # After the task's first step: a task cancelled before it started would
+            # never run _run's handler, so it wouldn't finish or wait for its turn.
+            asyncio.get_running_loop().call_soon(self._cancel_task)
+
+    def _cancel_task(self) -> None:
+        # Once finished, the task only waits for the previous one, which it must not
+        # skip (later requests rely on it):
+        if not self.finished:
+            self._task.cancel()
+
+    def cancel(self) -> None:
+        """Cancel the request (no-op if it's already finished)."""
+        if self._loop is not None and not self.finished:
+            logger.info(f"Cancelling request {self.id}")
+            self._loop.call_soon_threadsafe(self._cancel)
+
+
+class CompletionEngine:
+    """Runs completion requests concurrently on a background asyncio loop.
+
+    Args:
+        client: An openai.AsyncOpenAI (compatible) client for all requests; if None,
+            one is created per provider (see models.Provider) on first use.
+        base_url: Base URL for all requests instead of the providers' (e.g., of the
+            mock server).
+    """
+
+    def __init__(self, client=None, base_url: str | None = None):
+        self._client = client
+        self._clients: dict[str, Any] = {}  # By provider name
+        self._base_url = base_url
+        self._ids = itertools.count(1)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        # Creating a client imports openai, which mustn't block submit():
+        self._client_lock = threading.Lock()
+        self._last: RequestHandle | None = None
+        self.handles: list[RequestHandle] = []
+        self.usage = UsageStats()
+        self.stats = RequestStats()
+        self.latency = LatencyStats()
+        self._background: set[asyncio.Task] = set()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="witmo-completions", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def _get_client(self, provider: Provider | None = None):
+        provider = provider or Provider()
+        with self._client_lock:
+            if self._client is not None:
+                return self._client
+            if provider.name not in self._clients:
+                self._clients[provider.name] = self._create_client(provider)
+            return self._clients[provider.name]
+
+    def _create_client(self, provider: Provider):
+        from .openai_client import create_async_client
+
+        if self._base_url:
+            base_url, key = self._base_url, None
+        else:
+            base_url, key = provider.base_url, provider.api_key()
+        # Retries are up to the request policy:
+        return create_async_client(base_url, key, max_retries=0)
+
+    @property
+    def in_flight(self) -> list[RequestHandle]:
+        return [h for h in self.handles if not h.finished]
+
+    def submit(
+        self,
+        question: str,
+        *,
+        history: History | None = None,
+        cache: ResponseCache | None = None,
+        record: bool = True,
+        policy: RequestPolicy | None = None,
+        **kwargs,
+    ) -> RequestHandle:
+        """Submit a request and return its handle right away. Takes the same arguments
+        as completion.prepare_request, and the model's request policy (defaults to
+        RequestPolicy()). With `record` False, the response isn't added to the history
+        and the cache (see completion.record_response to do it later).
+        """
+        loop = self._ensure_loop()
+        handle = RequestHandle(next(self._ids), question, kwargs.get("image"))
+        with self._lock:
+            previous, self._last = self._last, handle
+            self.handles = [h for h in self.handles if not h.finished] + [handle]
+        handle._loop = loop
+        policy = policy or RequestPolicy()
+        coro = self._run(
+            handle, previous, question, history, cache, record, policy, kwargs
+        )
+        # Callbacks run in order, so the task exists before any cancel() gets to it:
+        loop.call_soon_threadsafe(handle._start, coro)
+        return handle
+
+    async def _run(
+        self,
+        handle: RequestHandle,
+        previous: RequestHandle | None,
+        question: str,
+        history: History | None,
+        cache: ResponseCache | None,
+        record: bool,
+        policy: RequestPolicy,
+        kwargs: dict,
+    ) -> None:
+        try:
+            request = await asyncio.to_thread(
+                prepare_request, question, history=history, cache=cache, **kwargs
+            )
+            handle.request = request
+            handle.prepare_time = time.perf_counter() - handle.submitted
+            if request.cached is not None:
+                handle.from_cache = True
+                handle._append(request.cached)
+                content = request.cached
+            else:
+                self.stats.count("requests")
+                try:
+                    async with asyncio.timeout(policy.deadline) as deadline:
+                        content = await self._stream(handle, request, policy)
+                except TimeoutError:
+                    if not deadline.expired():
+                        raise
+                    self.stats.count("timeouts")
+                    raise TimeoutError(
+                        f"No complete response within {policy.deadline:.0f}s"
+                    ) from None
+            handle.latency = time.perf_counter() - handle.submitted
+            if record:
+                # Record in submission order, so the history stays in the order it was
+                # shown (a cancel while waiting for that drops the response):
+                await self._wait_for(previous)
+                cache = None if handle.from_cache else cache
+                record_response(request, content, history, cache)
+        except asyncio.CancelledError:
+            handle._finish("cancelled")
+            await self._wait_for(previous)
+            return
+        except Exception as e:
+            self.stats.count("failures")
+            logger.error(f"Request {handle.id} failed: {e!r}")
+            handle._finish("failed", e)
+            await self._wait_for(previous)
+            return
+
+        handle._finish("done")
+        await self._wait_for(previous)
+
+    @staticmethod
+    async def _wait_for(previous: RequestHandle | None) -> None:
+        """Wait until the previous request's task is done. Every task does that before it
+        ends, so then all earlier requests are done (and recorded) too.
+        """
+        if previous is not None and previous._task is not None:
+            await asyncio.wait([previous._task])
+
+    def _spawn(self, coro) -> None:
+        """Run a background coroutine on the loop, keeping a reference until it's done."""
+
+        def _create_task():
+            task = asyncio.get_running_loop().create_task(coro)
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+        self._ensure_loop().call_soon_threadsafe(_create_task)
+
+    def adopt(
+        self,
+        handle: RequestHandle,
+        history: History | None = None,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        """Record a request that was submitted with record=False (e.g., speculatively)
+        once it's done, as if it had been submitted with history and cache.
+        """
+        self._spawn(self._record_when_done(handle, history, cache))
+
+    async def _record_when_done(
+        self,
+        handle: RequestHandle,
+        history: History | None,
+        cache: ResponseCache | None,
+    ) -> None:
+        if handle._task is not None:
+            await asyncio.wait([handle._task])
+        if handle.state == "done":
+            cache = None if handle.from_cache else cache
+            record_response(handle.request, handle.text, history, cache)
+
+    def warm_up(self, provider: Provider | None = None) -> None:
+        """Open a connection to the provider's API (default: OpenAI) in the background
+        (DNS, TCP and TLS), so the next request doesn't pay for the handshake.
+        """
+        self._spawn(self._warm_up(provider))
+
+    async def _warm_up(self, provider: Provider | None) -> None:
+        start = time.perf_counter()
+        try:
+            client = await asyncio.to_thread(self._get_client, provider)
+            await client.models.list()
+        except Exception as e:
+            logger.debug(f"Warm-up request failed (the connection may still be open): {e}")
+        logger.debug(f"Warmed up the API connection in {time.perf_counter() - start:.2f}s")
+
+    def _chunk_delta(self, handle: RequestHandle, chunk) -> str | None:
+        """The text of a streamed chunk; records the usage if it's the last chunk."""
+        if chunk.usage:
+            handle.usage = Usage.from_api(chunk.usage)
+            self.usage.add(handle.usage)
+            logger.info(f"Request {handle.id} usage: {handle.usage}")
+        if not chunk.choices:
+            return None
+        return chunk.choices[0].delta.content
+
+    async def _open(self, handle: RequestHandle, client, request: PreparedRequest):
+        """One attempt: send the request and read the stream up to the first token.
+        Returns the stream, its chunk iterator, and the first token ("" if the response
+        was empty).
+        """
+        stream = await client.chat.completions.create(**request.api_options())
+        chunks = aiter(stream)
+        try:
+            async for chunk in chunks:
+                delta = self._chunk_delta(handle, chunk)
+                if delta:
+                    return stream, chunks, delta
+            return stream, chunks, ""
+        except BaseException:
+            await stream.close()  # Also aborts the HTTP request
+            raise
+
+    async def _first_token(
+        self, handle: RequestHandle, client, request: PreparedRequest, policy: RequestPolicy
+    ):
+        """Like _open, but with the first token timeout, and hedged: if the first token
+        is late, a second attempt is sent and the first one to answer wins.
+        """
+        loop = asyncio.get_running_loop()
+
+        def attempt() -> asyncio.Task:
+            return loop.create_task(
+                asyncio.wait_for(
+                    self._open(handle, client, request), policy.first_token_timeout
+                )
+            )
+
+        tasks = [attempt()]
+        winner = None
+        try:
+            hedge_delay = self.latency.hedge_delay(request.model, policy)
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    logger.info(
+                        f"Request {handle.id}: no first token after {hedge_delay:.2f}s, "
+                        f"sending a hedged request"
+                    )
+                    self.stats.count("hedges")
+                    handle.hedged = True
+                    tasks.append(attempt())
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                if winner is not None:
+                    if winner is not tasks[0]:
+                        self.stats.count("hedge_wins")
+                        logger.info(f"Request {handle.id}: the hedged request won")
+                    return winner.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()  # Closes its stream
+                elif task is not winner and not task.cancelled() and not task.exception():
+                    await task.result()[0].close()
+
+    async def _first_token_with_retries(
+        self, handle: RequestHandle, client, request: PreparedRequest, policy: RequestPolicy
+    ):
+        """_first_token, retried on retryable errors after a jittered backoff."""
+        for attempt in range(policy.max_retries + 1):
+            try:
+                return await self._first_token(handle, client, request, policy)
+            except Exception as e:
+                error = e
+                if isinstance(e, TimeoutError):
+                    self.stats.count("timeouts")
+                    error = TimeoutError(
+                        f"No first token within {policy.first_token_timeout:.0f}s"
+                    )
+                if attempt == policy.max_retries or not is_retryable(error):
+                    raise error from None
+                delay = backoff_delay(attempt, policy)
+                self.stats.count("retries")
+                logger.warning(
+                    f"Request {handle.id}, attempt {attempt + 1} failed ({error!r}), "
+                    f"retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def _stream(
+        self, handle: RequestHandle, request: PreparedRequest, policy: RequestPolicy
+    ) -> str:
+        start = time.perf_counter()
+        # First use imports openai:
+        client = await asyncio.to_thread(self._get_client, request.provider)
+        stream, chunks, first = await self._first_token_with_retries(
+            handle, client, request, policy
+        )
+        try:
+            if first:
+                handle.ttft = time.perf_counter() - start
+                self.latency.add(request.model, handle.ttft)
+                logger.info(f"Request {handle.id}: time to first token {handle.ttft:.2f}s")
+                handle._append(first)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), policy.stall_timeout)
+                except StopAsyncIteration:
+                    break
+                except TimeoutError:
+                    self.stats.count("timeouts")
+                    raise TimeoutError(
+                        f"Response stalled for {policy.stall_timeout:.0f}s"
+                    ) from None
+                delta = self._chunk_delta(handle, chunk)
+                if delta:
+                    handle._append(delta)
+        finally:
+            await stream.close()  # Also aborts the HTTP request when cancelled
+        content = handle.text
+        logger.info(
+            f"Request {handle.id} complete after {time.perf_counter() - start:.2f}s "
+            f"({len(content)} chars)"
+        )
+        if not content:
+            logger.error("Received empty response from LLM.")
+            content = "<<no response>>"
+            handle._append(content)
+        return content
+
+    def cancel_all(self) -> None:
+        for handle in self.in_flight:
+            handle.cancel()
+
+    async def _shutdown(self) -> None:
+        for task in list(self._background):  # Warm-ups, adopted requests
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
+        for client in self._clients.values():
+            await client.close()
+        await asyncio.get_running_loop().shutdown_asyncgens()
+
+    def close(self) -> None:
+        """Cancel everything in flight and stop the event loop."""
+        self.stats.log()
+        self.cancel_all()
+        for handle in list(self.handles):
+            handle.wait(timeout=2)
+        if self._loop is not None:
+            future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+            try:
+                future.result(timeout=2)
+            except Exception as e:
+                logger.debug(f"Error shutting down the completion engine: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=2)
+            self._loop = None
+
+
+if __name__ == "__main__":
+    import tempfile
+    from .mock_server import MockOpenAIServer
+
+    with MockOpenAIServer(first_token_delay=0.5, token_delay=0.05) as server:
+        engine = CompletionEngine(base_url=server.base_url)
+        history = History(tempfile.mkdtemp())
+        start = time.perf_counter()
+        handles = [
+            engine.submit(f"question {i}", history=history, model="mock")
+            for i in range(3)
+        ]
+        print(f"Submitted 3 requests in {(time.perf_counter() - start) * 1000:.1f} ms")
+        time.sleep(0.7)
+        handles[1].cancel()  # Mid-stream
+        for handle in handles:
+            print(f"{handle.id}: ", end="", flush=True)
+            for chunk in handle.chunks(heartbeat=None):
+                print(chunk, end="", flush=True)
+            print(f"  [{handle.state}, ttft {handle.ttft}]")
+        print(f"Total {time.perf_counter() - start:.2f}s (requests ran concurrently)")
+        print(f"History: {[m['content'] for m in history.messages]}")
+        time.sleep(0.2)
+        print(f"Requests aborted on the server: {server.num_aborted}")
+        engine.close()
@@ -0,0 +1,158 @@
+"""
+Multi-model fan-out for Witmo
+
+Sends one request (prompt and image) to several models at once via the CompletionEngine:
+
+- "race": the first model to start answering wins, the other requests are cancelled.
+  Trades cost for latency.
+- "compare": all models answer, the answers are shown side by side with their latency.
+
+Only the chosen answer (the race winner, or the one picked when comparing) is recorded
+in the history.
+"""
+
+import time
+from typing import Iterator, Literal
+from loguru import logger
+from .completion import record_response
+from .engine import CompletionEngine, RequestHandle
+from .history import History
+from .models import Model
+from .response_cache import ResponseCache
+
+
+class FanOut:
+    """One request sent to several models. Follows the RequestHandle interface as far as
+    the main loop needs it (chunks, cancel, state, ...), with the race winner standing in
+    for the single response.
+    """
+
+    def __init__(
+        self,
+        engine: CompletionEngine,
+        models: list[Model],
+        mode: Literal["race", "compare"],
+        question: str,
+        *,
+        history: History | None = None,
+        cache: ResponseCache | None = None,
+        **kwargs,
+    ):
+        self.mode = mode
+        self.models = models
+        self.question = question
+        self.image = kwargs.get("image")
+        self.history = history
+        self.cache = cache
+        self.winner: RequestHandle | None = None
+        self.chosen: RequestHandle | None = None
+        self.handles = [
+            engine.submit(
+                question,
+                history=history,
+                cache=cache,
+                record=False,
+                **{**kwargs, **model.request_kwargs()},
+            )
+            for model in models
+        ]
+        logger.info(
+            f"Fan-out ({mode}) to {', '.join(m.shortname for m in models)}: {question}"
+        )
+
+    @property
+    def finished(self) -> bool:
+        return all(handle.finished for handle in self.handles)
+
+    @property
+    def state(self) -> str:
+        if self.mode == "race" and self.winner is not None:
+            return self.winner.state
+        if any(handle.state == "done" for handle in self.handles):
+            return "done" if self.finished else "streaming"
+        return "failed" if self.finished else "pending"
+
+    @property
+    def error(self) -> BaseException | None:
+        return next((h.error for h in self.handles if h.error is not None), None)
+
+    @property
+    def from_cache(self) -> bool:
+        return self.chosen is not None and self.chosen.from_cache
+
+    @property
+    def text(self) -> str:
+        return self.chosen.text if self.chosen is not None else ""
+
+    def cancel(self) -> None:
+        for handle in self.handles:
+            handle.cancel()
+
+    def _pick_winner(self) -> RequestHandle | None:
+        for handle in self.handles:
+            if handle.text:
+                self.winner = handle
+                losers = [h for h in self.handles if h is not handle and not h.finished]
+                for loser in losers:
+                    loser.cancel()
+                model = self.models[self.handles.index(handle)]
+                logger.info(
+                    f"Race won by {model.shortname} (first token after "
+                    f"{handle.ttft or 0:.2f}s), cancelled {len(losers)} other request(s)"
+                )
+                return handle
+        return None
+
+    def chunks(self, heartbeat: float | None = 0.1) -> Iterator[str]:
+        """Race: wait for the first model to answer, cancel the others, and yield the
+        winner's response like RequestHandle.chunks.
+        """
+        poll = 0.02
+        waited = 0.0
+        while self.winner is None and self._pick_winner() is None:
+            if self.finished:
+                return  # Nobody answered
+            time.sleep(poll)
+            waited += poll
+            if heartbeat is not None and waited >= heartbeat:
+                waited = 0.0
+                yield ""
+        yield from self.winner.chunks(heartbeat)
+
+    def answers(self) -> list[tuple[Model, RequestHandle]]:
+        return list(zip(self.models, self.handles))
+
+    def choose(self, handle: RequestHandle) -> None:
+        """Record the chosen answer in the history (and the response cache)."""
+        if self.chosen is not None or handle.state != "done":
+            return
+        self.chosen = handle
+        cache = None if handle.from_cache else self.cache
+        record_response(handle.request, handle.text, self.history, cache)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from .mock_server import MockOpenAIServer
+
+    delays = {"a": 0.6, "b": 0.2, "c": 0.4}
+    with MockOpenAIServer(token_delay=0.02, model_delays=delays) as server:
+        engine = CompletionEngine(base_url=server.base_url)
+        models = [
+            Model(shortname=name, name=name, api_name=name) for name in ("a", "b", "c")
+        ]
+        history = History(tempfile.mkdtemp())
+        for mode in ("race", "compare"):
+            fanout = FanOut(engine, models, mode, f"{mode} question", history=history)
+            if mode == "race":
+                print("Race:", "".join(fanout.chunks(heartbeat=None)))
+                fanout.choose(fanout.winner)
+            else:
+                for handle in fanout.handles:
+                    handle.wait()
+                for model, handle in fanout.answers():
+                    print(f"{model.shortname} ({handle.latency:.2f}s): {handle.text}")
+                fanout.choose(fanout.handles[-1])
+            print("States:", [h.state for h in fanout.handles])
+        print(f"History: {[m['content'] for m in history.messages]}")
+        engine.close()
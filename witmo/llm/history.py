@@ -1,62 +1,299 @@
-import os
+"""
+Chat history of one game, stored as an append-only log.
+
+Every message is appended to `chat_history.jsonl` as one JSON line and fsynced right
+away, so a crash loses at most the message being written (a torn last line is cut off
+on the next start). Loading only reads the tail of the log that's needed for context.
+
+When the log grows beyond `max_log_bytes`, it's compacted: all but the last `keep`
+messages are moved to a read-only segment `chat_history.<first>.jsonl` (named by the
+index of its first message), and the log is rewritten with the rest. The first line of
+the log is a header with the index of its first message. If a compaction is interrupted
+before the log is rewritten, the next one starts at the same index and overwrites that
+segment (with the same messages and any appended since), so segments never overlap.
+
+Images are not stored inline but in the blob store `blobs/` next to the log, and only
+resolved (full, as a thumbnail, or not at all) when they're sent as context; see
+image_store.py.
+
+An old `chat_history.json` is imported on first load (see import_legacy_history).
+Run this module with a history directory to import it explicitly.
+"""
+
 import json
+import os
+import threading
 from loguru import logger
 from witmo.tui.io import tt
+from .context import ContextDigest, ContextWindow, build_context, digest_file_name
+from .image_store import BlobStore
+from .models import ContextBudget, ImageBudget, ImageContextPolicy
+
+LEGACY_FILE_NAME = "chat_history.json"
+
+
+def is_valid_message(msg) -> bool:
+    return (
+        isinstance(msg, dict)
+        and "role" in msg
+        and "content" in msg
+        and (isinstance(msg["content"], str) or isinstance(msg["content"], list))
+    )
+
+
+def _dumps(obj) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _write_atomically(path: str, lines: list[bytes]) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_tail_lines(path: str, n: int, block_size: int = 64 * 1024) -> list[bytes]:
+    """The last n complete lines of a file, read backwards block by block."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        pos = end
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.split(b"\n")
+    if pos > 0:
+        lines = lines[1:]  # Possibly cut off at the start
+    return [line for line in lines if line.strip()][-n:]
+
+
+def import_legacy_history(
+    json_path: str, log_path: str, blobs: BlobStore | None = None
+) -> int:
+    """Import a chat_history.json file (a JSON list of messages) into a new log file,
+    moving inline images into `blobs` if given. The JSON file is renamed to
+    `<name>.imported` afterwards. Returns the number of imported messages.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        loaded = json.load(f)
+    messages = [msg for msg in loaded if is_valid_message(msg)]
+    skipped_count = len(loaded) - len(messages)
+    if skipped_count > 0:
+        logger.warning(f"Skipped {skipped_count} invalid messages in {json_path}")
+    if blobs is not None:
+        messages = [blobs.store_images(msg) for msg in messages]
+    _write_atomically(log_path, [_dumps({"offset": 0})] + [_dumps(m) for m in messages])
+    os.replace(json_path, json_path + ".imported")
+    logger.info(f"Imported {len(messages)} messages from {json_path} into {log_path}")
+    return len(messages)
+
 
 class History:
-    def __init__(self, file_location: str, file_name: str = "chat_history.json"):
+    """Chat history of one game.
+
+    Args:
+        file_location: The game's history directory.
+        tail: Number of most recent messages to load.
+        keep: Number of messages to keep in the log when compacting.
+        max_log_bytes: Size of the log that triggers a compaction on load.
+        image_policy: Which images to resolve when the history is sent as context.
+    """
+
+    def __init__(
+        self,
+        file_location: str,
+        file_name: str = "chat_history.jsonl",
+        tail: int = 100,
+        keep: int = 100,
+        max_log_bytes: int = 8 * 1024 * 1024,
+        image_policy: ImageContextPolicy | None = None,
+    ):
+        self.file_location = file_location
         self.file_path = os.path.join(file_location, file_name)
+        self.tail = tail
+        self.keep = keep
+        self.max_log_bytes = max_log_bytes
+        self.image_policy = image_policy or ImageContextPolicy()
         if not os.path.exists(file_location):
             os.makedirs(file_location)
             logger.info(f"Created directory: {file_location}")
+        self.blobs = BlobStore(os.path.join(file_location, "blobs"))
+        # One per budget, as fanned-out requests to different models use different ones
+        # (sharing a digest would change the other models' prefix):
+        self.windows: dict[ContextBudget, ContextWindow] = {}
+        self.digests: dict[ContextBudget, ContextDigest] = {}
+        self._context_lock = threading.Lock()
         self.messages = []
+        self._file = None
+        self._lock = threading.Lock()
 
     def load(self):
+        legacy_path = os.path.join(self.file_location, LEGACY_FILE_NAME)
+        if not os.path.exists(self.file_path) and os.path.exists(legacy_path):
+            try:
+                import_legacy_history(legacy_path, self.file_path, self.blobs)
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.warning(f"Could not import the old chat history {legacy_path}: {e}")
+
         if not os.path.exists(self.file_path):
             logger.info("No previous chat history found, starting fresh")
             return
 
+        self._repair()
+        if os.path.getsize(self.file_path) > self.max_log_bytes:
+            self.compact()
+
+        self.messages = []
+        skipped_count = 0
+        for line in _read_tail_lines(self.file_path, self.tail + 1):
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                skipped_count += 1
+                continue
+            if is_valid_message(msg):
+                self.messages.append(self.blobs.store_images(msg))
+            elif not (isinstance(msg, dict) and "offset" in msg):
+                skipped_count += 1
+        self.messages = self.messages[-self.tail :]
+        logger.info(f"Loaded the last {len(self.messages)} messages of the chat history")
+        if skipped_count > 0:
+            logger.warning(f"Skipped {skipped_count} invalid messages in chat history")
+
+    def _repair(self) -> None:
+        """Cut off a torn last line (from a crash while appending)."""
+        with open(self.file_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                i = f.read(step).rfind(b"\n")
+                if i >= 0:
+                    pos += i + 1
+                    break
+            logger.warning(f"Cutting off an incomplete message ({size - pos} bytes)")
+            f.truncate(pos)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_log(self) -> tuple[int, list[bytes]]:
+        """The log's offset (index of its first message) and its message lines."""
+        with open(self.file_path, "rb") as f:
+            lines = [line for line in f.read().split(b"\n") if line.strip()]
+        offset = 0
+        if lines:
+            try:
+                header = json.loads(lines[0])
+                if isinstance(header, dict) and "offset" in header:
+                    offset = header["offset"]
+                    lines = lines[1:]
+            except json.JSONDecodeError:
+                pass
+        return offset, lines
+
+    def _store_line_images(self, line: bytes) -> bytes:
+        """Move inline images of a log line (from an older version) to the blob store."""
+        if b'"data:' not in line:
+            return line
         try:
-            with open(self.file_path, "r", encoding="utf-8") as f:
-                loaded = json.load(f)
-            self.messages = [
-                msg
-                for msg in loaded
-                if isinstance(msg, dict)
-                and "role" in msg
-                and "content" in msg
-                and (
-                    isinstance(msg["content"], str) or isinstance(msg["content"], list)
-                )
-            ]
+            return _dumps(self.blobs.store_images(json.loads(line))).rstrip(b"\n")
+        except (json.JSONDecodeError, ValueError):
+            return line
+
+    def compact(self) -> None:
+        """Move all but the last `keep` messages of the log to a segment file."""
+        with self._lock:
+            self._close_file()
+            offset, lines = self._read_log()
+            if len(lines) <= self.keep:
+                return
+            lines = [self._store_line_images(line) for line in lines]
+            archived, kept = lines[: -self.keep], lines[-self.keep :]
+            segment_path = os.path.splitext(self.file_path)[0] + f".{offset:06d}.jsonl"
+            # Overwrites the segment of an interrupted compaction, which had a prefix of
+            # the same messages:
+            _write_atomically(segment_path, [line + b"\n" for line in archived])
+            header = _dumps({"offset": offset + len(archived)})
+            _write_atomically(self.file_path, [header] + [line + b"\n" for line in kept])
             logger.info(
-                f"Loaded existing chat history with {len(self.messages)} messages"
-            )
-            skipped_count = len(loaded) - len(self.messages)
-            if skipped_count > 0:
-                logger.warning(
-                    f"Skipped {skipped_count} invalid messages in chat history"
-                )
-        except json.JSONDecodeError:
-            logger.warning(
-                "Chat history file was corrupted, starting with empty history"
+                f"Compacted chat history: moved {len(archived)} messages to {segment_path}"
             )
-            self.messages = []
 
-    def save(self):
-        try:
-            with open(self.file_path, "w", encoding="utf-8") as f:
-                json.dump(self.messages, f, indent=2, ensure_ascii=False)
-            logger.success(f"Chat history saved to {self.file_path}")
-        except Exception as e:
-            logger.error(f"Error saving chat history: {str(e)}")
+    def _open_file(self):
+        if self._file is None:
+            new = not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0
+            self._file = open(self.file_path, "ab")
+            if new:
+                self._file.write(_dumps({"offset": 0}))
+        return self._file
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def extend(self, messages) -> None:
+        """Append messages and write them to disk in one go."""
+        messages = [self.blobs.store_images(msg) for msg in messages]
+        with self._lock:
+            self.messages.extend(messages)
+            try:
+                f = self._open_file()
+                f.write(b"".join(_dumps(msg) for msg in messages))
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception as e:
+                logger.error(f"Error writing chat history: {str(e)}")
 
     def append(self, message):
-        self.messages.append(message)
+        self.extend([message])
+
+    def save(self):
+        """Messages are written as they're appended; this only closes the log file."""
+        with self._lock:
+            self._close_file()
 
     def last(self, n=10):
         return self.messages[-n:]
 
+    def context(
+        self,
+        budget: ContextBudget | None = None,
+        image_budget: ImageBudget | None = None,
+    ) -> list[dict]:
+        """The most recent turns that fit the budget, preceded by a digest of older
+        ones, with their images resolved according to the image policy.
+        """
+        budget = budget or ContextBudget()
+        with self._context_lock:
+            window = self.windows.setdefault(budget, ContextWindow())
+            if budget not in self.digests:
+                self.digests[budget] = ContextDigest(
+                    self.file_location, digest_file_name(budget)
+                )
+            return build_context(
+                list(self.messages),
+                budget,
+                self.image_policy,
+                self.blobs,
+                self.digests[budget],
+                image_budget,
+                window,
+            )
+
     def __len__(self):
         return len(self.messages)
 
@@ -67,5 +304,20 @@ class History:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.save()
-        tt(f"Saved chat history with {len(self.messages)} messages")
         return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        print("Usage: python -m witmo.llm.history <history directory>")
+        sys.exit(1)
+    directory = sys.argv[1]
+    history = History(directory)
+    if os.path.exists(history.file_path):
+        print(f"{history.file_path} already exists, nothing to import")
+        sys.exit(1)
+    import_legacy_history(
+        os.path.join(directory, LEGACY_FILE_NAME), history.file_path, history.blobs
+    )
@@ -0,0 +1,125 @@
+"""
+Image encoding stage between Witmo's images and the LLM request.
+
+Vision models downsample every image to a fixed tile grid anyway, so sending full phone
+resolution only inflates upload time and token cost. This stage resizes each image to a
+model's ImageBudget and re-encodes it, searching for the highest quality that fits the
+byte budget.
+"""
+
+import base64
+import math
+from dataclasses import dataclass, field
+import cv2
+import numpy as np
+from loguru import logger
+from witmo.image import CachedImage, Image
+from .models import ImageBudget
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+QUALITY_FLAGS = {"jpeg": cv2.IMWRITE_JPEG_QUALITY, "webp": cv2.IMWRITE_WEBP_QUALITY}
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    _data_url: str | None = field(default=None, repr=False, compare=False)
+
+    def to_data_url(self) -> str:
+        if self._data_url is None:
+            encoded = base64.b64encode(self.data).decode("utf-8")
+            self._data_url = f"data:{self.mime_type};base64,{encoded}"
+        return self._data_url
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estimate the vision tokens of an image with OpenAI's high-detail tiling: fit
+    into 2048x2048, scale the short side down to 768, then 85 + 170 per 512px tile.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def target_size(width: int, height: int, budget: ImageBudget) -> tuple[int, int]:
+    """Return the size an image should be resized to for the given budget."""
+    scale = min(
+        1.0,
+        budget.max_long_side / max(width, height),
+        budget.max_short_side / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(img: np.ndarray, fmt: str, quality: int) -> bytes:
+    ok, buf = cv2.imencode(f".{fmt}", img, [QUALITY_FLAGS[fmt], quality])
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}")
+    return buf.tobytes()
+
+
+def _fit_quality(img: np.ndarray, budget: ImageBudget) -> bytes | None:
+    """Binary search for the highest quality that fits the byte budget."""
+    fmt = budget.format
+    data = _encode(img, fmt, budget.max_quality)
+    if len(data) <= budget.max_bytes:
+        return data
+    best = None
+    lo, hi = budget.min_quality, budget.max_quality - 1
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = _encode(img, fmt, quality)
+        if len(data) <= budget.max_bytes:
+            best, lo = data, quality + 1
+        else:
+            hi = quality - 1
+    return best
+
+
+def encode_image(img: np.ndarray, budget: ImageBudget) -> EncodedImage:
+    """Resize and re-encode an image array to fit the budget."""
+    h, w = img.shape[:2]
+    width, height = target_size(w, h, budget)
+    while True:
+        resized = img
+        if (width, height) != (w, h):
+            resized = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        data = _fit_quality(resized, budget)
+        if data is not None or min(width, height) <= 64:
+            break
+        # Even the lowest quality is too big, so shrink further:
+        width, height = round(width * 0.75), round(height * 0.75)
+    if data is None:
+        data = _encode(resized, budget.format, budget.min_quality)
+    return EncodedImage(data, MIME_TYPES[budget.format], width, height)
+
+
+def encode_for_model(image: Image, budget: ImageBudget) -> EncodedImage:
+    """Encode an image for an LLM request and log the tokens that saved."""
+    if not isinstance(image, CachedImage):
+        # Nothing to resize without a decoded array, send as is:
+        data = base64.b64decode(image.to_base64())
+        return EncodedImage(data, "image/jpeg", 0, 0)
+
+    key = (
+        f"llm_{budget.format}_{budget.max_long_side}_{budget.max_short_side}_"
+        f"{budget.max_bytes}_{budget.min_quality}_{budget.max_quality}"
+    )
+    encoded = image.memoize(key, lambda: encode_image(image.array, budget))
+
+    # Only sizes that are known anyway; encoding the original (e.g., a crop) just to
+    # log its size would cost more than the log is worth:
+    h, w = image.array.shape[:2]
+    original_tokens = estimate_image_tokens(w, h)
+    tokens = estimate_image_tokens(encoded.width, encoded.height)
+    logger.info(
+        f"Image encoded for LLM: {w}x{h} -> {encoded.width}x{encoded.height}, "
+        f"{len(encoded.data) / 1024:.0f} KB, "
+        f"~{original_tokens} -> ~{tokens} tokens ({original_tokens - tokens} saved)"
+    )
+    return encoded
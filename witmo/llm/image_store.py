@@ -0,0 +1,187 @@
+"""
+Content-addressed image store for the chat history.
+
+Requests carry their image inline as a base64 data URL. Kept like that in the history,
+every image would stay in memory, bloat `chat_history.jsonl`, and be uploaded again with
+every later request. Instead, the history stores images in `history/<game>/blobs/`,
+named by the SHA-256 of their bytes, and keeps a `blob:<name>` URL in the message.
+
+When the history is sent to the model for context, the references are resolved lazily
+according to an ImageContextPolicy: the most recent images in full, the next ones as
+small thumbnails, and older ones replaced by a short text note.
+"""
+
+from __future__ import annotations
+
+import base64
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from loguru import logger
+from witmo.lazy import lazy_import
+from .models import ImageContextPolicy
+
+np = lazy_import("numpy")
+cv2 = lazy_import("cv2")
+
+BLOB_SCHEME = "blob:"
+EXTENSIONS = {"image/jpeg": "jpg", "image/webp": "webp", "image/png": "png"}
+MIME_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+OMITTED_IMAGE_NOTE = "[An earlier screenshot was sent here; omitted to save tokens.]"
+
+
+def _image_parts(message: dict) -> list[dict]:
+    content = message.get("content")
+    if not isinstance(content, list):
+        return []
+    return [part for part in content if part.get("type") == "image_url"]
+
+
+class BlobStore:
+    """Images stored in a directory by the SHA-256 of their bytes.
+
+    Args:
+        directory: Where to store the images (created on first write).
+        max_cached: Number of resolved data URLs to keep in memory.
+    """
+
+    def __init__(self, directory: str, max_cached: int = 16):
+        self.directory = directory
+        self.max_cached = max_cached
+        self._cache: OrderedDict[tuple[str, int], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name[:2], name)
+
+    def put(self, data: bytes, mime_type: str = "image/jpeg") -> str:
+        """Store image bytes (if not stored yet) and return their blob name."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS.get(mime_type, 'jpg')}"
+        path = self.path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return name
+
+    def get(self, name: str) -> bytes:
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def data_url(self, name: str, max_side: int = 0) -> str | None:
+        """The blob as a data URL, downscaled to `max_side` if given. None if the blob
+        is missing.
+        """
+        key = (name, max_side)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        try:
+            data = self.get(name)
+        except OSError as e:
+            logger.warning(f"Image {name} of the chat history is missing: {e}")
+            return None
+        mime_type = MIME_TYPES.get(name.rsplit(".", 1)[-1], "image/jpeg")
+        if max_side:
+            data, mime_type = _thumbnail(data, max_side), "image/jpeg"
+        url = f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+        with self._lock:
+            self._cache[key] = url
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return url
+
+    def store_images(self, message: dict) -> dict:
+        """Return the message with its inline (data URL) images moved into the store
+        and replaced by blob references. The message itself is not modified.
+        """
+        urls = [part["image_url"]["url"] for part in _image_parts(message)]
+        if not any(url.startswith("data:") for url in urls):
+            return message
+        message = copy.deepcopy(message)
+        for part in _image_parts(message):
+            url = part["image_url"]["url"]
+            if not url.startswith("data:"):
+                continue
+            header, encoded = url.split(",", 1)
+            mime_type = header[len("data:") :].split(";")[0]
+            name = self.put(base64.b64decode(encoded), mime_type)
+            part["image_url"] = {**part["image_url"], "url": BLOB_SCHEME + name}
+        return message
+
+    def resolve_images(
+        self,
+        messages: list[dict],
+        policy: ImageContextPolicy | None = None,
+        sides: dict[str, int | None] | None = None,
+    ) -> list[dict]:
+        """Return the messages ready to send: blob references resolved to data URLs
+        according to the policy, counting from the most recent image. Messages with
+        images are copied, the others are returned as they are.
+
+        With `sides` (image URL -> ImageContextPolicy.max_side), an image that's in
+        there is resolved the same way again, and the others are added to it.
+        """
+        policy = policy or ImageContextPolicy()
+        resolved = []
+        rank = 0
+        for message in reversed(messages):
+            if not _image_parts(message):
+                resolved.append(message)
+                continue
+            content = []
+            for part in reversed(message["content"]):
+                if part.get("type") == "image_url":
+                    rank += 1
+                    max_side = policy.max_side(rank)
+                    if sides is not None:
+                        max_side = sides.setdefault(part["image_url"]["url"], max_side)
+                    part = self._resolve_part(part, max_side)
+                content.append(part)
+            resolved.append({**message, "content": content[::-1]})
+        return resolved[::-1]
+
+    def _resolve_part(self, part: dict, max_side: int | None) -> dict:
+        """Resolve an image part as given by ImageContextPolicy.max_side."""
+        url = part["image_url"]["url"]
+        if max_side is None:
+            return {"type": "text", "text": OMITTED_IMAGE_NOTE}
+
+        try:
+            if url.startswith(BLOB_SCHEME):
+                url = self.data_url(url[len(BLOB_SCHEME) :], max_side)
+            elif max_side:
+                # An inline image (e.g., from an old history) only needs downscaling:
+                data = _thumbnail(base64.b64decode(url.split(",", 1)[1]), max_side)
+                url = f"data:image/jpeg;base64,{base64.b64encode(data).decode('utf-8')}"
+        except ValueError as e:
+            logger.warning(f"Could not resolve an image of the chat history: {e}")
+            url = None
+        if url is None:
+            return {"type": "text", "text": OMITTED_IMAGE_NOTE}
+        image_url = {**part["image_url"], "url": url}
+        if max_side:
+            image_url["detail"] = "low"
+        return {"type": "image_url", "image_url": image_url}
+
+
+def _thumbnail(data: bytes, max_side: int, quality: int = 60) -> bytes:
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / max(w, h))
+    if scale < 1.0:
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode thumbnail")
+    return buf.tobytes()
@@ -0,0 +1,311 @@
+"""
+Mock OpenAI-compatible server for Witmo
+
+A minimal, in-process stand-in for the OpenAI chat completions API, so the completion
+code can be exercised and benchmarked without an API key or network. It answers
+`POST /v1/chat/completions`, streamed (server-sent events) or not, with a canned reply
+(given ones in turn, or one that quotes the model and the last user message), and
+`GET /v1/models` with an empty list. Latency before the first token (also per model)
+and between tokens is configurable.
+
+The reported usage simulates the provider's automatic prompt caching: tokens of the
+longest prefix shared with an earlier request count as cached (in steps of 128 tokens,
+from 1024 tokens on, like OpenAI), with about 4 characters per token.
+
+Faults can be injected for the next requests with `inject()`: an error status, a longer
+delay before the first token, or a stall after it.
+
+Point a client at it with `base_url=server.base_url` (or OPENAI_BASE_URL). Run this
+module to serve it standalone, e.g. for a provider in models.json:
+
+    python -m witmo.llm.mock_server --port 8080 --first-token-delay 0.5
+"""
+
+import http.server
+import json
+import os
+import threading
+import time
+from loguru import logger
+
+
+class _MockOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    server: "_MockOpenAIHTTPServer"
+
+    def log_message(self, format, *args):
+        pass  # Keep test output clean
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/v1/models":
+            self.send_error(404)
+            return
+        data = json.dumps({"object": "list", "data": []}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        mock: MockOpenAIServer = self.server.mock
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        reply = mock.reply(body)
+        usage = mock.usage(body, reply)
+        mock.requests.append(body)
+        fault = mock.next_fault()
+        words = reply.split(" ")
+        tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+        model = body.get("model", "mock")
+        try:
+            delay = mock.model_delays.get(model, mock.first_token_delay)
+            time.sleep(fault.get("delay") or delay)
+            if fault.get("status"):
+                self._error(fault["status"])
+            elif body.get("stream"):
+                if not (body.get("stream_options") or {}).get("include_usage"):
+                    usage = None
+                self._stream(tokens, model, mock.token_delay, usage, fault.get("stall"))
+            else:
+                self._complete("".join(tokens), model, usage)
+        except (BrokenPipeError, ConnectionResetError):
+            mock.num_aborted += 1  # Client cancelled the request
+
+    def _error(self, status: int) -> None:
+        data = json.dumps(
+            {"error": {"message": f"Injected error {status}", "type": "mock_error"}}
+        ).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(
+        self,
+        model: str,
+        delta: dict | None,
+        finish_reason: str | None = None,
+        usage: dict | None = None,
+    ) -> bytes:
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [],
+        }
+        if delta is not None:
+            chunk["choices"] = [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        if usage is not None:
+            chunk["usage"] = usage
+        return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+    def _stream(
+        self,
+        tokens: list[str],
+        model: str,
+        token_delay: float,
+        usage: dict | None,
+        stall: float | None = None,
+    ) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.write(self._chunk(model, {"role": "assistant", "content": ""}))
+        for i, token in enumerate(tokens):
+            self.wfile.write(self._chunk(model, {"content": token}))
+            self.wfile.flush()
+            time.sleep(stall if stall and i == 0 else token_delay)
+        self.wfile.write(self._chunk(model, {}, finish_reason="stop"))
+        if usage is not None:
+            self.wfile.write(self._chunk(model, None, usage=usage))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _complete(self, content: str, model: str, usage: dict) -> None:
+        data = json.dumps(
+            {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _MockOpenAIHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    mock: "MockOpenAIServer"
+
+
+class MockOpenAIServer:
+    """A mock OpenAI chat completions server.
+
+    Args:
+        first_token_delay: Seconds before the first token (or the full response).
+        token_delay: Seconds between streamed tokens.
+        model_delays: First token delays of specific models, by model name.
+        replies: Canned replies, used in turn; by default, the reply quotes the question.
+    """
+
+    def __init__(
+        self,
+        first_token_delay: float = 0.2,
+        token_delay: float = 0.02,
+        model_delays: dict[str, float] | None = None,
+        replies: list[str] | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.model_delays = model_delays or {}
+        self.replies = replies or []
+        self._num_replies = 0
+        self.requests: list[dict] = []
+        self.num_aborted = 0
+        self._prompts: list[str] = []  # For the simulated prompt cache
+        self._faults: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = _MockOpenAIHTTPServer((host, port), _MockOpenAIHandler)
+        self._server.mock = self
+        self.host, self.port = self._server.server_address[:2]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def reply(self, body: dict) -> str:
+        """The canned reply for a request body."""
+        if self.replies:
+            with self._lock:
+                reply = self.replies[self._num_replies % len(self.replies)]
+                self._num_replies += 1
+            return reply
+        question = ""
+        for message in reversed(body.get("messages", [])):
+            if message.get("role") == "user":
+                content = message.get("content")
+                if isinstance(content, list):
+                    content = " ".join(
+                        part.get("text", "") for part in content if part.get("type") == "text"
+                    )
+                question = content or ""
+                break
+        return f"Mock answer from {body.get('model', 'mock')} to: {question}"
+
+    def inject(
+        self,
+        *,
+        status: int | None = None,
+        delay: float | None = None,
+        stall: float | None = None,
+        times: int = 1,
+    ) -> None:
+        """Make the next `times` requests fail with an HTTP error `status`, wait `delay`
+        seconds before the first token, and/or stall for `stall` seconds after it.
+        """
+        fault = {"status": status, "delay": delay, "stall": stall}
+        with self._lock:
+            self._faults.extend([fault] * times)
+
+    def next_fault(self) -> dict:
+        with self._lock:
+            return self._faults.pop(0) if self._faults else {}
+
+    def usage(self, body: dict, reply: str) -> dict:
+        """The usage of a request, with a simulated prompt cache."""
+        prompt = json.dumps(body.get("messages", []), ensure_ascii=False)
+        with self._lock:  # Requests are handled on concurrent threads
+            shared = max(
+                (len(os.path.commonprefix([prompt, p])) for p in self._prompts),
+                default=0,
+            )
+            self._prompts.append(prompt)
+        prompt_tokens = len(prompt) // 4
+        cached_tokens = shared // 4 // 128 * 128
+        if cached_tokens < 1024:
+            cached_tokens = 0
+        completion_tokens = len(reply) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+    def start(self) -> "MockOpenAIServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.debug(f"Mock OpenAI server listening on {self.base_url}")
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread (instead of start()) until interrupted."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Serve the mock OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", "-p", type=int, default=8080)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument(
+        "--replies",
+        metavar="FILE",
+        help="JSON file with a list of canned replies, used in turn",
+    )
+    args = parser.parse_args()
+
+    replies = None
+    if args.replies:
+        with open(args.replies, "r", encoding="utf-8") as f:
+            replies = json.load(f)
+        if not isinstance(replies, list) or not all(isinstance(r, str) for r in replies):
+            sys.exit(f"{args.replies} must contain a JSON list of strings")
+    server = MockOpenAIServer(
+        first_token_delay=args.first_token_delay,
+        token_delay=args.token_delay,
+        replies=replies,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Mock OpenAI server listening on {server.base_url} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {len(server.requests)} requests")
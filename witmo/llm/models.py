@@ -1,4 +1,107 @@
-from dataclasses import dataclass
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Literal
+
+
+@dataclass(frozen=True)
+class ImageBudget:
+    """How images are resized and re-encoded before they are sent to a model."""
+
+    max_long_side: int = 2048
+    max_short_side: int = 768
+    max_bytes: int = 400_000
+    format: Literal["jpeg", "webp"] = "jpeg"
+    min_quality: int = 40
+    max_quality: int = 90
+
+
+@dataclass(frozen=True)
+class ImageContextPolicy:
+    """Which images of the chat history are sent again with later requests, counted
+    from the most recent one: `full` as stored, the next `thumbnails` downscaled to
+    `thumbnail_side` (with low detail), and none of the older ones.
+    """
+
+    full: int = 0
+    thumbnails: int = 2
+    thumbnail_side: int = 512
+
+    def max_side(self, rank: int) -> int | None:
+        """How to send the `rank`th most recent image: 0 for as stored, a thumbnail's
+        long side, or None for not at all.
+        """
+        if rank <= self.full:
+            return 0
+        if rank <= self.full + self.thumbnails:
+            return self.thumbnail_side
+        return None
+
+
+@dataclass(frozen=True)
+class ContextBudget:
+    """How much of the chat history is sent with a request, in estimated tokens (see
+    llm/context.py). `digest_tokens` of `max_tokens` are reserved for the summary of
+    older turns. When the context outgrows the budget, it's repacked to `refill` of it
+    (and of `max_turns`), so it can grow again with the same start for a while, which
+    keeps the provider's prompt cache valid.
+    """
+
+    max_tokens: int = 6000
+    digest_tokens: int = 800
+    max_turns: int = 10
+    refill: float = 0.6
+
+
+@dataclass(frozen=True)
+class RequestPolicy:
+    """Timeouts, retries and hedging of a model's requests (see llm/engine.py).
+
+    A request fails if the first token doesn't arrive within `first_token_timeout`, if
+    no further chunk arrives within `stall_timeout`, or if it takes longer than
+    `deadline` in total (retries included). Until the first token, timeouts and
+    retryable errors (connection errors, 408, 409, 429, 5xx) are retried up to
+    `max_retries` times, after a jittered exponential backoff. With `hedge`, a second
+    request is sent when the first token takes longer than the `hedge_percentile` of
+    the model's recent times to first token; the first to answer wins.
+    """
+
+    first_token_timeout: float = 30.0
+    stall_timeout: float = 30.0
+    deadline: float = 180.0
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge: bool = False
+    hedge_percentile: float = 0.9
+    hedge_min_samples: int = 5
+    hedge_min_delay: float = 1.0
+
+
+@dataclass(frozen=True)
+class Provider:
+    """An OpenAI-compatible chat completions endpoint: OpenAI itself (the default), or
+    e.g. a local llama.cpp or vLLM server, or the mock server.
+
+    `base_url` None means OpenAI (or OPENAI_BASE_URL). The API key is read from the
+    environment variable `api_key_env`; None if the endpoint doesn't need one. Not every
+    server knows OpenAI's extensions, so `prompt_cache_key` and `stream_usage` (usage
+    report at the end of a stream) can be turned off.
+    """
+
+    name: str = "openai"
+    base_url: str | None = None
+    api_key_env: str | None = "OPENAI_API_KEY"
+    prompt_cache_key: bool = True
+    stream_usage: bool = True
+
+    def api_key(self) -> str | None:
+        if self.api_key_env is None:
+            return None
+        key = os.environ.get(self.api_key_env)
+        if not key:
+            raise RuntimeError(f"{self.api_key_env} environment variable not set.")
+        return key
 
 
 @dataclass
@@ -6,16 +109,95 @@ class Model:
     shortname: str
     name: str
     api_name: str
+    provider: Provider = field(default_factory=Provider)
+    image_budget: ImageBudget = field(default_factory=ImageBudget)
+    context_budget: ContextBudget = field(default_factory=ContextBudget)
+    request_policy: RequestPolicy = field(default_factory=RequestPolicy)
+
+    def request_kwargs(self) -> dict:
+        """The model's arguments for CompletionEngine.submit (and prepare_request)."""
+        return {
+            "model": self.api_name,
+            "provider": self.provider,
+            "image_budget": self.image_budget,
+            "context_budget": self.context_budget,
+            "policy": self.request_policy,
+        }
 
 
-class ModelManager:
-    def __init__(self):
-        self._models: dict[str, Model] = {
-            "3": Model(shortname="o3", name="OpenAI o3", api_name="o3"),
-            "4": Model(shortname="4o", name="OpenAI 4o", api_name="gpt-4o"),
-            "5": Model(shortname="4.5", name="OpenAI 4.5", api_name="gpt-4.5-preview"),
+MODEL_SETTINGS = {
+    "image_budget": ImageBudget,
+    "context_budget": ContextBudget,
+    "request_policy": RequestPolicy,
+}
+
+
+def load_models(path: str) -> tuple[dict[str, Model], str | None]:
+    """Load the model registry (see models.json): the models by their menu key, and
+    the key of the default model.
+
+    Raises:
+        ValueError: If the file isn't a valid registry
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            registry = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid model registry {path}: {e}") from e
+    try:
+        providers = {
+            name: Provider(name=name, **options)
+            for name, options in registry.get("providers", {}).items()
         }
-        self._current_key = self._models.keys().__iter__().__next__()
+        providers.setdefault("openai", Provider())
+        models = {}
+        for key, options in registry["models"].items():
+            options = dict(options)
+            provider = options.pop("provider", "openai")
+            if provider not in providers:
+                raise ValueError(f"model {key} has an unknown provider {provider!r}")
+            for name, cls in MODEL_SETTINGS.items():
+                if name in options:
+                    options[name] = cls(**options[name])
+            models[str(key)] = Model(provider=providers[provider], **options)
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f"Invalid model registry {path}: {e}") from e
+    if not models:
+        raise ValueError(f"Invalid model registry {path}: no models")
+    default = registry.get("default")
+    if default is not None and str(default) not in models:
+        raise ValueError(f"Invalid model registry {path}: unknown default {default!r}")
+    return models, None if default is None else str(default)
+
+
+FanoutMode = Literal["off", "race", "compare"]
+
+
+class ModelManager:
+    FANOUT_MODES: list[FanoutMode] = ["off", "race", "compare"]
+
+    def __init__(self, models: dict[str, Model], default_key: str | None = None):
+        if not models:
+            raise ValueError("No models")
+        self._models = dict(models)
+        self._current_key = default_key or next(iter(self._models))
+        # Fan-out sends each request to several models at once (see llm/fanout.py):
+        self.fanout_mode: FanoutMode = "off"
+        self.fanout_keys: list[str] = list(self._models)
+
+    @classmethod
+    def from_file(cls, path: str = "models.json") -> "ModelManager":
+        """A model manager with the models of a registry file (see load_models)."""
+        return cls(*load_models(path))
+
+    @property
+    def models(self) -> dict[str, Model]:
+        """The models by their menu key."""
+        return dict(self._models)
+
+    @property
+    def current_key(self) -> str:
+        return self._current_key
 
     @property
     def current_model(self) -> Model:
@@ -29,3 +211,21 @@ class ModelManager:
 
     def has_key(self, key) -> bool:
         return key in self._models
+
+    @property
+    def fanout_models(self) -> list[Model]:
+        return [self._models[key] for key in self.fanout_keys]
+
+    def set_fanout(self, mode: FanoutMode, keys: list[str] | None = None) -> None:
+        if mode not in self.FANOUT_MODES:
+            raise ValueError(f"Unknown fan-out mode: {mode}")
+        if keys:
+            unknown = [key for key in keys if key not in self._models]
+            if unknown:
+                raise ValueError(f"Unknown model keys: {', '.join(unknown)}")
+            self.fanout_keys = list(keys)
+        self.fanout_mode = mode
+
+    def cycle_fanout_mode(self) -> None:
+        idx = self.FANOUT_MODES.index(self.fanout_mode)
+        self.fanout_mode = self.FANOUT_MODES[(idx + 1) % len(self.FANOUT_MODES)]
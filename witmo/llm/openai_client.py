@@ -1,7 +1,122 @@
-import os
-from openai import OpenAI
+"""
+Shared OpenAI clients for Witmo
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY environment variable not set.")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+Completions and TTS all go through clients made here (one per Provider, see
+models.py), with the same explicitly configured HTTP transport: a keep-alive connection
+pool, connect/read/write timeouts, and HTTP/2 if the `h2` package is installed.
+prewarm() opens a connection in the background (DNS, TCP and TLS), so the first request
+doesn't pay for the handshakes while the user waits.
+
+openai and httpx are only imported when the first client is created (they take a while
+to import).
+"""
+
+import importlib.util
+import threading
+import time
+from loguru import logger
+from .models import Provider
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 300.0  # Seconds an idle connection is kept open
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 120.0  # Between streamed chunks; reasoning models think a while
+WRITE_TIMEOUT = 30.0  # Uploading an image
+MAX_RETRIES = 2
+
+_clients: dict[str, object] = {}  # By provider name
+_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(
+        READ_TIMEOUT, connect=CONNECT_TIMEOUT, write=WRITE_TIMEOUT, pool=CONNECT_TIMEOUT
+    )
+
+
+def _http_client_options() -> dict:
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        "timeout": _timeout(),
+        "http2": http2_available(),
+    }
+
+
+def create_client(
+    base_url: str | None = None, key: str | None = None, max_retries: int = MAX_RETRIES
+):
+    """A new OpenAI client with Witmo's transport settings. With a base_url (e.g., of
+    the mock server), no API key is needed. `max_retries` is the client's own retries
+    of failed requests (the CompletionEngine uses 0 and retries by its RequestPolicy).
+    """
+    from openai import DefaultHttpxClient, OpenAI
+
+    return OpenAI(
+        api_key=key or ("unused" if base_url else Provider().api_key()),
+        base_url=base_url,
+        timeout=_timeout(),
+        max_retries=max_retries,
+        http_client=DefaultHttpxClient(**_http_client_options()),
+    )
+
+
+def create_async_client(
+    base_url: str | None = None, key: str | None = None, max_retries: int = MAX_RETRIES
+):
+    """Like create_client, for an asyncio event loop (see CompletionEngine)."""
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    return AsyncOpenAI(
+        api_key=key or ("unused" if base_url else Provider().api_key()),
+        base_url=base_url,
+        timeout=_timeout(),
+        max_retries=max_retries,
+        http_client=DefaultAsyncHttpxClient(**_http_client_options()),
+    )
+
+
+def get_client(provider: Provider | None = None):
+    """The shared (synchronous) client of a provider (default: OpenAI), created on
+    first use.
+    """
+    provider = provider or Provider()
+    with _lock:
+        if provider.name not in _clients:
+            key = provider.api_key()
+            _clients[provider.name] = create_client(provider.base_url, key)
+            logger.debug(
+                f"Created {provider.name} client (HTTP/2: {http2_available()})"
+            )
+        return _clients[provider.name]
+
+
+def prewarm(client=None) -> threading.Thread:
+    """Open a connection of the client (default: the shared one) in the background
+    with a cheap request.
+    """
+
+    def _prewarm():
+        start = time.perf_counter()
+        try:
+            (client or get_client()).models.list()
+            elapsed = time.perf_counter() - start
+            logger.debug(f"Pre-warmed the API connection in {elapsed:.2f}s")
+        except Exception as e:
+            logger.debug(f"Pre-warming the API connection failed: {e}")
+
+    thread = threading.Thread(target=_prewarm, name="witmo-prewarm", daemon=True)
+    thread.start()
+    return thread
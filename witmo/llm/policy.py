@@ -0,0 +1,128 @@
+"""
+Request policy helpers for the CompletionEngine: which errors are worth a retry, how
+long to back off, when to hedge, and counters of what happened.
+
+The policy itself (timeouts, retries, hedging) is configured per model with a
+RequestPolicy (see models.py).
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from loguru import logger
+from .models import RequestPolicy
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed attempt (before the first token) should be retried."""
+    if isinstance(error, TimeoutError):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(error, openai.APIConnectionError):  # Incl. APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt: int, policy: RequestPolicy) -> float:
+    """Seconds to wait before retry number `attempt` (from 0), with full jitter, so
+    clients that failed together don't retry together.
+    """
+    return random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2**attempt))
+
+
+class LatencyStats:
+    """Recent times to first token per model, to decide when to hedge."""
+
+    def __init__(self, max_samples: int = 50):
+        self._samples: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=max_samples)
+        )
+        self._lock = threading.Lock()
+
+    def add(self, model: str, ttft: float) -> None:
+        with self._lock:
+            self._samples[model].append(ttft)
+
+    def percentile(self, model: str, p: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples[model])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def hedge_delay(self, model: str, policy: RequestPolicy) -> float | None:
+        """Seconds without a first token after which to send a hedged request, or None
+        if hedging is off or there are too few samples yet.
+        """
+        if not policy.hedge:
+            return None
+        with self._lock:
+            num_samples = len(self._samples[model])
+        if num_samples < policy.hedge_min_samples:
+            return None
+        return max(policy.hedge_min_delay, self.percentile(model, policy.hedge_percentile))
+
+
+class RequestStats:
+    """Counters of the engine's requests. Thread-safe."""
+
+    FIELDS = ("requests", "failures", "timeouts", "retries", "hedges", "hedge_wins")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def __str__(self):
+        return ", ".join(f"{name}: {getattr(self, name)}" for name in self.FIELDS)
+
+    def log(self) -> None:
+        if self.requests:
+            logger.info(f"Request stats: {self}")
+
+
+if __name__ == "__main__":
+    from .engine import CompletionEngine
+    from .mock_server import MockOpenAIServer
+
+    fast = RequestPolicy(
+        first_token_timeout=1.0, stall_timeout=1.0, deadline=5.0, backoff_base=0.1
+    )
+    hedged = RequestPolicy(hedge=True, hedge_min_samples=3, hedge_min_delay=0.1)
+    with MockOpenAIServer(first_token_delay=0.1, token_delay=0.01) as server:
+        engine = CompletionEngine(base_url=server.base_url)
+
+        def run(name: str, policy: RequestPolicy, model: str = "mock") -> None:
+            start = time.perf_counter()
+            handle = engine.submit(name, model=model, policy=policy)
+            handle.wait()
+            result = repr(handle.error) if handle.error else repr(handle.text)
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {handle.state} after {elapsed:.2f}s {result}")
+
+        server.inject(status=503, times=2)
+        run("Two 503s, then OK", fast)
+        server.inject(status=400)
+        run("400 (not retried)", fast)
+        server.inject(delay=3.0)
+        run("First token late, retried", fast)
+        server.inject(stall=2.0)
+        run("Stall after the first token", fast)
+        for _ in range(3):  # Times to first token of a fresh model
+            run("Hedging warm-up", hedged, "hedged")
+        server.inject(delay=2.0)
+        run("Slow, hedged", hedged, "hedged")
+        print(f"Stats: {engine.stats}")
+        engine.close()
@@ -0,0 +1,193 @@
+"""
+Response cache for repeated captures.
+
+Pressing space several times on the same screen (an inventory, the map, ...) would
+otherwise trigger a full upload and a paid completion every time. Completions of image
+requests are cached, keyed by the image's perceptual hash (dHash), the prompt, the model
+and a hash of the system prompt. A near-duplicate capture (small Hamming distance between
+the hashes) with the same prompt, model and system prompt is answered from the cache.
+
+The cache lives in `history/<game>/response_cache.jsonl` and is bounded by the number
+of entries, the total size of the responses and their age. New entries are appended as
+one JSON line each; the file is only rewritten (without the evicted entries) on load
+and once it holds twice as many lines as there are entries. An old
+`response_cache.json` is imported on load.
+
+Requests are prepared and recorded on several threads, so all access is locked.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from loguru import logger
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CacheEntry:
+    image_hash: int
+    prompt: str
+    model: str
+    system_hash: str
+    response: str
+    created: float
+
+
+def _dumps(entry: CacheEntry) -> str:
+    return json.dumps(asdict(entry), ensure_ascii=False) + "\n"
+
+
+class ResponseCache:
+    """Persistent cache of completions for image requests.
+
+    Args:
+        file_location: Directory of the cache file (the game's history directory).
+        max_distance: Maximum Hamming distance between two image hashes to count as
+            the same image.
+        max_entries: Maximum number of entries; the oldest are evicted first.
+        max_bytes: Maximum total size of the cached responses.
+        max_age: Maximum age of an entry in seconds.
+    """
+
+    def __init__(
+        self,
+        file_location: str,
+        file_name: str = "response_cache.jsonl",
+        max_distance: int = 6,
+        max_entries: int = 500,
+        max_bytes: int = 2 * 1024 * 1024,
+        max_age: float = 7 * 24 * 3600,
+    ):
+        self.file_path = os.path.join(file_location, file_name)
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.entries: list[CacheEntry] = []
+        self.hits = 0
+        self.misses = 0
+        self._num_lines = 0  # In the file, incl. evicted entries
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _read_entries(path: str, lines: bool) -> list[CacheEntry]:
+        """Read a cache file: JSON lines, or (if not `lines`) an old JSON list."""
+        with open(path, "r", encoding="utf-8") as f:
+            if not lines:
+                return [CacheEntry(**item) for item in json.load(f)]
+            entries = []
+            skipped = 0
+            for line in f:
+                try:
+                    entries.append(CacheEntry(**json.loads(line)))
+                except (json.JSONDecodeError, TypeError):
+                    skipped += 1  # E.g., torn by a crash while appending
+        if skipped:
+            logger.warning(f"Skipped {skipped} invalid response cache entries")
+        return entries
+
+    def load(self) -> None:
+        legacy_path = os.path.splitext(self.file_path)[0] + ".json"
+        path, lines = self.file_path, True
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            path, lines = legacy_path, False
+        if not os.path.exists(path):
+            return
+        with self._lock:
+            try:
+                self.entries = self._read_entries(path, lines)
+                logger.info(f"Loaded response cache with {len(self.entries)} entries")
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.warning(f"Response cache file was corrupted, starting empty: {e}")
+                self.entries = []
+            self._evict()
+            self._rewrite()
+        if path == legacy_path:
+            os.remove(legacy_path)
+
+    def _rewrite(self) -> None:
+        """Write the current entries to a fresh file (call with the lock held)."""
+        tmp_path = self.file_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(_dumps(e) for e in self.entries)
+            os.replace(tmp_path, self.file_path)
+            self._num_lines = len(self.entries)
+        except Exception as e:
+            logger.error(f"Error saving response cache: {str(e)}")
+
+    def save(self) -> None:
+        """Entries are written as they're stored; this only drops evicted ones."""
+        with self._lock:
+            self._rewrite()
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.max_age
+        self.entries = [e for e in self.entries if e.created >= cutoff]
+        self.entries = self.entries[-self.max_entries :]
+        size = sum(len(e.response) for e in self.entries)
+        while size > self.max_bytes and self.entries:
+            size -= len(self.entries.pop(0).response)
+
+    def lookup(
+        self, image_hash: int, prompt: str, model: str, system_prompt: str
+    ) -> str | None:
+        """Return the cached response of the closest matching image, if any."""
+        system_hash = hash_text(system_prompt)
+        with self._lock:
+            self._evict()
+            entries = list(self.entries)
+        best, best_distance = None, self.max_distance + 1
+        for entry in entries:
+            if (entry.prompt, entry.model, entry.system_hash) != (
+                prompt,
+                model,
+                system_hash,
+            ):
+                continue
+            distance = (entry.image_hash ^ image_hash).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        with self._lock:
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        logger.info(f"Response cache hit (image hash distance {best_distance})")
+        return best.response
+
+    def store(
+        self, image_hash: int, prompt: str, model: str, system_prompt: str, response: str
+    ) -> None:
+        entry = CacheEntry(
+            image_hash, prompt, model, hash_text(system_prompt), response, time.time()
+        )
+        with self._lock:
+            self.entries.append(entry)
+            self._evict()
+            if self._num_lines >= 2 * max(len(self.entries), 16):
+                self._rewrite()
+                return
+            try:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(_dumps(entry))
+                self._num_lines += 1
+            except Exception as e:
+                logger.error(f"Error saving response cache: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -1,19 +1,23 @@
-from witmo.image import CroppedImage, BasicImage, Image
+from collections import deque
+from loguru import logger
+from witmo.image import CroppedImage, BasicImage, Image, artifact_cache
 from witmo.session import Session
 from readchar import readkey, key
-from witmo.llm.completion import generate_completion
+from witmo.llm.engine import RequestHandle
+from witmo.llm.fanout import FanOut
+from witmo.speculation import Speculation
 from witmo.tui import select_prompt, select_llm
 from witmo.tui.io import (
     tt,
     tp,
     menu_panel,
     request_panel,
-    response_panel,
+    stream_response,
+    stream_comparison,
     get_textinput,
-    dot_animation,
-    background_animation,
 )
 from witmo.tui.audio import play_ding, speak_text
+from witmo.tui.keys import key_polling, key_pressed, read_pressed_key
 
 
 main_menu = [
@@ -22,103 +26,119 @@ main_menu = [
     ("", ""),
     ("p", "pick preconfigured prompt and send it"),
     ("c", "show latest capture again"),
+    ("r", "resend last image request, bypassing the cache"),
     ("m", "select LLM"),
+    ("f", "cycle fan-out mode (several LLMs at once)"),
     ("a", "cycle audio mode"),
     ("esc", "quit"),
 ]
 
 
-def mainloop(session: Session, initial_image: BasicImage | None = None) -> None:
-    """Main interactive loop for the application.
+def answer_title(number: int, fanout: FanOut, handle: RequestHandle) -> str:
+    model = fanout.models[fanout.handles.index(handle)]
+    if handle.state == "done" or handle.latency is not None:
+        status = f"{handle.latency:.1f}s" if handle.state == "done" else handle.state
+    else:
+        status = "answering..." if handle.text else "waiting..."
+    return f"{number}. {model.shortname} • {status}"
 
-    Behavior:
-    - If initial_image is provided, the loop will immediately use it as the image for
-      the first prompt selection, skipping the manual and image capture step.
-    - Otherwise, the user is prompted to capture a new image, start a chat without an
-      image, or quit.
-    """
 
-    last_image: Image | None = None  # Save the last capture so it can be shown again
-    suppress_menu = False  # Suppress the main menu in certain cases
+def choose_answer(fanout: FanOut) -> None:
+    """Let the user pick the compared answer to keep in the history."""
+    done = [h for h in fanout.handles if h.state == "done"]
+    if not done:
+        return
+    keys = {str(fanout.handles.index(h) + 1): h for h in done}
+    tt(f"Keep which answer in the history? {', '.join(keys)} • esc: none")
     while True:
+        k = readkey()
+        if k in keys:
+            fanout.choose(keys[k])
+            tt(f"Kept answer {k}.")
+            return
+        elif k == key.ESC:
+            tt("Kept no answer.")
+            return
 
-        # Setup, show menu, handle special case where initial_image is provided:
-        prompt = None
-        image: Image | None = None
-        if initial_image:
-            image = initial_image
-            k = key.SPACE
-        else:
-            tt()
-            if not suppress_menu:
-                tt(menu_panel("Main menu", main_menu, "top"))
-                state_str = (
-                    f"[Audio: {session.audio_mode.mode.upper()} • "
-                    f"LLM: {session.model_manager.current_model.shortname} • "
-                    f"Crop: {'ON' if session.do_crop else 'OFF'}]"
-                )
-                tt(state_str)
-            k = readkey()
-        suppress_menu = False
 
-        # Handle the different keys:
-        if k == "m":
-            select_llm.select_llm(session)
-            continue
-        elif k == "a":
-            session.audio_mode.cycle()
-            tt(f"Audio mode is now: {session.audio_mode.mode.upper()}.")
-            suppress_menu = True
-            continue
-        elif k == "c":
-            if last_image:
-                tt("Showing last capture...")
-                last_image.preview()
-            else:
-                tt("No last capture available (in the current session).", style="error")
-            suppress_menu = True
-            continue
-        if k == key.SPACE:
-            if not image:
-                tt("Capturing image...")
-                image = session.camera.capture()
-                last_image = image  # Save the last capture for potential reuse
-            if session.do_crop:
-                tt("Cropping...")
-                image = CroppedImage(image)
-            image.preview()
-            prompt = select_prompt.select_prompt(session)
-        elif k == "p":
-            prompt = select_prompt.select_prompt(session)
-        elif k == key.ENTER:
-            assert image is None
-            prompt = get_textinput("Enter your prompt:")
-        elif k == key.ESC:
-            break
-        else:
-            tt("Unknown key. Please select a valid option.", style="error")
-            suppress_menu = True
-            continue
+def start_speculation(session: Session, image: Image) -> Speculation:
+    """Crop and prepare the image (and, with --speculate, submit the most picked
+    prompt) while the user picks a prompt.
+    """
+    model_manager = session.model_manager
+    prompt = None
+    if session.speculate and model_manager.fanout_mode == "off":
+        key_ = session.prompt_stats.most_picked(session.prompts)
+        if key_ is not None:
+            prompt = session.prompts[key_]["prompt"]
+    return Speculation(
+        session.completion_engine,
+        image,
+        model_manager.current_model,
+        prompt,
+        crop=session.do_crop,
+        history=session.history,
+        system_prompt=session.system_prompt,
+        cache=session.response_cache,
+    )
 
-        if not prompt:
-            tt("No prompt provided. Back to main menu.", style="error")
-            continue
 
-        # Now talk to the LLM(s):
-        assert prompt is not None
-        tp(request_panel(prompt))
-        tt("Waiting for a response...")
+def follow_responses(
+    session: Session, pending: deque[RequestHandle | FanOut]
+) -> str | None:
+    """Show the responses of pending requests in order, as they stream in.
 
-        with background_animation(dot_animation):
-            response = generate_completion(
-                prompt,
-                history=session.history,
-                system_prompt=session.system_prompt,
-                image=image,
-                model=session.model_manager.current_model.api_name,
-            )
+    ESC cancels the request whose response is being shown. Any other key stops following
+    (the requests keep running in the background) and is returned, so the main loop can
+    handle it, e.g., capture the next image.
+    """
+    while pending:
+        handle = pending[0]
+        pressed = []
+
+        def interrupted() -> bool:
+            if key_pressed():
+                pressed.append(read_pressed_key())
+                return True
+            return False
 
-        tp(response_panel(response))
+        hint = "esc: cancel • space: capture next"
+        with key_polling():
+            if isinstance(handle, FanOut) and handle.mode == "compare":
+                fanout = handle
+                stream_comparison(
+                    lambda: [
+                        (answer_title(i, fanout, h), h.text)
+                        for i, h in enumerate(fanout.handles, 1)
+                    ],
+                    lambda: fanout.finished,
+                    interrupted=interrupted,
+                    hint=hint,
+                )
+            else:
+                response = stream_response(
+                    handle.chunks(), interrupted=interrupted, hint=hint
+                )
+        if pressed and pressed[0] != key.ESC:
+            return pressed[0]
+        pending.popleft()
+        if pressed:
+            handle.cancel()
+            tt("Request cancelled.", style="warning")
+            continue
+        if handle.state == "failed":
+            tt(f"Request failed: {handle.error}", style="error")
+            continue
+        if isinstance(handle, FanOut):
+            if handle.mode == "compare":
+                choose_answer(handle)
+            elif handle.winner is not None:
+                handle.choose(handle.winner)
+            response = handle.text
+            if not response:
+                continue
+        if handle.from_cache:
+            tt("Answered from the response cache. Press 'r' to ask the LLM again.")
 
         if session.audio_mode.should_ding():
             play_ding()
@@ -126,5 +146,171 @@ def mainloop(session: Session, initial_image: BasicImage | None = None) -> None:
         if session.audio_mode.should_voice():
             tt("Generating voice output (in the background)...")
             speak_text(response)
+    return None
+
+
+def mainloop(session: Session, initial_image: BasicImage | None = None) -> None:
+    """Main interactive loop for the application.
+
+    Behavior:
+    - If initial_image is provided, the loop will immediately use it as the image for
+      the first prompt selection, skipping the manual and image capture step.
+    - Otherwise, the user is prompted to capture a new image, start a chat without an
+      image, or quit.
+    - Requests run in the background. While responses stream in, ESC cancels the one
+      being shown and the other keys work as in the main menu, so the next image can be
+      captured and asked about before the previous answer is complete.
+    """
+
+    try:
+        last_image: Image | None = None  # Save the last capture so it can be shown again
+        last_request: tuple[str, Image] | None = None  # Last image request, for refresh
+        suppress_menu = False  # Suppress the main menu in certain cases
+        pending: deque[RequestHandle | FanOut] = deque()  # Requests whose responses weren't shown yet
+        while True:
+
+            # Setup, show responses or menu, handle special case where initial_image is
+            # provided:
+            prompt = None
+            refresh = False
+            image: Image | None = None
+            speculation: Speculation | None = None
+            k = follow_responses(session, pending) if pending else None
+            if initial_image:
+                image = initial_image
+                initial_image = None
+                k = key.SPACE
+            elif k is None:
+                tt()
+                if not suppress_menu:
+                    tt(menu_panel("Main menu", main_menu, "top"))
+                    model_manager = session.model_manager
+                    llm_str = model_manager.current_model.shortname
+                    if model_manager.fanout_mode != "off":
+                        models = "/".join(m.shortname for m in model_manager.fanout_models)
+                        llm_str = f"{model_manager.fanout_mode.upper()} {models}"
+                    usage = session.completion_engine.usage
+                    cache_str = (
+                        f" • Prompt cache: {usage.cached_share:.0%}" if usage.requests else ""
+                    )
+                    responses = session.response_cache
+                    if responses is not None and responses.hits + responses.misses:
+                        cache_str += (
+                            f" • Cached answers: {responses.hits}/"
+                            f"{responses.hits + responses.misses}"
+                        )
+                    state_str = (
+                        f"[Audio: {session.audio_mode.mode.upper()} • "
+                        f"LLM: {llm_str} • "
+                        f"Crop: {'ON' if session.do_crop else 'OFF'}{cache_str}]"
+                    )
+                    tt(state_str)
+                k = readkey()
+            suppress_menu = False
+
+            # Handle the different keys:
+            if k == "m":
+                select_llm.select_llm(session)
+                continue
+            elif k == "f":
+                session.model_manager.cycle_fanout_mode()
+                mode = session.model_manager.fanout_mode
+                models = ", ".join(m.shortname for m in session.model_manager.fanout_models)
+                tt(
+                    f"Fan-out mode is now: {mode.upper()}"
+                    + (f" ({models})." if mode != "off" else ".")
+                )
+                suppress_menu = True
+                continue
+            elif k == "a":
+                session.audio_mode.cycle()
+                tt(f"Audio mode is now: {session.audio_mode.mode.upper()}.")
+                suppress_menu = True
+                continue
+            elif k == "c":
+                if last_image:
+                    tt("Showing last capture...")
+                    last_image.preview()
+                else:
+                    tt("No last capture available (in the current session).", style="error")
+                suppress_menu = True
+                continue
+            if k == "r":
+                if not last_request:
+                    tt("No image request to resend (in the current session).", style="error")
+                    suppress_menu = True
+                    continue
+                prompt, image = last_request
+                refresh = True
+            elif k == key.SPACE:
+                if not image:
+                    tt("Capturing image...")
+                    image = session.camera.capture()
+                    last_image = image  # Save the last capture for potential reuse
+                speculation = start_speculation(session, image)
+                speculation.preview()
+                prompt = select_prompt.select_prompt(session)
+                image = speculation.image  # Cropped in the meantime
+            elif k == "p":
+                prompt = select_prompt.select_prompt(session)
+            elif k == key.ENTER:
+                assert image is None
+                prompt = get_textinput("Enter your prompt:")
+            elif k == key.ESC:
+                break
+            else:
+                tt("Unknown key. Please select a valid option.", style="error")
+                suppress_menu = True
+                continue
+
+            if not prompt:
+                if speculation is not None:
+                    speculation.discard()
+                tt("No prompt provided. Back to main menu.", style="error")
+                continue
+
+            # Now talk to the LLM(s), the response is shown at the top of the loop:
+            assert prompt is not None
+            tp(request_panel(prompt))
+            model_manager = session.model_manager
+            handle = None
+            if speculation is not None:
+                handle = speculation.take(prompt, session.prompt_stats)
+            if handle is not None:
+                pass  # Already running since the capture
+            elif model_manager.fanout_mode != "off":
+                handle = FanOut(
+                    session.completion_engine,
+                    model_manager.fanout_models,
+                    model_manager.fanout_mode,
+                    prompt,
+                    history=session.history,
+                    system_prompt=session.system_prompt,
+                    image=image,
+                    cache=session.response_cache,
+                    refresh=refresh,
+                )
+            else:
+                handle = session.completion_engine.submit(
+                    prompt,
+                    history=session.history,
+                    system_prompt=session.system_prompt,
+                    image=image,
+                    cache=session.response_cache,
+                    refresh=refresh,
+                    **model_manager.current_model.request_kwargs(),
+                )
+            pending.append(handle)
+            if image:
+                last_request = (prompt, image)
+    finally:
+        session.completion_engine.close()
+        session.history.save()
+        logger.debug(f"Image artifact cache stats: {artifact_cache.stats()}")
+        if session.response_cache is not None:
+            logger.info(f"Response cache stats: {session.response_cache.stats()}")
+        if session.do_crop:
+            from witmo.screen_detection import CropTracker
 
-        image = None
+            if isinstance(CroppedImage.detector, CropTracker):
+                logger.debug(f"Crop tracker stats: {CroppedImage.detector.stats()}")
@@ -0,0 +1,193 @@
+"""
+Offline benchmark of Witmo's capture-to-response pipeline.
+
+Runs the whole pipeline without a phone or network: the capture comes from the fake ADB
+server (via AdbCamera), the image is encoded and the history context packed for the
+model from the registry, and the response is streamed from the mock OpenAI server (via
+the CompletionEngine) and recorded in a fresh history. It reports how long each stage
+took, as percentiles over the runs, and the throughput:
+
+    python -m witmo.pipeline_benchmark --runs 20 --concurrency 4 --profile pipeline.prof
+
+With --concurrency N, up to N requests are in flight at once (a load test). With
+--profile, all threads of the pipeline are profiled with cProfile; Witmo's slowest
+functions (by cumulative time) are printed and the stats saved for e.g. snakeviz.
+"""
+
+import argparse
+import contextlib
+import cProfile
+import pstats
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from loguru import logger
+
+
+class ThreadProfiler:
+    """cProfile for the calling thread and all threads started while it's enabled,
+    except the request handlers of the fake servers (they aren't part of the pipeline).
+    """
+
+    def __init__(self):
+        self.profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _start(self, *args) -> None:
+        sys.setprofile(None)
+        if "process_request_thread" in threading.current_thread().name:
+            return
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self) -> "ThreadProfiler":
+        threading.setprofile(self._start)
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        return False
+
+    def stats(self) -> pstats.Stats:
+        return pstats.Stats(*self.profiles)
+
+
+def synthetic_photo(width: int = 1920, height: int = 1080) -> bytes:
+    """A JPEG photo with some structure (so it doesn't compress to nothing)."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    img += rng.normal(0, 12, img.shape).astype(np.float32)
+    for _ in range(40):  # "HUD" boxes
+        x0, y0 = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 80))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(img, (x0, y0), (x0 + 200, y0 + 80), color, -1)
+    ok, buf = cv2.imencode(".jpg", np.clip(img, 0, 255).astype(np.uint8))
+    if not ok:
+        raise RuntimeError("Could not encode the synthetic photo")
+    return buf.tobytes()
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "-"
+    values = sorted(values)
+    p90 = values[min(len(values) - 1, int(0.9 * len(values)))]
+    return (
+        f"median {statistics.median(values) * 1000:7.1f} ms, "
+        f"p90 {p90 * 1000:7.1f} ms, max {values[-1] * 1000:7.1f} ms"
+    )
+
+
+def main() -> int:
+    from witmo.camera.adb_camera import AdbCamera
+    from witmo.camera.fake_adb import FakeAdbServer
+    from witmo.llm import system_prompt
+    from witmo.llm.engine import CompletionEngine
+    from witmo.llm.history import History
+    from witmo.llm.mock_server import MockOpenAIServer
+    from witmo.llm.models import ModelManager
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--runs", "-n", type=int, default=10)
+    parser.add_argument(
+        "--concurrency", "-c", type=int, default=1, help="max requests in flight"
+    )
+    parser.add_argument("--models", default="models.json", help="model registry")
+    parser.add_argument("--model", help="key of the model (default: the registry's)")
+    parser.add_argument("--photo", help="JPEG to capture (default: a synthetic one)")
+    parser.add_argument("--save-delay", type=float, default=0.3)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--profile", metavar="FILE", help="profile and save the stats")
+    parser.add_argument("--top", type=int, default=20, help="show the N slowest functions")
+    args = parser.parse_args()
+
+    logger.remove()
+    model_manager = ModelManager.from_file(args.models)
+    if args.model:
+        model_manager.set_current_model_by_key(args.model)
+    model = model_manager.current_model
+    if args.photo:
+        with open(args.photo, "rb") as f:
+            photo = f.read()
+    else:
+        photo = synthetic_photo()
+    prompt = system_prompt.prompt.format(game_name="Benchmark", spoiler_prompt="")
+
+    output_dir = tempfile.mkdtemp(prefix="witmo_bench_")
+    captures: list[float] = []
+    handles = []
+    profiler = ThreadProfiler() if args.profile else None
+    try:
+        with (
+            FakeAdbServer(photo_bytes=photo, save_delay=args.save_delay) as adb,
+            MockOpenAIServer(args.first_token_delay, args.token_delay) as server,
+        ):
+            camera = AdbCamera(output_dir=output_dir, adb_port=adb.port)
+            history = History(output_dir)
+            with profiler or contextlib.nullcontext():
+                engine = CompletionEngine(base_url=server.base_url)
+                engine.warm_up(model.provider)  # Like at startup
+                start = time.perf_counter()
+                for i in range(args.runs):
+                    while len(engine.in_flight) >= args.concurrency:
+                        engine.in_flight[0].wait()
+                    capture_start = time.perf_counter()
+                    image = camera.capture()
+                    captures.append(time.perf_counter() - capture_start)
+                    handles.append(
+                        engine.submit(
+                            f"What should I do here? ({i + 1})",
+                            image=image,
+                            history=history,
+                            system_prompt=prompt,
+                            **model.request_kwargs(),
+                        )
+                    )
+                for handle in handles:
+                    handle.wait()
+                elapsed = time.perf_counter() - start
+                engine.close()
+            camera.close()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    done = [h for h in handles if h.state == "done"]
+    print(
+        f"{args.runs} runs with {model.shortname}'s settings, "
+        f"concurrency {args.concurrency}, {len(photo) // 1024} KB photo:"
+    )
+    print(f"  Capture:      {percentiles(captures)}")
+    print(f"  Prepare:      {percentiles([h.prepare_time for h in done])}")
+    print(f"  First token:  {percentiles([h.ttft for h in done if h.ttft])}")
+    print(f"  Submit->done: {percentiles([h.latency for h in done])}")
+    print(
+        f"  {len(done)} of {args.runs} done in {elapsed:.2f}s "
+        f"({len(done) / elapsed:.2f} responses/s), history: {len(history)} messages"
+    )
+    print(f"  Requests: {engine.stats}")
+    print(f"  Prompt cache: {engine.usage.cached_share:.0%} of prompt tokens")
+
+    if profiler is not None:
+        stats = profiler.stats()
+        stats.dump_stats(args.profile)
+        print(f"\nProfile of {len(profiler.profiles)} threads (saved to {args.profile}):")
+        # Only Witmo's functions; the rest is mostly waiting in the standard library:
+        stats.sort_stats("cumulative").print_stats(r"witmo[/\\]", args.top)
+    return 0 if len(done) == args.runs else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+Image preview for Witmo.
+
+A single long-lived worker thread owns all preview windows. Previews are queued; the
+worker shows the newest one per window right away, drops the stale ones, reuses the
+window, and closes it once its display time is up. Images are downscaled to the preview
+width before they reach `imshow`.
+
+The display backend is pluggable, so the worker runs headless with HeadlessDisplay
+(e.g., on machines without a GUI, or to check what would have been shown).
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Protocol
+import cv2
+import numpy as np
+from loguru import logger
+
+
+class PreviewDisplay(Protocol):
+    """Backend that actually shows the preview windows."""
+
+    def show(self, window_name: str, img: np.ndarray) -> None:
+        ...
+
+    def poll(self, ms: int) -> None:
+        ...
+
+    def close(self, window_name: str) -> None:
+        ...
+
+
+class OpenCVDisplay:
+    """Shows previews in OpenCV HighGUI windows. Must only be used from one thread."""
+
+    def __init__(self):
+        self._windows: set[str] = set()
+
+    def show(self, window_name: str, img: np.ndarray) -> None:
+        h, w = img.shape[:2]
+        if window_name not in self._windows:
+            cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+            self._windows.add(window_name)
+        cv2.resizeWindow(window_name, w, h)
+        cv2.imshow(window_name, img)
+        try:
+            cv2.setWindowProperty(window_name, cv2.WND_PROP_TOPMOST, 1)
+        except Exception as e:
+            logger.debug(f"Could not set window as topmost: {e}")
+
+    def poll(self, ms: int) -> None:
+        cv2.waitKey(ms)
+
+    def close(self, window_name: str) -> None:
+        if window_name in self._windows:
+            self._windows.discard(window_name)
+            cv2.destroyWindow(window_name)
+            cv2.waitKey(1)
+
+
+class HeadlessDisplay:
+    """Records what would have been shown instead of opening windows."""
+
+    def __init__(self):
+        self.shown: list[tuple[str, tuple[int, ...]]] = []
+        self.closed: list[str] = []
+
+    def show(self, window_name: str, img: np.ndarray) -> None:
+        self.shown.append((window_name, img.shape))
+
+    def poll(self, ms: int) -> None:
+        time.sleep(ms / 1000)
+
+    def close(self, window_name: str) -> None:
+        self.closed.append(window_name)
+
+
+@dataclass
+class PreviewRequest:
+    window_name: str
+    source: np.ndarray | Callable[[], np.ndarray]
+    seconds: float
+    preview_width: int
+
+
+def fit_width(img: np.ndarray, preview_width: int) -> np.ndarray:
+    """Downscale an image array to at most preview_width pixels wide."""
+    h, w = img.shape[:2]
+    if w <= preview_width:
+        return img
+    size = (preview_width, round(h * preview_width / w))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+class PreviewWorker:
+    """Long-lived worker thread that shows queued previews.
+
+    Args:
+        display: Display backend; defaults to OpenCVDisplay, falling back to
+            HeadlessDisplay if OpenCV has no GUI support.
+        poll_ms: How often open windows are serviced and checked for expiry.
+    """
+
+    def __init__(self, display: PreviewDisplay | None = None, poll_ms: int = 50):
+        self.display = display
+        self.poll_ms = poll_ms
+        self._queue: queue.Queue[PreviewRequest | None] = queue.Queue()
+        self._deadlines: dict[str, float] = {}
+        self._thread: threading.Thread | None = None
+        self._pending = 0
+        self._pending_changed = threading.Condition()
+        self.num_shown = 0
+        self.num_dropped = 0
+
+    def start(self) -> "PreviewWorker":
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="witmo-preview", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Close all windows and end the worker thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(
+        self,
+        source: np.ndarray | Callable[[], np.ndarray],
+        seconds: float = 5,
+        preview_width: int = 400,
+        window_name: str = "Witmo Capture",
+    ) -> None:
+        """Queue a preview. `source` is an image array or a function returning one,
+        which is then called on the worker thread. Returns immediately.
+        """
+        with self._pending_changed:
+            self._pending += 1
+        self._queue.put(PreviewRequest(window_name, source, seconds, preview_width))
+        self.start()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Wait until all queued previews have been handled (not until they're closed)."""
+        with self._pending_changed:
+            return self._pending_changed.wait_for(lambda: self._pending == 0, timeout)
+
+    def _done(self, num_requests: int) -> None:
+        with self._pending_changed:
+            self._pending -= num_requests
+            self._pending_changed.notify_all()
+
+    def _drain(
+        self, first: PreviewRequest | None
+    ) -> tuple[list[PreviewRequest], int, bool]:
+        """Collect all queued requests, keeping only the newest per window."""
+        requests = [first]
+        while True:
+            try:
+                requests.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in requests
+        latest: dict[str, PreviewRequest] = {}
+        for request in requests:
+            if request is None:
+                continue
+            if request.window_name in latest:
+                self.num_dropped += 1
+            latest[request.window_name] = request
+        return list(latest.values()), len(requests) - requests.count(None), stop
+
+    def _show(self, request: PreviewRequest) -> None:
+        try:
+            source = request.source
+            img = source() if callable(source) else source
+            img = fit_width(img, request.preview_width)
+            try:
+                self.display.show(request.window_name, img)
+            except cv2.error as e:
+                if not isinstance(self.display, OpenCVDisplay):
+                    raise
+                logger.warning(f"No GUI support for previews, running headless: {e}")
+                self.display = HeadlessDisplay()
+                self.display.show(request.window_name, img)
+            self.num_shown += 1
+            self._deadlines[request.window_name] = time.monotonic() + request.seconds
+            logger.debug(
+                f"Showing preview '{request.window_name}' at {img.shape[1]}x{img.shape[0]}"
+            )
+        except Exception as e:
+            logger.warning(f"Could not display image: {e}")
+
+    def _close_expired(self, everything: bool = False) -> None:
+        now = time.monotonic()
+        for window_name, deadline in list(self._deadlines.items()):
+            if everything or now >= deadline:
+                del self._deadlines[window_name]
+                try:
+                    self.display.close(window_name)
+                except Exception as e:
+                    logger.debug(f"Could not close preview window: {e}")
+                logger.debug(f"Preview '{window_name}' closed.")
+
+    def _run(self) -> None:
+        if self.display is None:
+            self.display = OpenCVDisplay()
+        while True:
+            if self._deadlines:
+                # Keep the open windows responsive while waiting for new previews:
+                self.display.poll(1)
+                timeout = self.poll_ms / 1000
+            else:
+                timeout = None
+            try:
+                first = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._close_expired()
+                continue
+            requests, num_requests, stop = self._drain(first)
+            if stop:
+                self._close_expired(everything=True)
+                self._done(num_requests)
+                return
+            for request in requests:
+                self._show(request)
+            self._done(num_requests)
+            self._close_expired()
+
+
+_worker: PreviewWorker | None = None
+_worker_lock = threading.Lock()
+
+
+def get_preview_worker() -> PreviewWorker:
+    """Return the process-wide preview worker, starting it on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = PreviewWorker().start()
+        return _worker
+
+
+if __name__ == "__main__":
+    display = HeadlessDisplay()
+    worker = PreviewWorker(display=display).start()
+    big = np.zeros((3000, 4000, 3), np.uint8)
+    for _ in range(20):  # Like hammering 'c'
+        worker.submit(big, seconds=0.2)
+    worker.wait_idle()
+    time.sleep(0.5)
+    worker.stop()
+    print(f"Submitted 20, shown {worker.num_shown}, dropped {worker.num_dropped}")
+    print(f"Shapes shown: {sorted(set(shape for _, shape in display.shown))}")
+    print(f"Windows closed: {len(display.closed)}")
@@ -0,0 +1,499 @@
+"""
+TV/screen detection for Witmo's auto-cropping.
+
+Screen detectors implement the ScreenDetector protocol and return a ScreenRegion: the
+axis-aligned bounding box and, if the detector knows them, the screen's four corners,
+which CroppedImage uses to warp the screen to a rectified rectangle.
+
+ContourScreenDetector looks for the screen as a bright quadrilateral with classical
+OpenCV contour analysis. It takes a few milliseconds and finds the corners even when the
+TV is shot at an angle. FallbackScreenDetector combines it with YOLO for captures where
+no quadrilateral is found.
+
+YoloScreenDetector finds the TV (COCO class 'tvmonitor') in a capture with YOLOv8n. To
+keep the crop off the critical path as much as possible, it:
+
+- runs inference on a downscaled copy and scales the box back to full resolution,
+- can run an exported ONNX model with ONNX Runtime on the CPU, optionally int8
+  quantized (needs `onnxruntime`; the export needs `ultralytics` once),
+- can load and warm up the model in a background thread at session start.
+
+CropTracker wraps a detector for setups where the camera doesn't move (e.g., a phone on
+a tripod): it remembers the last crop rectangle and only runs the detector again if a
+cheap check on a thumbnail says the scene geometry has changed.
+
+Run this module directly to benchmark crop latency on a folder of sample captures.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Literal, Protocol
+import cv2
+import numpy as np
+from loguru import logger
+
+Rect = tuple[int, int, int, int]  # x, y, w, h
+Backend = Literal["auto", "pytorch", "onnx", "onnx-int8"]
+
+TV_CLASS_ID = 62  # COCO class ID for 'tvmonitor'
+
+
+@dataclass(frozen=True)
+class ScreenRegion:
+    """Where the screen is in an image."""
+
+    rect: Rect  # Axis-aligned bounding box
+    corners: tuple[tuple[float, float], ...] | None = None  # tl, tr, br, bl if known
+
+
+class ScreenDetector(Protocol):
+    def detect(self, img: np.ndarray) -> ScreenRegion | None: ...
+    def load_in_background(self) -> None: ...
+
+
+class YoloScreenDetector:
+    """Detects the TV/screen region with YOLOv8.
+
+    Args:
+        model_path: Path of the YOLOv8 PyTorch weights (downloaded if missing).
+        backend: "pytorch" (ultralytics), "onnx" (ONNX Runtime), "onnx-int8" (ONNX
+            Runtime with a dynamically quantized model), or "auto" (ONNX if
+            onnxruntime is installed, otherwise PyTorch). The ONNX backends fall
+            back to PyTorch if the model can't be exported or loaded.
+        input_size: Inference resolution (long side) of the downscaled copy.
+        confidence: Minimum confidence for a detection.
+    """
+
+    def __init__(
+        self,
+        model_path: str = "yolov8n.pt",
+        backend: Backend = "auto",
+        input_size: int = 640,
+        confidence: float = 0.25,
+    ):
+        self.model_path = model_path
+        self.backend = self._resolve_backend(backend)
+        self.input_size = input_size
+        self.confidence = confidence
+        self._model = None
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        self._load_error: Exception | None = None
+
+    @staticmethod
+    def _resolve_backend(backend: Backend) -> Backend:
+        if backend == "pytorch":
+            return backend
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            if backend != "auto":
+                logger.warning("onnxruntime is not installed, using PyTorch instead.")
+            return "pytorch"
+        return "onnx" if backend == "auto" else backend
+
+    def _onnx_path(self) -> str:
+        """Return the path of the ONNX model, exporting (and quantizing) it if needed."""
+        onnx_path = os.path.splitext(self.model_path)[0] + ".onnx"
+        if not os.path.exists(onnx_path):
+            from ultralytics import YOLO
+
+            logger.info(f"Exporting {self.model_path} to ONNX (one-time)...")
+            # Dynamic axes, so non-square inputs don't need padding to a square:
+            YOLO(self.model_path).export(
+                format="onnx", imgsz=self.input_size, dynamic=True
+            )
+        if self.backend != "onnx-int8":
+            return onnx_path
+
+        int8_path = os.path.splitext(self.model_path)[0] + ".int8.onnx"
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info("Quantizing ONNX model to int8 (one-time)...")
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return int8_path
+
+    def _load_model(self) -> None:
+        if self.backend == "pytorch":
+            from ultralytics import YOLO
+
+            self._model = YOLO(self.model_path)
+        else:
+            import onnxruntime as ort
+
+            self._model = ort.InferenceSession(
+                self._onnx_path(), providers=["CPUExecutionProvider"]
+            )
+        self._detect(np.zeros((480, 640, 3), np.uint8))  # Warm-up
+
+    def load(self) -> None:
+        """Load the model and run one warm-up inference (only once). If the ONNX model
+        can't be exported or loaded, falls back to PyTorch.
+        """
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                if self.backend != "pytorch":
+                    try:
+                        self._load_model()
+                    except Exception as e:
+                        logger.warning(
+                            f"Could not load the {self.backend} screen detector, "
+                            f"using PyTorch instead: {e}"
+                        )
+                        self.backend = "pytorch"
+                if self.backend == "pytorch":
+                    self._load_model()
+            except Exception as e:
+                self._load_error = e
+                raise
+            finally:
+                self._loaded.set()
+            logger.debug(
+                f"Screen detector ({self.backend}) loaded and warmed up in "
+                f"{time.perf_counter() - start:.2f}s"
+            )
+
+    def load_in_background(self) -> None:
+        """Load and warm up the model in a background thread."""
+
+        def _load():
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Could not load screen detector: {e}")
+
+        threading.Thread(target=_load, daemon=True).start()
+
+    def _downscale(self, img: np.ndarray) -> tuple[np.ndarray, float]:
+        h, w = img.shape[:2]
+        scale = min(1.0, self.input_size / max(h, w))
+        if scale == 1.0:
+            return img, scale
+        size = (round(w * scale), round(h * scale))
+        # Linear is what YOLO's own letterboxing uses, and much faster than area:
+        return cv2.resize(img, size, interpolation=cv2.INTER_LINEAR), scale
+
+    def _detect_pytorch(self, small: np.ndarray) -> tuple[float, ...] | None:
+        results = self._model(small, verbose=False, imgsz=self.input_size)
+        for r in results:
+            for b in r.boxes:
+                if int(b.cls[0]) == TV_CLASS_ID:
+                    return tuple(float(v) for v in b.xyxy[0].cpu().numpy())
+        return None
+
+    def _detect_onnx(self, small: np.ndarray) -> tuple[float, ...] | None:
+        # Letterbox: pad to multiples of the model stride (32), anchored top-left.
+        h, w = small.shape[:2]
+        canvas = np.full((-(-h // 32) * 32, -(-w // 32) * 32, 3), 114, np.uint8)
+        canvas[:h, :w] = small
+        blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True)
+        input_name = self._model.get_inputs()[0].name
+        output = self._model.run(None, {input_name: blob})[0]
+        preds = output[0].T  # (num_boxes, 4 + num_classes), boxes as cx, cy, w, h
+        scores = preds[:, 4 + TV_CLASS_ID]
+        best = int(np.argmax(scores))
+        if scores[best] < self.confidence:
+            return None
+        cx, cy, bw, bh = preds[best, :4]
+        return (cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2)
+
+    def _detect(self, img: np.ndarray) -> Rect | None:
+        small, scale = self._downscale(img)
+        if self.backend == "pytorch":
+            box = self._detect_pytorch(small)
+        else:
+            box = self._detect_onnx(small)
+        if box is None:
+            return None
+        h, w = img.shape[:2]
+        x1, y1, x2, y2 = (round(v / scale) for v in box)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        return (x1, y1, x2 - x1, y2 - y1)
+
+    def detect(self, img: np.ndarray) -> ScreenRegion | None:
+        """Return the region of the most confident TV, or None if there is none."""
+        if not self._loaded.is_set():
+            logger.debug("Waiting for the screen detector to load...")
+        self.load()  # Waits for a background load in progress
+        if self._load_error:
+            raise self._load_error
+        rect = self._detect(img)
+        return ScreenRegion(rect) if rect is not None else None
+
+
+def _order_corners(pts: np.ndarray) -> np.ndarray:
+    """Order four points as top-left, top-right, bottom-right, bottom-left."""
+    pts = pts.reshape(4, 2).astype(np.float32)
+    s, d = pts.sum(axis=1), np.diff(pts, axis=1).ravel()
+    return np.array(
+        [pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]]
+    )
+
+
+class ContourScreenDetector:
+    """Finds the screen as the largest plausible quadrilateral in the image.
+
+    Works on a downscaled grayscale copy: first on a threshold of the bright areas
+    (a lit screen in a darker room), then on an edge map (the bezel) if that fails.
+
+    Args:
+        work_width: Width of the downscaled copy.
+        min_area: Minimum screen area relative to the image.
+        aspect_range: Plausible width/height ratios of the screen.
+    """
+
+    def __init__(
+        self,
+        work_width: int = 640,
+        min_area: float = 0.05,
+        aspect_range: tuple[float, float] = (1.0, 2.6),
+    ):
+        self.work_width = work_width
+        self.min_area = min_area
+        self.aspect_range = aspect_range
+
+    def load_in_background(self) -> None:
+        pass  # Nothing to load
+
+    def _candidates(self, gray: np.ndarray):
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        _, bright = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+        yield cv2.morphologyEx(bright, cv2.MORPH_CLOSE, kernel)
+        edges = cv2.Canny(blurred, 50, 150)
+        yield cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+
+    def _find_quad(self, binary: np.ndarray) -> np.ndarray | None:
+        contours, _ = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = self.min_area * binary.shape[0] * binary.shape[1]
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+            if cv2.contourArea(contour) < min_area:
+                break
+            hull = cv2.convexHull(contour)
+            quad = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+            if len(quad) != 4:
+                continue
+            tl, tr, br, bl = _order_corners(quad)
+            width = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+            height = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+            if height and self.aspect_range[0] <= width / height <= self.aspect_range[1]:
+                return np.array([tl, tr, br, bl])
+        return None
+
+    def detect(self, img: np.ndarray) -> ScreenRegion | None:
+        start = time.perf_counter()
+        h, w = img.shape[:2]
+        scale = min(1.0, self.work_width / w)
+        size = (round(w * scale), round(h * scale))
+        small = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        for binary in self._candidates(gray):
+            quad = self._find_quad(binary)
+            if quad is not None:
+                break
+        else:
+            logger.debug("No screen quadrilateral found.")
+            return None
+        corners = quad / scale
+        x1, y1 = np.clip(corners.min(axis=0), 0, None).astype(int)
+        x2, y2 = np.ceil(corners.max(axis=0)).astype(int)
+        x2, y2 = min(w, x2), min(h, y2)
+        logger.debug(
+            f"Found screen quadrilateral in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return ScreenRegion(
+            (int(x1), int(y1), int(x2 - x1), int(y2 - y1)),
+            tuple((float(x), float(y)) for x, y in corners),
+        )
+
+
+class FallbackScreenDetector:
+    """Tries the detectors in order and returns the first region found."""
+
+    def __init__(self, *detectors: ScreenDetector):
+        self.detectors = detectors
+
+    def load_in_background(self) -> None:
+        for detector in self.detectors:
+            detector.load_in_background()
+
+    def detect(self, img: np.ndarray) -> ScreenRegion | None:
+        for detector in self.detectors:
+            region = detector.detect(img)
+            if region is not None:
+                return region
+        return None
+
+
+class CropTracker:
+    """Reuses the last crop rectangle as long as the scene geometry hasn't changed.
+
+    Validation compares the edges in a band around the screen's border (the bezel and
+    its surroundings, which stay put while the screen content changes) on small
+    grayscale thumbnails via normalized cross-correlation.
+
+    Args:
+        detector: The detector to run when validation fails.
+        threshold: Minimum correlation for the last rectangle to be reused.
+        thumbnail_width: Width of the thumbnails used for validation.
+        band: Width of the band around the border, relative to the rectangle size.
+    """
+
+    def __init__(
+        self,
+        detector: ScreenDetector,
+        threshold: float = 0.6,
+        thumbnail_width: int = 320,
+        band: float = 0.08,
+    ):
+        self.detector = detector
+        self.threshold = threshold
+        self.thumbnail_width = thumbnail_width
+        self.band = band
+        self._region: ScreenRegion | None = None
+        self._shape: tuple[int, ...] | None = None
+        self._reference: np.ndarray | None = None
+        self._mask: np.ndarray | None = None
+        # Captures can be cropped on several threads at once:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_in_background(self) -> None:
+        self.detector.load_in_background()
+
+    def _edges(self, img: np.ndarray) -> np.ndarray:
+        h, w = img.shape[:2]
+        size = (self.thumbnail_width, round(h * self.thumbnail_width / w))
+        if w > 4 * self.thumbnail_width:
+            # Cheap pre-shrink so the area-averaging resize has little to do:
+            pre = (4 * size[0], 4 * size[1])
+            img = cv2.resize(img, pre, interpolation=cv2.INTER_LINEAR)
+        thumb = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY) if thumb.ndim == 3 else thumb
+        gray = cv2.GaussianBlur(gray, (3, 3), 0).astype(np.float32)
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1)
+        return cv2.magnitude(gx, gy)
+
+    def _border_mask(self, rect: Rect, shape: tuple[int, ...]) -> np.ndarray:
+        scale = self.thumbnail_width / shape[1]
+        x, y, w, h = (round(v * scale) for v in rect)
+        height = round(shape[0] * scale)
+        pad = max(2, round(self.band * max(w, h)))
+        mask = np.zeros((height, self.thumbnail_width), bool)
+        mask[max(0, y - pad) : y + h + pad, max(0, x - pad) : x + w + pad] = True
+        mask[y + pad : y + h - pad, x + pad : x + w - pad] = False  # Screen content
+        return mask
+
+    def _correlation(self, edges: np.ndarray) -> float:
+        assert self._reference is not None and self._mask is not None
+        a = self._reference[self._mask]
+        b = edges[self._mask]
+        a, b = a - a.mean(), b - b.mean()
+        denominator = float(np.sqrt((a * a).sum() * (b * b).sum()))
+        return float((a * b).sum()) / denominator if denominator else 0.0
+
+    def detect(self, img: np.ndarray) -> ScreenRegion | None:
+        """Return the last region if it's still valid, otherwise detect again."""
+        with self._lock:
+            return self._detect(img)
+
+    def _detect(self, img: np.ndarray) -> ScreenRegion | None:
+        start = time.perf_counter()
+        edges = self._edges(img)
+        if self._region is not None and img.shape == self._shape:
+            correlation = self._correlation(edges)
+            if correlation >= self.threshold:
+                self.hits += 1
+                logger.debug(
+                    f"Crop tracker hit (correlation {correlation:.2f}, "
+                    f"{(time.perf_counter() - start) * 1000:.1f} ms)"
+                )
+                return self._region
+            logger.debug(f"Crop tracker miss (correlation {correlation:.2f})")
+        self.misses += 1
+        region = self.detector.detect(img)
+        if region is None:
+            self._region = None
+            return None
+        self._region, self._shape, self._reference = region, img.shape, edges
+        self._mask = self._border_mask(region.rect, img.shape)
+        return region
+
+    def reset(self) -> None:
+        """Forget the last region, e.g., after the camera was moved."""
+        with self._lock:
+            self._region = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import statistics
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark screen detection latency on a folder of captures"
+    )
+    parser.add_argument("folder", type=str, help="folder with sample captures")
+    parser.add_argument(
+        "--backends",
+        "-b",
+        nargs="+",
+        default=["pytorch", "onnx", "onnx-int8", "contour"],
+        help="backends to compare against the full-resolution PyTorch baseline",
+    )
+    args = parser.parse_args()
+
+    images = [
+        cv2.imread(os.path.join(args.folder, f))
+        for f in sorted(os.listdir(args.folder))
+        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    ]
+    if not images:
+        raise SystemExit(f"No images found in {args.folder}")
+
+    def bench(label: str, detect) -> None:
+        timings = []
+        for img in images:
+            start = time.perf_counter()
+            detect(img)
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{label:<28} median {statistics.median(timings) * 1000:7.1f} ms, "
+            f"max {max(timings) * 1000:7.1f} ms ({len(images)} images)"
+        )
+
+    # Baseline: how cropping used to work, full resolution through ultralytics:
+    from ultralytics import YOLO
+
+    start = time.perf_counter()
+    baseline_model = YOLO("yolov8n.pt")
+    baseline_model(images[0], verbose=False)
+    print(f"{'before: first call':<28} {(time.perf_counter() - start) * 1000:7.1f} ms")
+    bench("before: full-res pytorch", lambda img: baseline_model(img, verbose=False))
+
+    for backend in args.backends:
+        if backend == "contour":
+            bench("after: contour", ContourScreenDetector().detect)
+            continue
+        detector = YoloScreenDetector(backend=backend)
+        start = time.perf_counter()
+        detector.load()
+        label = f"after: {detector.backend} load+warm-up"
+        print(f"{label:<28} {(time.perf_counter() - start) * 1000:7.1f} ms")
+        bench(f"after: downscaled {detector.backend}", detector.detect)
@@ -3,9 +3,12 @@ import argparse
 import json
 from loguru import logger
 from slugify import slugify
-from witmo.llm import system_prompt
+from witmo.llm import openai_client, system_prompt
+from witmo.llm.engine import CompletionEngine
 from witmo.llm.history import History
 from witmo.llm.models import ModelManager
+from witmo.llm.response_cache import ResponseCache
+from witmo.speculation import PromptStats
 from witmo.spoilers import parse_spoiler_args, generate_spoiler_prompt
 from witmo.tui.io import tt
 from witmo.tui.audio import AudioMode
@@ -20,8 +23,12 @@ class Session:
     spoiler_prompt: str
     system_prompt: str
     history: History
+    response_cache: ResponseCache | None
+    completion_engine: CompletionEngine
     camera: CameraProtocol
     prompts: dict[str, dict]
+    prompt_stats: PromptStats
+    speculate: bool
     do_crop: bool
     audio_mode: AudioMode
     model_manager: ModelManager
@@ -53,11 +60,37 @@ class Session:
         logger.debug(f"System prompt:\n{obj.system_prompt}")
 
         # History:
-        logger.debug("Loading chat history...")
-        obj.history = History(obj.output_dir)
+        logger.debug("Setting up chat history...")
+        obj.history = History(obj.output_dir)  # Loaded when entered (see witmo.py)
+
+        # Response cache:
+        obj.response_cache = None
+        if not getattr(args, "no_cache", False):
+            logger.debug("Loading response cache...")
+            obj.response_cache = ResponseCache(obj.output_dir)
+
+        # Model manager:
+        logger.debug("Setting up model manager...")
+        obj.model_manager = ModelManager.from_file(
+            getattr(args, "models_file", "models.json")
+        )
+        obj.model_manager.set_fanout(
+            getattr(args, "fanout_mode", "off"), getattr(args, "fanout_keys", None)
+        )
+
+        # Completion engine, optionally answering from the mock server (offline):
+        if getattr(args, "mock_llm", False):
+            from witmo.llm.mock_server import MockOpenAIServer
+
+            logger.info("Using the mock LLM server.")
+            mock_server = MockOpenAIServer().start()  # Runs until Witmo exits
+            obj.completion_engine = CompletionEngine(base_url=mock_server.base_url)
+        else:
+            obj.completion_engine = CompletionEngine()
 
         # Camera:
         logger.debug("Initializing camera...")
+        burst_size = getattr(args, "burst_size", 1)
         if args.no_camera:
             logger.info("Running in no-camera mode.")
             from witmo.camera.no_camera import NoCamera
@@ -68,10 +101,46 @@ class Session:
             from witmo.camera.test_camera import TestCamera
 
             obj.camera = TestCamera(obj.output_dir)
+        elif getattr(args, "stream", None):
+            from witmo.camera.stream_camera import (
+                StreamCamera,
+                VideoFileSource,
+                AdbScreenrecordSource,
+            )
+
+            if args.stream == "device":
+                logger.info("Streaming frames from the device screen.")
+                from witmo.camera.adb_camera import AdbCamera
+
+                photo_camera = AdbCamera(
+                    args.delete_remote, obj.output_dir, serials=args.serials
+                )
+                obj.camera = StreamCamera(
+                    AdbScreenrecordSource(photo_camera.connection),
+                    obj.output_dir,
+                    photo_camera=photo_camera,
+                    buffer_size=max(8, burst_size),
+                    fetch_full_res=args.stream_photos,
+                    burst_size=burst_size,
+                )
+            else:
+                logger.info(f"Streaming frames from video file {args.stream}.")
+                obj.camera = StreamCamera(
+                    VideoFileSource(args.stream),
+                    obj.output_dir,
+                    buffer_size=max(8, burst_size),
+                    burst_size=burst_size,
+                )
         else:
             from witmo.camera.adb_camera import AdbCamera
 
-            obj.camera = AdbCamera(args.delete_remote, obj.output_dir)
+            obj.camera = AdbCamera(
+                args.delete_remote, obj.output_dir, serials=args.serials
+            )
+            if burst_size > 1:
+                from witmo.camera.burst import BurstCamera
+
+                obj.camera = BurstCamera(obj.camera, burst_size)
 
         # Prompts:
         logger.debug("Loading prompts...")
@@ -92,16 +161,39 @@ class Session:
         }
         if obj.prompts:
             tt(f"Loaded {len(obj.prompts)} prompts for game '{args.game_name}'.")
+        obj.prompt_stats = PromptStats(obj.output_dir)
+        obj.speculate = getattr(args, "speculate", False)
 
         # Whether to crop the images:
         obj.do_crop = getattr(args, "crop", False)
+        if obj.do_crop:
+            logger.debug("Loading screen detector in the background...")
+            from witmo.image import CroppedImage
+            from witmo.screen_detection import (
+                ContourScreenDetector,
+                CropTracker,
+                FallbackScreenDetector,
+                YoloScreenDetector,
+            )
+
+            CroppedImage.detector = YoloScreenDetector(
+                backend=getattr(args, "crop_backend", "auto")
+            )
+            if getattr(args, "crop_detector", "yolo") == "contour":
+                CroppedImage.detector = FallbackScreenDetector(
+                    ContourScreenDetector(), CroppedImage.detector
+                )
+            if getattr(args, "track_crop", False):
+                CroppedImage.detector = CropTracker(CroppedImage.detector)
+            CroppedImage.detector.load_in_background()
 
         # Audio mode:
         obj.audio_mode = AudioMode(getattr(args, "audio_mode", "off"))
 
-        # Set up model manager:
-        logger.debug("Setting up model manager...")
-        obj.model_manager = ModelManager()
-        obj.model_manager.set_current_model_by_key("3")
+        # Open the API connections in the background, so the first request (and the
+        # first spoken answer) doesn't wait for the handshakes:
+        obj.completion_engine.warm_up(obj.model_manager.current_model.provider)
+        if obj.audio_mode.should_voice():
+            openai_client.prewarm()
 
         return obj
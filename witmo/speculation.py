@@ -0,0 +1,214 @@
+"""
+Speculative work while the user picks a prompt.
+
+After a capture, the user looks at the preview and picks a prompt, which takes a few
+seconds. A Speculation uses that time:
+
+- it crops the capture to the screen and prepares the image in the background (resize,
+  encode, base64, perceptual hash), so the preview and the prompt menu appear right
+  away and building the request later only hits memoized artifacts
+- it warms up the connection to the API
+- optionally, it already submits the prompt most often picked for this game. If the user
+  picks that prompt, the running (or finished) request is used, otherwise it's cancelled.
+
+PromptStats keeps the pick counts per game plus the hit rate and the latency saved by
+speculative requests.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from loguru import logger
+from witmo.image import CachedImage, CroppedImage, Image, preview_image_array
+from witmo.llm.engine import CompletionEngine, RequestHandle
+from witmo.llm.models import Model
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="witmo-speculation")
+
+
+class PromptStats:
+    """Persistent prompt pick counts and speculation stats of one game."""
+
+    def __init__(self, file_location: str, file_name: str = "prompt_stats.json"):
+        self.file_path = os.path.join(file_location, file_name)
+        self.picks: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.picks = dict(data.get("picks", {}))
+            self.hits = data.get("hits", 0)
+            self.misses = data.get("misses", 0)
+            self.seconds_saved = data.get("seconds_saved", 0.0)
+        except (json.JSONDecodeError, AttributeError, TypeError) as e:
+            logger.warning(f"Prompt stats file was corrupted, starting fresh: {e}")
+
+    def save(self) -> None:
+        data = {
+            "picks": self.picks,
+            "hits": self.hits,
+            "misses": self.misses,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
+        try:
+            with open(self.file_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving prompt stats: {str(e)}")
+
+    def record_pick(self, key: str) -> None:
+        self.picks[key] = self.picks.get(key, 0) + 1
+        self.save()
+
+    def most_picked(self, keys) -> str | None:
+        """The most often picked of the given prompt keys, if any was picked yet."""
+        counts = {key: self.picks.get(key, 0) for key in keys}
+        if not counts or max(counts.values()) == 0:
+            return None
+        return max(counts, key=lambda key: counts[key])
+
+    def record_speculation(self, hit: bool, seconds_saved: float = 0.0) -> None:
+        if hit:
+            self.hits += 1
+            self.seconds_saved += seconds_saved
+        else:
+            self.misses += 1
+        total = self.hits + self.misses
+        logger.info(
+            f"Speculation {'hit' if hit else 'miss'}: hit rate {self.hits}/{total}, "
+            f"{self.seconds_saved:.1f}s saved in total"
+        )
+        self.save()
+
+
+def _prepare_image(image: Image, model: Model) -> None:
+    """Compute everything the request will need from the image (all memoized)."""
+    start = time.perf_counter()
+    if isinstance(image, CachedImage):
+        from witmo.llm.image_encoding import encode_for_model
+
+        encode_for_model(image, model.image_budget).to_data_url()
+        image.dhash()
+    else:
+        image.to_base64()
+    logger.debug(f"Prepared image in the background in {time.perf_counter() - start:.2f}s")
+
+
+class Speculation:
+    """Background work for one capture, started before the user picks a prompt.
+
+    Args:
+        engine: Engine to warm up and to submit the speculative request to.
+        image: The capture.
+        model: Model the request will go to.
+        prompt: Prompt to submit speculatively, or None to only prepare.
+        crop: Whether to crop the capture to the screen first (see `image`).
+        **request_kwargs: Further arguments for the request (history, system_prompt,
+            cache, ...), as for CompletionEngine.submit.
+    """
+
+    def __init__(
+        self,
+        engine: CompletionEngine,
+        image: Image,
+        model: Model,
+        prompt: str | None = None,
+        crop: bool = False,
+        **request_kwargs,
+    ):
+        self.engine = engine
+        self.source_image = image
+        self.crop = crop
+        self.model = model
+        self.prompt = prompt
+        self.request_kwargs = request_kwargs
+        self.handle: RequestHandle | None = None
+        self._image: Future = Future()
+        self.prepared: Future = _executor.submit(self._prepare_and_submit)
+        engine.warm_up(model.provider)
+
+    @property
+    def image(self) -> Image:
+        """The capture to send, cropped if requested. Waits for the crop."""
+        return self._image.result()
+
+    def preview(self, seconds: int = 5, preview_width: int = 400) -> None:
+        """Preview the (cropped) capture as soon as it's ready. Returns immediately."""
+        if not self.crop:
+            self.source_image.preview(seconds, preview_width)
+            return
+        preview_image_array(
+            lambda: self.image.resized(preview_width),
+            seconds=seconds,
+            preview_width=preview_width,
+            window_name=CroppedImage.preview_window_name,
+        )
+
+    def _crop(self) -> Image:
+        if not self.crop:
+            return self.source_image
+        start = time.perf_counter()
+        try:
+            image = CroppedImage(self.source_image)
+        except Exception as e:
+            logger.warning(f"Cropping failed, using the full capture: {e}")
+            return self.source_image
+        logger.debug(f"Cropped in the background in {time.perf_counter() - start:.2f}s")
+        return image
+
+    def _prepare_and_submit(self) -> None:
+        self._image.set_result(self._crop())
+        try:
+            _prepare_image(self.image, self.model)
+        except Exception as e:
+            logger.warning(f"Preparing the image in the background failed: {e}")
+        if self.prompt is not None:
+            self._submit()
+
+    def _submit(self) -> None:
+        logger.info(f"Speculatively submitting: {self.prompt}")
+        self.handle = self.engine.submit(
+            self.prompt,
+            image=self.image,
+            record=False,
+            **self.request_kwargs,
+            **self.model.request_kwargs(),
+        )
+
+    def take(self, prompt: str, stats: PromptStats | None = None) -> RequestHandle | None:
+        """Return the speculative request if it's for `prompt` and adopt it (record it in
+        the history when done); otherwise cancel it and return None.
+        """
+        if self.prompt is None:
+            return None
+        self.prepared.result()  # The handle is submitted right after preparing
+        handle = self.handle
+        if prompt != self.prompt or handle is None or handle.state in ("cancelled", "failed"):
+            self.discard()
+            if stats is not None:
+                stats.record_speculation(hit=False)
+            return None
+        now = time.perf_counter()
+        # Saved: how long the request already ran, or all of it if it's done:
+        saved = (handle.latency if handle.finished else None) or (now - handle.submitted)
+        self.engine.adopt(
+            handle, self.request_kwargs.get("history"), self.request_kwargs.get("cache")
+        )
+        if stats is not None:
+            stats.record_speculation(hit=True, seconds_saved=saved)
+        return handle
+
+    def discard(self) -> None:
+        """Cancel the speculative request, if any."""
+        if self.prompt is not None:
+            self.prepared.add_done_callback(
+                lambda _: self.handle.cancel() if self.handle is not None else None
+            )
@@ -0,0 +1,95 @@
+"""
+Startup-time benchmark for Witmo.
+
+Imports the modules Witmo needs before the welcome panel appears in a fresh interpreter
+with `-X importtime`, and reports the cumulative import time and the slowest modules. It
+fails (exit code 1) if the import time exceeds the budget or if one of the heavy, lazily
+loaded dependencies got imported at startup, so it can guard cold-start time in CI:
+
+    python -m witmo.startup_benchmark --budget-ms 400
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+# What `witmo.py` imports before showing the welcome panel:
+STARTUP_MODULES = [
+    "wakepy",
+    "witmo.argparsing",
+    "witmo.session",
+    "witmo.mainloop",
+    "witmo.image",
+    "witmo.tui.io",
+]
+
+# Must only be imported when their feature is first used:
+LAZY_MODULES = ["numpy", "cv2", "pygame", "textual", "rich.markdown", "openai"]
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure_imports() -> dict[str, tuple[int, int]]:
+    """Import the startup modules in a fresh interpreter and return
+    {module: (self µs, cumulative µs)} for every module that got imported.
+    """
+    code = "import " + ", ".join(STARTUP_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if m := _LINE.match(line):
+            times[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return times
+
+
+def total_ms(times: dict[str, tuple[int, int]]) -> float:
+    """Cumulative import time of the top-level imports in ms."""
+    return sum(times[name][1] for name in STARTUP_MODULES if name in times) / 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="fail if the median startup import time exceeds this",
+    )
+    parser.add_argument("--runs", "-n", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest modules")
+    args = parser.parse_args()
+
+    measure_imports()  # Warm-up: compile bytecode, fill the OS file cache
+    runs = [measure_imports() for _ in range(args.runs)]
+    totals = [total_ms(times) for times in runs]
+    median = statistics.median(totals)
+
+    slowest = sorted(runs[-1].items(), key=lambda kv: kv[1][0], reverse=True)
+    print(f"Slowest modules (self time, last run):")
+    for name, (self_us, _) in slowest[: args.top]:
+        print(f"  {self_us / 1000:7.1f} ms  {name}")
+    print(
+        f"Startup imports: median {median:.0f} ms over {args.runs} runs "
+        f"(min {min(totals):.0f}, max {max(totals):.0f})"
+    )
+
+    failed = False
+    eager = sorted({m for times in runs for m in LAZY_MODULES if m in times})
+    if eager:
+        print(f"FAIL: lazily loaded modules imported at startup: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"FAIL: startup imports exceed the budget of {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
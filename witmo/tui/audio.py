@@ -1,23 +1,30 @@
 import os
-import sys
 import threading
 import uuid
 import tempfile
 from loguru import logger
 
-os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
-import pygame
 
+def _mixer():
+    """Return pygame's mixer, importing pygame and initializing the mixer on first use
+    (pygame takes a while to import and isn't needed with audio off).
+    """
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    import pygame
 
-def play_soundfile(path: str):
-    """Play a sound file (mp3) in the background using pygame."""
     if not pygame.mixer.get_init():
         pygame.mixer.init()
+    return pygame.mixer
+
+
+def play_soundfile(path: str):
+    """Play a sound file (mp3) in the background using pygame."""
+    mixer = _mixer()
 
     def _play():
         try:
-            pygame.mixer.music.load(path)
-            pygame.mixer.music.play()
+            mixer.music.load(path)
+            mixer.music.play()
         except Exception as e:
             logger.error(f"Sound playback error: {e}")
 
@@ -44,7 +51,9 @@ def speak_text(text: str, voice: str = "alloy") -> None:
 
     def _tts_and_play(text: str, voice: str) -> None:
         try:
-            response = openai_client.audio.speech.create(
+            from witmo.llm.openai_client import get_client
+
+            response = get_client().audio.speech.create(
                 model="tts-1", voice=voice, input=text
             )
             dir_ = tempfile.gettempdir()
@@ -56,8 +65,6 @@ def speak_text(text: str, voice: str = "alloy") -> None:
         except Exception as e:
             logger.error(f"TTS error: {e}")
 
-    if "openai_client" not in sys.modules:
-        from llm.openai_client import openai_client
     threading.Thread(target=_tts_and_play, args=(text, voice), daemon=True).start()
 
 
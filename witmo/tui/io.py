@@ -4,16 +4,15 @@ import re
 import time
 import threading
 from contextlib import contextmanager
-from typing import Literal
+from typing import Callable, Iterable, Literal
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.align import Align
 from rich.table import Table
-from rich.markdown import Markdown
 from rich.text import Text
 from rich import box
 from .transientoutputter import TransientOutputter
-from .textinput import TextInputApp
 
 # Colors:
 BG = "#1e1e2e"
@@ -62,6 +61,8 @@ def tp(thing):
 
 
 def get_textinput(title: str) -> str:
+    from .textinput import TextInputApp  # Textual is slow to import, load on first use
+
     app = TextInputApp(label=title)
     return app.run() or ""
 
@@ -96,6 +97,8 @@ def request_panel(txt: str) -> Align:
 
 def count_rendered_lines(txt: str, width: int) -> int:
     """Count the number of lines of a virtually rendered Markdown text."""
+    from rich.markdown import Markdown
+
     md = Markdown(txt, style=TEXT)
     options = _console.options.update(width=width)
     lines = list(_console.render_lines(md, options, pad=False))
@@ -103,6 +106,8 @@ def count_rendered_lines(txt: str, width: int) -> int:
 
 
 def response_panel(txt: str) -> Align:
+    from rich.markdown import Markdown  # Pulls in markdown-it, load on first response
+
     # Convert '•' bullets to Markdown format:
     txt = re.sub(r"^(\s*)•", r"\1- ", txt, flags=re.MULTILINE)
 
@@ -140,6 +145,106 @@ def response_panel(txt: str) -> Align:
     )
 
 
+def stream_response(
+    chunks: Iterable[str],
+    refresh_interval: float = 0.1,
+    interrupted: Callable[[], bool] | None = None,
+    hint: str | None = None,
+) -> str | None:
+    """Render a streamed response progressively in a live response panel and return the
+    full text. Shows the dot animation until the first chunk arrives and leaves the final
+    panel as permanent output.
+
+    `chunks` may yield empty strings as heartbeats. `interrupted` is checked on every
+    chunk; if it returns True, the live panel is removed and None is returned. `hint` is
+    shown below the dot animation.
+    """
+    interrupted = interrupted or (lambda: False)
+    chunks = iter(chunks)
+    txt = ""
+    with background_animation(dot_animation, hint=hint):
+        for chunk in chunks:  # Wait for the first chunk
+            if interrupted():
+                return None
+            if chunk:
+                txt = chunk
+                break
+    _to.flush()
+    if not txt:
+        return txt  # Ended without any response (e.g., failed)
+
+    last_update = 0.0
+    with Live(
+        response_panel(txt), console=_console, transient=True, auto_refresh=False
+    ) as live:
+        for chunk in chunks:
+            if interrupted():
+                return None
+            txt += chunk
+            # Re-layouting is not free (see response_panel), so throttle updates:
+            if chunk and time.monotonic() - last_update >= refresh_interval:
+                live.update(response_panel(txt), refresh=True)
+                last_update = time.monotonic()
+    tp(response_panel(txt))
+    return txt
+
+
+def comparison_panel(answers: list[tuple[str, str]]) -> Align:
+    """Show several answers (title, text) side by side."""
+    from rich.markdown import Markdown
+
+    table = Table.grid(expand=True, padding=(0, 3))
+    for title, _ in answers:
+        table.add_column(ratio=1)
+    table.add_row(*[Text(title, style=f"bold {RESPONSE_ACCENT}") for title, _ in answers])
+    table.add_row(*[Markdown(txt, style=TEXT) for _, txt in answers])
+    return Align(
+        Panel(
+            table,
+            box=box.ROUNDED,
+            style=f"on {BG}",
+            border_style=RESPONSE_ACCENT,
+            title=f"[{RESPONSE_ACCENT}]💬 Responses[/]",
+            title_align="left",
+            padding=(1, 2),
+            expand=False,
+            width=PANEL_WIDE_WIDTH,
+        ),
+        align="left",
+    )
+
+
+def stream_comparison(
+    answers: Callable[[], list[tuple[str, str]]],
+    finished: Callable[[], bool],
+    refresh_interval: float = 0.2,
+    interrupted: Callable[[], bool] | None = None,
+    hint: str | None = None,
+) -> bool:
+    """Render several streamed answers side by side in a live panel until `finished`
+    returns True, then leave the final panel as permanent output. `answers` returns the
+    current (title, text) pairs. Returns False if `interrupted` stopped the display early.
+    """
+    interrupted = interrupted or (lambda: False)
+    with background_animation(dot_animation, hint=hint):
+        while not any(txt for _, txt in answers()) and not finished():
+            if interrupted():
+                return False
+            time.sleep(0.05)
+    _to.flush()
+
+    with Live(
+        comparison_panel(answers()), console=_console, transient=True, auto_refresh=False
+    ) as live:
+        while not finished():
+            if interrupted():
+                return False
+            time.sleep(refresh_interval)
+            live.update(comparison_panel(answers()), refresh=True)
+    tp(comparison_panel(answers()))
+    return True
+
+
 def menu_panel(title: str, items: list, prio: Literal["top", "med", "low"]) -> Align:
     color = PRIO2COLOR[prio]
     num_cols = len(items[0])
@@ -163,12 +268,14 @@ def menu_panel(title: str, items: list, prio: Literal["top", "med", "low"]) -> A
     )
 
 
-def dot_animation(stop_event, interval=0.4):
+def dot_animation(stop_event, interval=0.4, hint=None):
     seq = ["•", "••", "•••", "••••", "•••••"]
     i = 0
     while not stop_event.is_set():
         _to.clear()
         _to.add(Text(seq[i % len(seq)], style=MUTED, justify="left"))
+        if hint:
+            _to.add(Text(hint, style=MUTED, justify="left"))
         i += 1
         time.sleep(interval)
     _to.clear()
@@ -181,7 +288,7 @@ def background_animation(target, *args, **kwargs):
     """
     stop_event = threading.Event()
     thread = threading.Thread(
-        target=target, args=(stop_event, *args), daemon=True, **kwargs
+        target=target, args=(stop_event, *args), kwargs=kwargs, daemon=True
     )
     thread.start()
     try:
@@ -0,0 +1,51 @@
+"""Non-blocking keyboard polling, for reacting to keys while output is streaming."""
+
+import os
+import sys
+from contextlib import contextmanager
+from readchar import readkey
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import select
+    import termios
+    import tty
+
+
+@contextmanager
+def key_polling():
+    """Put the terminal into cbreak mode, so key_pressed() sees single keys without
+    waiting for enter. Restores the terminal settings afterwards.
+    """
+    if sys.platform == "win32" or not sys.stdin.isatty():
+        yield
+        return
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+
+def key_pressed(timeout: float = 0) -> bool:
+    """Return whether a key press is waiting to be read (with read_pressed_key)."""
+    if sys.platform == "win32":
+        return msvcrt.kbhit()
+    if not sys.stdin.isatty():
+        return False
+    readable, _, _ = select.select([sys.stdin], [], [], timeout)
+    return bool(readable)
+
+
+def read_pressed_key() -> str:
+    """Read the key that key_pressed() reported, like readchar's readkey. Unlike that, a
+    lone ESC is returned right away instead of waiting for an escape sequence to
+    complete.
+    """
+    if sys.platform == "win32" or not sys.stdin.isatty():
+        return readkey()
+    # In cbreak mode, a key press (incl. an escape sequence) arrives in one read:
+    return os.read(sys.stdin.fileno(), 32).decode("utf-8", errors="ignore")
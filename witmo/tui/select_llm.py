@@ -5,8 +5,8 @@ from witmo.tui.io import tt, menu_panel
 
 def show_menu(session):
     m = []
-    for key, model in session.model_manager._models.items():
-        appendix = " (CURRENT)" if key == session.model_manager._current_key else ""
+    for key, model in session.model_manager.models.items():
+        appendix = " (CURRENT)" if key == session.model_manager.current_key else ""
         m.append((key, f"{model.name}{appendix}"))
     tt(menu_panel("Select LLM", m, "low"))
 
@@ -22,4 +22,5 @@ def select_llm(session: Session) -> None:
         elif k == key.ESC:
             break
         else:
-            tt("Unknown key. Please select 3, 4, 5, or <escape>.", style="error")
+            keys = ", ".join(session.model_manager.models)
+            tt(f"Unknown key. Please select {keys}, or <escape>.", style="error")
@@ -30,8 +30,9 @@ def select_prompt(session: Session) -> str:
             prompt = get_textinput("Enter your prompt:")
             break
         elif k.lower() in session.prompts:
-            prompt = session.prompts[k]["prompt"]
-            tt(f"\nUsing prompt: {session.prompts[k]['summary']}\n\n")
+            prompt = session.prompts[k.lower()]["prompt"]
+            session.prompt_stats.record_pick(k.lower())
+            tt(f"\nUsing prompt: {session.prompts[k.lower()]['summary']}\n\n")
             break
         elif k == "?":
             show_full_menu(session)